@@ -45,11 +45,20 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "mods.authentication.CachedJWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "mods.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "mods.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
 }
 
 SIMPLE_JWT = {
@@ -57,9 +66,63 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": True,
+    "TOKEN_OBTAIN_SERIALIZER": "mods.serializers.ModTokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "mods.serializers.ModTokenRefreshSerializer",
 }
 
+# Revoked refresh tokens are mirrored in a per-process Bloom filter that picks up other processes' revocations
+# at most this many seconds late. Purge expired rows with manage.py purge_revoked_tokens.
+REVOCATION_BLOOM_CAPACITY = 100000
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+REVOCATION_SYNC_INTERVAL = 5
+
+# Background jobs run by manage.py run_worker. Failed jobs are retried with exponential backoff, starting at
+# JOB_RETRY_BACKOFF seconds, until JOB_MAX_ATTEMPTS is reached and they are kept as dead. Running jobs whose worker
+# hasn't finished them within JOB_LOCK_TIMEOUT seconds are assumed lost and queued again.
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 10
+JOB_RETRY_BACKOFF_MAX = 3600
+JOB_LOCK_TIMEOUT = 600
+JOB_POLL_INTERVAL = 1
+
+# Uploaded archives are validated by a job on a pool of this many processes, 0 validates in the worker itself.
+# Archives with more entries or more uncompressed data than this, or any entry compressed more than the ratio, are
+# rejected as likely decompression bombs.
+ARCHIVE_VALIDATION_PROCESSES = int(os.getenv("ARCHIVE_VALIDATION_PROCESSES", "2"))
+ARCHIVE_MAX_ENTRIES = 20000
+ARCHIVE_MAX_UNCOMPRESSED_SIZE = 4 * 1024 * 1024 * 1024
+ARCHIVE_MAX_COMPRESSION_RATIO = 200
+
+# Deltas between consecutive versions of a mod's file are built on the same pool, matching blocks of at least this
+# many bytes, more for larger files. Deltas larger than this fraction of the new file aren't worth applying and are
+# dropped for the full file, as are those past MOD_DELTA_MAX_SIZE bytes, which would take longer to build than
+# MOD_DELTA_LOCK_TIMEOUT seconds allows.
+MOD_DELTA_BLOCK_SIZE = 8 * 1024
+MOD_DELTA_MAX_RATIO = 0.8
+MOD_DELTA_MAX_SIZE = 256 * 1024 * 1024
+MOD_DELTA_LOCK_TIMEOUT = 3600
+
+# Approved mods are published to storage as static, precompressed JSON shards under CATALOG_SNAPSHOT_PREFIX, for a
+# CDN to serve browsing without reaching Django. Changes are batched for CATALOG_SNAPSHOT_DEBOUNCE seconds before the
+# shards they affect are rebuilt.
+CATALOG_SNAPSHOT_PREFIX = "catalog"
+CATALOG_SNAPSHOT_DEBOUNCE = 30
+CATALOG_SNAPSHOT_PAGE_SIZE = 500
+CATALOG_SNAPSHOT_TOP_SIZE = 100
+
+# Autocomplete answers from an in-process index, which applies logged mod changes at most this often (and right away
+# for changes made by its own process) and is rebuilt from scratch, picking up download counts and renames, this often.
+# Rebuilds after the first run on a background thread, so no lookup waits on one.
+AUTOCOMPLETE_SYNC_INTERVAL = 5
+AUTOCOMPLETE_REBUILD_INTERVAL = 600
+AUTOCOMPLETE_REBUILD_IN_BACKGROUND = True
+
+# Authenticated users are served from an in-process LRU for this many seconds before being reloaded
+JWT_USER_CACHE_TTL = 60
+JWT_USER_CACHE_SIZE = 1024
+
 MIDDLEWARE = [
+    "mods.middleware.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -67,6 +130,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "mods.middleware.ReplicaStickinessMiddleware",
+    "mods.middleware.RequestProfilerMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -96,9 +161,67 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Take the write lock when a transaction starts instead of failing to upgrade a read lock mid-transaction
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 5,
+        },
     }
 }
 
+# Applied to every new SQLite connection. WAL lets readers keep going while a write is in progress.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,  # 256 MiB
+    "cache_size": -65536,  # Negative values are in KiB, so 64 MiB
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY",
+}
+
+# Read replicas, e.g. DATABASE_REPLICAS=replica1,replica2. Locally each one is a SQLite file next to the primary,
+# and tests point them at the primary's test database.
+DATABASE_REPLICAS = [alias for alias in os.getenv("DATABASE_REPLICAS", "").split(",") if alias]
+for replica in DATABASE_REPLICAS:
+    DATABASES[replica] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / f"{replica}.sqlite3",
+        "OPTIONS": DATABASES["default"]["OPTIONS"],
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["mods.routers.PrimaryReplicaRouter"]
+
+# Cached details and pages, the versions that invalidate them and replica stickiness have to be seen by every worker
+# process, or the ones that didn't handle a write keep serving stale data. Any deployment with more than one process
+# sets CACHE_BACKEND and CACHE_LOCATION to a shared cache, e.g. django.core.cache.backends.redis.RedisCache and a
+# redis:// URL. The process-local default only suits development, and a warning is logged when DEBUG is off.
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+# Seconds a user's reads stay on the primary after they write, so authors see their own edits
+REPLICA_STICKINESS_SECONDS = 10
+
+# Per-request timings from RequestTimingMiddleware. Server-Timing headers expose query counts to clients, so they
+# are opt-in outside of DEBUG
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", str(DEBUG)).lower() == "true"
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+
+# Each worker process writes its metrics snapshot here so /metrics/ reports totals across workers. Leave unset to
+# report only the process serving the scrape. Clear the directory on deploy.
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = 5
+
+# cProfile output for sampled requests and for admin requests sent with an X-Profile header
+PROFILER_DIR = os.getenv("PROFILER_DIR", str(BASE_DIR / "profiles"))
+PROFILER_SAMPLE_RATE = float(os.getenv("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_MAX_PROFILES = 50
+PROFILER_HEADER = "HTTP_X_PROFILE"
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -19,7 +19,9 @@ from django.contrib import admin
 from django.contrib.auth import views as auth_views
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from mods.forms import QueuedPasswordResetForm
 from mods.views import (
+    AutocompleteAPIView,
     ModListAPIView,
     ModDetailAPIView,
     ModSearchByCategoryAPIView,
@@ -36,6 +38,16 @@ from mods.views import (
     ModSearchByGenderAPIView,
     UserRegistrationAPIView,
     ModApprovalAPIView,
+    ModCatalogExportAPIView,
+    ModChangeFeedAPIView,
+    ModUpdateCheckAPIView,
+    ModBulkDetailAPIView,
+    ModConflictAPIView,
+    ModpackDownloadAPIView,
+    ModFileDownloadAPIView,
+    MetricsAPIView,
+    ProfileListAPIView,
+    ProfileDownloadAPIView,
 )
 
 BASE_MODS_URL = "m"
@@ -44,10 +56,17 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path(BASE_MODS_URL, ModListAPIView.as_view(), name="list"),
     path(f"{BASE_MODS_URL}/create/", ModCreateAPIView.as_view(), name="create"),
+    path(f"{BASE_MODS_URL}/export/", ModCatalogExportAPIView.as_view(), name="export"),
+    path(f"{BASE_MODS_URL}/changes/", ModChangeFeedAPIView.as_view(), name="changes"),
+    path(f"{BASE_MODS_URL}/updates/", ModUpdateCheckAPIView.as_view(), name="check-updates"),
+    path(f"{BASE_MODS_URL}/bulk/", ModBulkDetailAPIView.as_view(), name="bulk-detail"),
+    path(f"{BASE_MODS_URL}/conflicts/", ModConflictAPIView.as_view(), name="conflicts"),
+    path(f"{BASE_MODS_URL}/modpack/", ModpackDownloadAPIView.as_view(), name="modpack"),
     path(f"{BASE_MODS_URL}/<uuid:uuid>/", ModDetailAPIView.as_view(), name="detail"),
     path(f"{BASE_MODS_URL}/<uuid:uuid>/update/", ModUpdateAPIView.as_view(), name="update"),
     path(f"{BASE_MODS_URL}/<uuid:uuid>/delete/", ModDeleteAPIView.as_view(), name="delete"),
     path(f"{BASE_MODS_URL}/<uuid:uuid>/approve/", ModApprovalAPIView.as_view(), name="approve"),
+    path(f"{BASE_MODS_URL}/<uuid:uuid>/download/", ModFileDownloadAPIView.as_view(), name="download"),
     path(
         f"{BASE_MODS_URL}/category/<int:category_id>/", ModSearchByCategoryAPIView.as_view(), name="search-by-category"
     ),
@@ -57,13 +76,21 @@ urlpatterns = [
     path(f"{BASE_MODS_URL}/user/<int:user_id>/", ModSearchByUserAPIView.as_view(), name="search-by-user"),
     path(f"{BASE_MODS_URL}/race/", ModSearchByRaceAPIView.as_view(), name="search-by-race"),
     path(f"{BASE_MODS_URL}/gender", ModSearchByGenderAPIView.as_view(), name="search-by-gender"),
+    path("autocomplete/", AutocompleteAPIView.as_view(), name="autocomplete"),
     path("tags/", TagListAPIView.as_view(), name="tag-list"),
     path("races/", RaceListAPIView.as_view(), name="race-list"),
     path("genders/", GenderListAPIView.as_view(), name="gender-list"),
     path("register/", UserRegistrationAPIView.as_view(), name="register"),
+    path("metrics/", MetricsAPIView.as_view(), name="metrics"),
+    path("profiles/", ProfileListAPIView.as_view(), name="profile-list"),
+    path("profiles/<str:name>/", ProfileDownloadAPIView.as_view(), name="profile-download"),
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
-    path("password_reset/", auth_views.PasswordResetView.as_view(), name="password_reset"),
+    path(
+        "password_reset/",
+        auth_views.PasswordResetView.as_view(form_class=QueuedPasswordResetForm),
+        name="password_reset",
+    ),
     path("password_reset/done/", auth_views.PasswordResetDoneView.as_view(), name="password_reset_done"),
     path("reset/<uidb64>/<token>/", auth_views.PasswordResetConfirmView.as_view(), name="password_reset_confirm"),
     path("reset/done/", auth_views.PasswordResetCompleteView.as_view(), name="password_reset_complete"),
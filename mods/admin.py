@@ -1,6 +1,10 @@
 from django.contrib import admin
+from django.db.models import F
 
-from .models import Category, Gender, Mod, ModCompatibility, ModImage, Race, Tag, User
+from .cache import invalidate_mod_details
+from .changes import record_mod_changes
+from .jobs import enqueue, retry_jobs
+from .models import Category, Gender, Job, Mod, ModArchive, ModCompatibility, ModImage, Race, Tag, User
 
 
 class ModCompatibilityInline(admin.TabularInline):
@@ -11,28 +15,45 @@ class ModCompatibilityInline(admin.TabularInline):
 @admin.register(Mod)
 class ModAdmin(admin.ModelAdmin):
     list_display = ("title", "user", "version", "upload_date", "approved")
-    list_filter = ("approved", "category", "tags")
+    list_filter = ("approved", "archive__status", "category", "tags")
     search_fields = ("title", "description", "user__username", "categories__name", "tags__name")
     actions = ["approve_mods", "reject_mods"]
     inlines = [ModCompatibilityInline]
 
     @admin.action(description="Approve selected mods")
     def approve_mods(self, request, queryset):
+        validated = queryset.filter(archive__status=ModArchive.STATUS_VALID, archive__file=F("file"))
+        skipped = queryset.count() - validated.count()
+        if skipped:
+            self.message_user(request, f"Skipped {skipped} mod(s) whose archive hasn't passed validation.", "warning")
+        queryset = Mod.objects.filter(pk__in=list(validated.values_list("pk", flat=True)))
         queryset.update(approved=True)
+        invalidate_mod_details(queryset.values_list("uuid", flat=True))
+        record_mod_changes(queryset.values_list("uuid", "approved"))
 
     @admin.action(description="Reject selected mods")
     def reject_mods(self, request, queryset):
-        # Delete associated files for the mod while keeping metadata just in case
-        for mod in queryset:
-            if mod.file:
-                mod.file.delete(save=False)
-
-            # Delete all images
-            for image in mod.modimage_set.all():
-                image.image.delete(save=False)
-                image.delete()
+        mod_ids = list(queryset.values_list("id", flat=True))
         # Mark as rejected to keep track
         queryset.update(approved=False)
+        invalidate_mod_details(Mod.objects.filter(id__in=mod_ids).values_list("uuid", flat=True))
+        record_mod_changes(Mod.objects.filter(id__in=mod_ids).values_list("uuid", "approved"))
+        # Files and images are deleted by a worker, metadata is kept just in case
+        enqueue("delete_mod_files", {"mod_ids": mod_ids})
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "priority", "attempts", "run_at")
+    list_filter = ("status", "name")
+    readonly_fields = ("last_error",)
+    # Payloads are whatever the enqueuing code handed over, which isn't for every staff member to read
+    exclude = ("payload",)
+    actions = ["retry_jobs"]
+
+    @admin.action(description="Retry selected jobs now")
+    def retry_jobs(self, request, queryset):
+        retry_jobs(list(queryset.exclude(status=Job.STATUS_RUNNING).values_list("id", flat=True)))
 
 
 class CategoryAdmin(admin.ModelAdmin):
@@ -59,6 +80,7 @@ admin.site.register(Category)
 admin.site.register(Tag)
 admin.site.register(Race)
 admin.site.register(Gender)
+admin.site.register(ModArchive)
 admin.site.register(ModImage)
 admin.site.register(ModCompatibility)
 admin.site.register(User)
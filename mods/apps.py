@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class ModsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "mods"
+
+    def ready(self):
+        from django.core.files.storage import storages
+
+        from . import signals, tasks  # noqa: F401
+        from .cache import warn_if_cache_is_not_shared
+        from .instrumentation import instrument_serializers, instrument_storage
+
+        instrument_storage(storages["default"])
+        instrument_serializers()
+        warn_if_cache_is_not_shared()
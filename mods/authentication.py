@@ -0,0 +1,98 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .metrics import record_cache_lookup
+
+ROLE_CLAIM = "role"
+TOKEN_VERSION_CLAIM = "ver"
+
+
+def add_user_claims(token, user):
+    token[ROLE_CLAIM] = user.role
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+    return token
+
+
+class UserCache:
+    """A small thread-safe LRU of authenticated users whose entries expire after JWT_USER_CACHE_TTL seconds."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._entries[user_id] = (user, time.monotonic() + settings.JWT_USER_CACHE_TTL)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > settings.JWT_USER_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def evict(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+def evict_cached_user(user):
+    user_cache.evict(str(getattr(user, api_settings.USER_ID_FIELD)))
+
+
+def _matches_claims(user, token):
+    # Tokens issued before the claims were added carry neither, and are checked against the user row alone
+    if TOKEN_VERSION_CLAIM in token and token[TOKEN_VERSION_CLAIM] != user.token_version:
+        return False
+    return ROLE_CLAIM not in token or token[ROLE_CLAIM] == user.role
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that serves users from an in-process LRU instead of querying the users table on every request.
+    A cached user is only used while it agrees with the token's role and version claims. Saving a user evicts it
+    from this process, and the TTL bounds how long other processes can keep serving a stale copy.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        user = user_cache.get(user_id)
+        if user is not None and _matches_claims(user, validated_token):
+            record_cache_lookup("jwt_user", 1, 0)
+        else:
+            record_cache_lookup("jwt_user", 0, 1)
+            user = super().get_user(validated_token)
+            if not _matches_claims(user, validated_token):
+                # The password or role changed after the token was issued
+                raise AuthenticationFailed("Token is no longer valid.", code="token_not_valid")
+            user_cache.set(user_id, user)
+
+        # Views get their own copy so nothing they set on it leaks into later requests
+        return copy.copy(user)
@@ -0,0 +1,295 @@
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Sum
+
+from .catalog import fetch_tag_ids
+from .changes import get_latest_cursor
+from .fast_serializers import RELATED_CHUNK_SIZE
+from .models import Mod, ModChange, Tag, User
+from .serializers import AUTOCOMPLETE_MAX_LIMIT
+
+# Results for prefixes this short are cached, scanning every title starting with "a" isn't sub-millisecond
+SHORT_PREFIX_LENGTH = 2
+# Longer prefixes rank at most this many matches, which only ever cuts off prefixes matching thousands of entries
+MAX_SCAN = 5000
+MAX_TOKEN_LENGTH = 64
+
+_WORD = re.compile(r"\w+")
+
+logger = logging.getLogger("mods.autocomplete")
+
+
+def normalize(text):
+    return " ".join(_WORD.findall(text.casefold()))
+
+
+def _tokens(text):
+    """Every suffix of the text that starts at a word, so "iron ar" finds "Heavy Iron Armor"."""
+    normalized = normalize(text)
+    starts = [match.start() for match in _WORD.finditer(normalized)]
+    return {normalized[start:][:MAX_TOKEN_LENGTH] for start in starts}
+
+
+class PrefixIndex:
+    """A sorted array of (token, entry id) pairs searched with bisect, returning entries ranked by score."""
+
+    def __init__(self, entries=()):
+        # entry id -> (score, result, tokens)
+        self._entries = {}
+        self._keys = []
+        self._short = {}
+        for entry_id, text, score, result in entries:
+            tokens = _tokens(text)
+            self._entries[entry_id] = (score, result, tokens)
+            self._keys.extend((token, entry_id) for token in tokens)
+        self._keys.sort()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, entry_id):
+        entry = self._entries.get(entry_id)
+        return None if entry is None else entry[1]
+
+    def set(self, entry_id, text, score, result):
+        self.remove(entry_id)
+        tokens = _tokens(text)
+        self._entries[entry_id] = (score, result, tokens)
+        for token in tokens:
+            insort(self._keys, (token, entry_id))
+        self._forget(tokens)
+
+    def remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for token in entry[2]:
+            del self._keys[bisect_left(self._keys, (token, entry_id))]
+        self._forget(entry[2])
+
+    def _forget(self, tokens):
+        for token in tokens:
+            for length in range(1, SHORT_PREFIX_LENGTH + 1):
+                self._short.pop(token[:length], None)
+
+    def search(self, prefix, limit):
+        if len(prefix) <= SHORT_PREFIX_LENGTH:
+            results = self._short.get(prefix)
+            if results is None:
+                results = self._short[prefix] = self._rank(prefix, AUTOCOMPLETE_MAX_LIMIT, len(self._keys))
+            return results[:limit]
+        return self._rank(prefix, limit, MAX_SCAN)
+
+    def _rank(self, prefix, limit, max_scan):
+        matches = set()
+        keys = self._keys
+        start = bisect_left(keys, (prefix,))
+        for index in range(start, min(len(keys), start + max_scan)):
+            token, entry_id = keys[index]
+            if not token.startswith(prefix):
+                break
+            matches.add(entry_id)
+        entries = self._entries
+        top = heapq.nlargest(limit, matches, key=lambda entry_id: (entries[entry_id][0], entry_id))
+        return [entries[entry_id][1] for entry_id in top]
+
+
+def _mod_entries(rows):
+    return [
+        (str(mod_uuid), title, downloads, {"uuid": mod_uuid, "title": title}) for mod_uuid, title, downloads in rows
+    ]
+
+
+def _tag_entries(tags):
+    return [(tag_id, name, count, {"id": tag_id, "name": name}) for tag_id, name, count in tags]
+
+
+def _user_entries(users):
+    return [
+        (user_id, username, downloads, {"id": user_id, "username": username}) for user_id, username, downloads in users
+    ]
+
+
+def _tag_rows(tags):
+    return tags.filter(mods__approved=True).annotate(count=Count("mods")).values_list("id", "name", "count")
+
+
+def _user_rows(users):
+    # Authors rank by how much their mods are downloaded, so one popular mod outranks many ignored ones
+    return (
+        users.filter(mod__approved=True)
+        .annotate(downloads=Sum("mod__downloads"))
+        .values_list("id", "username", "downloads")
+    )
+
+
+class Autocomplete:
+    """
+    Title, tag and username suggestions served from memory. The index follows the mod change log, applying only the
+    mods changed since it last looked. It looks at most every AUTOCOMPLETE_SYNC_INTERVAL seconds, or on the next
+    lookup after this process changed a mod. Download counts, renames and anything else outside the change log are
+    picked up by a full rebuild every AUTOCOMPLETE_REBUILD_INTERVAL seconds, which runs on a background thread while
+    lookups keep searching the current indexes. Queries always run outside the lock, which is only held to search and
+    to apply what they found.
+    """
+
+    # Index -> the field of its results holding the name it's searched by
+    _NAME_FIELDS = {"tags": "name", "users": "username"}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Held by whichever thread is querying for a rebuild or for changes, so only one is
+        self._refresh_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.mods, self.tags, self.users = PrefixIndex(), PrefixIndex(), PrefixIndex()
+            # mod uuid -> (user id, tag ids), to know whose popularity a change moves
+            self._mod_owners = {}
+            self._cursor = None
+            self._built_at = self._synced_at = float("-inf")
+            self._stale = False
+            # Moved by forced rebuilds, so one asked for while another is building isn't lost
+            self._generation = 0
+
+    def mark_stale(self, rebuild=False):
+        self._stale = True
+        if rebuild:
+            self._generation += 1
+            self._built_at = float("-inf")
+
+    def mark_renamed(self, kind, entry_id, name=None):
+        """
+        Forces a rebuild when a tag or author in the index was renamed, or deleted when `name` is None, since neither is
+        in the change log. Saves that keep the name, like the one on every login, leave the index alone.
+        """
+        result = getattr(self, kind).get(entry_id)
+        if result is not None and result[self._NAME_FIELDS[kind]] != name:
+            self.mark_stale(rebuild=True)
+
+    def search(self, query, limit=10):
+        prefix = normalize(query)
+        self._sync()
+        if not prefix:
+            return {"mods": [], "tags": [], "users": []}
+        with self._lock:
+            return {
+                "mods": self.mods.search(prefix, limit),
+                "tags": self.tags.search(prefix, limit),
+                "users": self.users.search(prefix, limit),
+            }
+
+    def _sync(self):
+        now = time.monotonic()
+        rebuild = now - self._built_at > settings.AUTOCOMPLETE_REBUILD_INTERVAL
+        if not rebuild and not self._stale and now - self._synced_at <= settings.AUTOCOMPLETE_SYNC_INTERVAL:
+            return
+        # Until the first build there's nothing to serve meanwhile, so lookups wait for it. After that a lookup
+        # finding another thread refreshing searches what is there.
+        if not self._refresh_lock.acquire(blocking=self._cursor is None):
+            return
+        if self._cursor is not None and rebuild and settings.AUTOCOMPLETE_REBUILD_IN_BACKGROUND:
+            threading.Thread(target=self._refresh, args=(now,), kwargs={"close_connections": True}, daemon=True).start()
+        else:
+            self._refresh(now)
+
+    def _refresh(self, now, close_connections=False):
+        """Rebuilds or applies changes, whichever is due, then lets go of the refresh lock the caller took."""
+        try:
+            if time.monotonic() - self._built_at > settings.AUTOCOMPLETE_REBUILD_INTERVAL:
+                self._rebuild(now)
+            # The lookup this one waited on may have just built it
+            elif self._cursor is not None:
+                self._apply_changes(now)
+        except Exception:
+            if not close_connections:
+                raise
+            logger.exception("Rebuilding the autocomplete index failed")
+        finally:
+            if close_connections:
+                # This thread's connections would otherwise stay open until the database drops them
+                connections.close_all()
+            self._refresh_lock.release()
+
+    def _rebuild(self, now):
+        generation = self._generation
+        self._stale = False
+        cursor = get_latest_cursor()
+        mods = Mod.objects.filter(approved=True)
+        rows = list(mods.values_list("id", "uuid", "title", "downloads", "user_id"))
+        tag_ids = fetch_tag_ids(mods.values("id"))
+        mod_owners = {str(mod_uuid): (user_id, tag_ids.get(mod_id, [])) for mod_id, mod_uuid, _, _, user_id in rows}
+        indexes = (
+            PrefixIndex(_mod_entries((mod_uuid, title, downloads) for _, mod_uuid, title, downloads, _ in rows)),
+            PrefixIndex(_tag_entries(_tag_rows(Tag.objects.all()))),
+            PrefixIndex(_user_entries(_user_rows(User.objects.all()))),
+        )
+        with self._lock:
+            self.mods, self.tags, self.users = indexes
+            self._mod_owners, self._cursor = mod_owners, cursor
+            self._synced_at = now
+            # A rebuild forced while this one ran may have missed what forced it, so it runs again
+            if self._generation == generation:
+                self._built_at = time.monotonic()
+
+    def _apply_changes(self, now):
+        # Cleared first, so a change marked while the queries run is looked for again
+        self._stale = False
+        changes = list(ModChange.objects.filter(id__gt=self._cursor).order_by("id").values_list("id", "mod_uuid"))
+        if not changes:
+            self._synced_at = now
+            return
+        changed = list({str(mod_uuid) for _, mod_uuid in changes})
+
+        # Only this thread changes the owners, so they can be read without the lock
+        user_ids, tag_ids = set(), set()
+        for mod_uuid in changed:
+            user_id, mod_tag_ids = self._mod_owners.get(mod_uuid, (None, []))
+            user_ids.add(user_id)
+            tag_ids.update(mod_tag_ids)
+
+        owners, mod_entries = {}, []
+        for start in range(0, len(changed), RELATED_CHUNK_SIZE):
+            end = start + RELATED_CHUNK_SIZE
+            rows = list(
+                Mod.objects.filter(uuid__in=changed[start:end], approved=True).values_list(
+                    "id", "uuid", "title", "downloads", "user_id"
+                )
+            )
+            current_tags = fetch_tag_ids([mod_id for mod_id, *_ in rows])
+            for mod_id, mod_uuid, title, downloads, user_id in rows:
+                owners[str(mod_uuid)] = (user_id, current_tags.get(mod_id, []))
+                user_ids.add(user_id)
+                tag_ids.update(current_tags.get(mod_id, []))
+            mod_entries.extend(_mod_entries((mod_uuid, title, downloads) for _, mod_uuid, title, downloads, _ in rows))
+
+        # Tags and authors left without approved mods drop out
+        user_ids.discard(None)
+        tag_entries = _tag_entries(_tag_rows(Tag.objects.filter(id__in=tag_ids)))
+        user_entries = _user_entries(_user_rows(User.objects.filter(id__in=user_ids)))
+
+        with self._lock:
+            for mod_uuid in changed:
+                self._mod_owners.pop(mod_uuid, None)
+                self.mods.remove(mod_uuid)
+            self._mod_owners.update(owners)
+            for entry in mod_entries:
+                self.mods.set(*entry)
+            for index, entries, ids in ((self.tags, tag_entries, tag_ids), (self.users, user_entries, user_ids)):
+                for entry_id in ids:
+                    index.remove(entry_id)
+                for entry in entries:
+                    index.set(*entry)
+            self._cursor = changes[-1][0]
+            self._synced_at = now
+
+
+autocomplete = Autocomplete()
@@ -0,0 +1,95 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from .metrics import record_cache_lookup
+
+logger = logging.getLogger("mods.cache")
+
+MOD_DETAIL_CACHE_TIMEOUT = 300
+CATALOG_VERSION_KEY = "mods:catalog_version"
+ACTIVITY_VERSION_KEY = "mods:activity_version"
+# Comments, downloads and ratings move the activity version at most this often
+ACTIVITY_VERSION_INTERVAL = 60
+_ACTIVITY_THROTTLE_KEY = "mods:activity_version:throttle"
+
+
+def mod_detail_cache_key(mod_uuid):
+    return f"mods:detail:{mod_uuid}"
+
+
+def get_cached_mod_details(uuids):
+    """Returns a mapping of uuid to cached serialized mod data for the uuids that are cached."""
+    keys = {mod_detail_cache_key(mod_uuid): mod_uuid for mod_uuid in uuids}
+    found = {keys[key]: data for key, data in cache.get_many(keys).items()}
+    record_cache_lookup("mod_detail", len(found), len(keys) - len(found))
+    return found
+
+
+def cache_mod_details(details):
+    cache.set_many(
+        {mod_detail_cache_key(mod_uuid): data for mod_uuid, data in details.items()}, MOD_DETAIL_CACHE_TIMEOUT
+    )
+
+
+def invalidate_mod_details(uuids, activity=False):
+    """
+    Drops the cached details of the mods. List pages embed the same details, so every cached page is stale too, unless
+    only their `activity` changed: a download shouldn't empty the page cache, so activity moves a coarser version.
+    """
+    keys = [mod_detail_cache_key(mod_uuid) for mod_uuid in uuids]
+    if keys:
+        cache.delete_many(keys)
+        if activity:
+            bump_activity_version()
+        else:
+            bump_catalog_version()
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Starting from the clock keeps a restarted counter from reusing versions that still have cached pages
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        _get_version(key)
+
+
+def get_catalog_version():
+    return _get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    _bump_version(CATALOG_VERSION_KEY)
+
+
+def get_activity_version():
+    return _get_version(ACTIVITY_VERSION_KEY)
+
+
+def bump_activity_version():
+    # Activity in the rest of the interval shows up once cached pages expire
+    if cache.add(_ACTIVITY_THROTTLE_KEY, True, ACTIVITY_VERSION_INTERVAL):
+        _bump_version(ACTIVITY_VERSION_KEY)
+
+
+def warn_if_cache_is_not_shared():
+    """
+    Invalidation only reaches other worker processes through a shared cache. With a process-local one, processes that
+    didn't handle a write keep serving what they cached until it expires.
+    """
+    if not settings.DEBUG and isinstance(caches["default"], LocMemCache):
+        logger.warning(
+            "The default cache is process-local, so cached mods and pages go stale in every other worker process. "
+            "Set CACHE_BACKEND and CACHE_LOCATION to a shared cache."
+        )
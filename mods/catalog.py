@@ -0,0 +1,102 @@
+import zlib
+from collections import defaultdict
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Mod, ModCompatibility
+
+EXPORT_CHUNK_SIZE = 2000
+
+_EXPORT_FIELDS = (
+    "id",
+    "uuid",
+    "title",
+    "short_desc",
+    "description",
+    "version",
+    "upload_date",
+    "updated_date",
+    "file",
+    "file_size",
+    "downloads",
+    "user",
+    "category",
+    "thumbnail",
+)
+
+
+def fetch_tag_ids(mod_ids):
+    """Returns a mapping of mod id to its tag ids using a single query."""
+    tag_ids = defaultdict(list)
+    rows = (
+        Mod.tags.through.objects.filter(mod_id__in=mod_ids).order_by("mod_id", "tag_id").values_list("mod_id", "tag_id")
+    )
+    for mod_id, tag_id in rows:
+        tag_ids[mod_id].append(tag_id)
+    return tag_ids
+
+
+def fetch_compatibility(mod_ids):
+    """Returns a mapping of mod id to its race/gender compatibility using a single query."""
+    compatibility = defaultdict(list)
+    rows = (
+        ModCompatibility.objects.filter(mod_id__in=mod_ids)
+        .order_by("mod_id", "id")
+        .values_list("mod_id", "race_id", "gender_id")
+    )
+    for mod_id, race_id, gender_id in rows:
+        compatibility[mod_id].append({"race": race_id, "gender": gender_id})
+    return compatibility
+
+
+def _attach_related(rows):
+    mod_ids = [row["id"] for row in rows]
+    tag_ids = fetch_tag_ids(mod_ids)
+    compatibility = fetch_compatibility(mod_ids)
+
+    for row in rows:
+        mod_id = row.pop("id")
+        row["file"] = default_storage.url(row["file"]) if row["file"] else None
+        row["tags"] = tag_ids.get(mod_id, [])
+        row["compatibility"] = compatibility.get(mod_id, [])
+    return rows
+
+
+def iter_catalog_records(chunk_size=EXPORT_CHUNK_SIZE):
+    """Yields one plain dict per approved mod, keeping at most one chunk of rows in memory."""
+    rows = Mod.objects.filter(approved=True).order_by("id").values(*_EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from _attach_related(chunk)
+
+
+def get_catalog_records(uuids):
+    """Returns a mapping of uuid to catalog record for the approved mods among `uuids`."""
+    rows = list(Mod.objects.filter(uuid__in=uuids, approved=True).values(*_EXPORT_FIELDS))
+    return {row["uuid"]: row for row in _attach_related(rows)}
+
+
+def iter_gzip_ndjson(records):
+    """Encodes records as newline-delimited JSON and yields gzip-compressed chunks."""
+    encoder = JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for record in records:
+        data = compressor.compress((encoder.encode(record) + "\n").encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_catalog_export(chunk_size=EXPORT_CHUNK_SIZE):
+    return iter_gzip_ndjson(iter_catalog_records(chunk_size=chunk_size))
+
+
+def write_catalog_export(path, chunk_size=EXPORT_CHUNK_SIZE):
+    """Writes the gzip-compressed NDJSON catalog export to `path`."""
+    with open(path, "wb") as export_file:
+        for data in iter_catalog_export(chunk_size=chunk_size):
+            export_file.write(data)
@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+
+from .catalog import get_catalog_records
+from .jobs import enqueue
+from .models import ModChange
+
+CHANGE_FEED_DEFAULT_LIMIT = 500
+CHANGE_FEED_MAX_LIMIT = 1000
+
+
+def _action_for(approved):
+    # Unapproved mods are hidden from clients, so they sync as tombstones
+    return ModChange.ACTION_UPSERT if approved else ModChange.ACTION_DELETE
+
+
+def schedule_catalog_snapshot():
+    # Changes made while a publish is queued are picked up by it, so a burst of changes is published once
+    enqueue(
+        "publish_catalog_snapshot",
+        delay=timedelta(seconds=settings.CATALOG_SNAPSHOT_DEBOUNCE),
+        dedupe_key="publish_catalog_snapshot",
+    )
+
+
+def record_mod_change(mod_uuid, approved):
+    ModChange.objects.create(mod_uuid=mod_uuid, action=_action_for(approved))
+    schedule_catalog_snapshot()
+
+
+def record_mod_changes(rows):
+    """Records a change for each (uuid, approved) pair with a single insert."""
+    changes = ModChange.objects.bulk_create(
+        [ModChange(mod_uuid=mod_uuid, action=_action_for(approved)) for mod_uuid, approved in rows]
+    )
+    if changes:
+        schedule_catalog_snapshot()
+
+
+def record_mod_deleted(mod_uuid):
+    ModChange.objects.create(mod_uuid=mod_uuid, action=ModChange.ACTION_DELETE)
+    schedule_catalog_snapshot()
+
+
+def get_latest_cursor():
+    return ModChange.objects.aggregate(cursor=Max("id"))["cursor"] or 0
+
+
+def get_changes_since(cursor, limit=CHANGE_FEED_DEFAULT_LIMIT):
+    """Returns up to `limit` changes after `cursor`, collapsed to the latest change per mod."""
+    changes = list(
+        ModChange.objects.filter(id__gt=cursor).order_by("id").values_list("id", "mod_uuid", "action")[: limit + 1]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    latest = {}
+    for change_id, mod_uuid, action in changes:
+        latest.pop(mod_uuid, None)
+        latest[mod_uuid] = (change_id, action)
+
+    records = get_catalog_records(
+        [mod_uuid for mod_uuid, (_, action) in latest.items() if action == ModChange.ACTION_UPSERT]
+    )
+
+    results = []
+    for mod_uuid, (change_id, action) in latest.items():
+        record = records.get(mod_uuid)
+        if record is None:
+            # The mod was unapproved or deleted after this change was logged
+            action = ModChange.ACTION_DELETE
+        results.append({"cursor": change_id, "uuid": mod_uuid, "action": action, "mod": record})
+
+    return {
+        "changes": results,
+        "cursor": changes[-1][0] if changes else cursor,
+        "has_more": has_more,
+    }
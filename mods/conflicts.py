@@ -0,0 +1,58 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import GamePath, ModGamePath, ModManifest
+
+# Keeps each `IN (...)` lookup well under SQLite's bound parameter limit
+LOOKUP_CHUNK_SIZE = 900
+
+
+def store_game_paths(mod, paths, error=""):
+    """Replaces the mod's indexed game paths and records which of its files they were read from."""
+    with transaction.atomic():
+        GamePath.objects.bulk_create([GamePath(path=path) for path in paths], ignore_conflicts=True, batch_size=500)
+        path_ids = []
+        for start in range(0, len(paths), LOOKUP_CHUNK_SIZE):
+            end = start + LOOKUP_CHUNK_SIZE
+            path_ids.extend(GamePath.objects.filter(path__in=paths[start:end]).values_list("id", flat=True))
+
+        ModGamePath.objects.filter(mod=mod).delete()
+        ModGamePath.objects.bulk_create(
+            [ModGamePath(mod=mod, game_path_id=path_id) for path_id in path_ids], batch_size=500
+        )
+        ModManifest.objects.update_or_create(
+            mod=mod, defaults={"file": mod.file.name, "path_count": len(path_ids), "error": error}
+        )
+
+
+def find_conflicts(mod_ids):
+    """
+    Returns the mods that replace the same game paths as a list of (mod ids, paths), one entry per group of mods
+    sharing paths. Only the paths some other mod in the set also replaces are read, through the path -> mods index,
+    so nothing is compared pairwise.
+    """
+    shared = (
+        ModGamePath.objects.filter(mod_id__in=mod_ids)
+        .values("game_path_id")
+        .annotate(mod_count=Count("mod_id"))
+        .filter(mod_count__gt=1)
+        .values("game_path_id")
+    )
+    rows = (
+        ModGamePath.objects.filter(mod_id__in=mod_ids, game_path_id__in=shared)
+        .order_by("game_path_id", "mod_id")
+        .values_list("game_path__path", "mod_id")
+    )
+
+    mods_by_path = defaultdict(list)
+    for path, mod_id in rows:
+        mods_by_path[path].append(mod_id)
+
+    paths_by_mods = defaultdict(list)
+    for path, path_mod_ids in mods_by_path.items():
+        paths_by_mods[tuple(path_mod_ids)].append(path)
+    return sorted(
+        ((list(group), sorted(paths)) for group, paths in paths_by_mods.items()), key=lambda group: -len(group[1])
+    )
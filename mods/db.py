@@ -0,0 +1,44 @@
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+
+def apply_sqlite_pragmas(connection):
+    """Applies the SQLITE_PRAGMAS profile to a freshly opened SQLite connection."""
+    for pragma, value in settings.SQLITE_PRAGMAS.items():
+        # Run on the raw connection so the setup stays out of query logging and instrumentation
+        connection.connection.execute(f"PRAGMA {pragma} = {value}")
+
+
+def _is_database_locked(exc):
+    return "database is locked" in str(exc) or "database table is locked" in str(exc)
+
+
+def retry_on_database_locked(func=None, *, attempts=5, base_delay=0.05):
+    """
+    Retries a write when SQLite reports the database as locked.
+
+    Each attempt runs in its own transaction so a retry never repeats half of a previous attempt. Calls made inside
+    an outer transaction are not retried, since only the outermost transaction can safely start over.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                nested = transaction.get_connection().in_atomic_block
+                try:
+                    with transaction.atomic():
+                        return func(*args, **kwargs)
+                except OperationalError as exc:
+                    if nested or attempt == attempts - 1 or not _is_database_locked(exc):
+                        raise
+                # Exponential backoff with jitter so competing writers spread out
+                time.sleep(base_delay * (2**attempt) * random.uniform(0.5, 1.5))
+
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
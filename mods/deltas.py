@@ -0,0 +1,221 @@
+"""
+Binary deltas between two versions of a mod's file, built the way rsync matches blocks. The old file is split into
+fixed size blocks, each indexed by a cheap rolling checksum and a strong hash. The new file is scanned one byte at a
+time with the rolling checksum, so blocks are found at any offset, not only where they were before.
+
+A delta is a header followed by operations:
+
+    header:  b"XIVDELTA1", block size (u32), new file size (u64), old file sha256 (32 bytes), new file sha256 (32 bytes)
+    copy:    0x01, offset in the old file (u64), length (u32)
+    literal: 0x02, length (u32), that many bytes of the new file
+
+All integers are little-endian. Applying the operations in order rebuilds the new file, whose sha256 the header holds.
+"""
+
+import hashlib
+import math
+import struct
+import tempfile
+from itertools import accumulate
+
+DELTA_MAGIC = b"XIVDELTA1"
+READ_SIZE = 1024 * 1024
+MAX_BLOCK_SIZE = 128 * 1024
+
+_HEADER = struct.Struct(f"<{len(DELTA_MAGIC)}sLQ32s32s")
+_COPY = struct.Struct("<BQL")
+_LITERAL = struct.Struct("<BL")
+_COPY_ARGUMENTS = struct.Struct("<QL")
+_LITERAL_ARGUMENTS = struct.Struct("<L")
+OP_COPY = 1
+OP_LITERAL = 2
+
+
+class DeltaError(ValueError):
+    pass
+
+
+class _DeltaTooLarge(Exception):
+    pass
+
+
+def _weak(a, b):
+    return (b << 32) | a
+
+
+def _strong(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def block_size_for(size, minimum):
+    """
+    Picks the block size for a file of `size` bytes, growing with its square root like rsync's. Larger blocks mean fewer
+    to hash and look up on both sides, and matched blocks are skipped over whole.
+    """
+    return max(minimum, min(math.isqrt(size) // 1024 * 1024, MAX_BLOCK_SIZE))
+
+
+def _signature(file, block_size):
+    """Maps the weak checksum of each full block of the old file to its strong hashes and offsets."""
+    blocks = {}
+    offset = 0
+    while len(block := file.read(block_size)) == block_size:
+        weak = _weak(sum(block), sum(accumulate(block)))
+        blocks.setdefault(weak, {}).setdefault(_strong(block), offset)
+        offset += block_size
+    return blocks
+
+
+class _DeltaWriter:
+    def __init__(self, file, max_size):
+        self.file = file
+        self.max_size = max_size
+        self.size = 0
+        self._copy = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise _DeltaTooLarge
+        self.file.write(data)
+
+    def copy(self, offset, length):
+        # Runs of blocks that follow each other in the old file are one operation
+        if self._copy is not None and self._copy[0] + self._copy[1] == offset:
+            self._copy[1] += length
+            return
+        self._flush_copy()
+        self._copy = [offset, length]
+
+    def literal(self, data):
+        if data:
+            self._flush_copy()
+            self.write(_LITERAL.pack(OP_LITERAL, len(data)))
+            self.write(data)
+
+    def _flush_copy(self):
+        if self._copy is not None:
+            self.write(_COPY.pack(OP_COPY, *self._copy))
+            self._copy = None
+
+    def close(self):
+        self._flush_copy()
+
+
+def write_delta(source, target, output, block_size, max_size, source_sha256, target_sha256, target_size):
+    """
+    Writes the delta that turns the source file into the target file. Returns its size, or None as soon as it grows
+    past max_size.
+    """
+    signature = _signature(source, block_size)
+    writer = _DeltaWriter(output, max_size)
+    try:
+        writer.write(
+            _HEADER.pack(
+                DELTA_MAGIC, block_size, target_size, bytes.fromhex(source_sha256), bytes.fromhex(target_sha256)
+            )
+        )
+        data = target.read(READ_SIZE)
+        eof = not data
+        # data[literal_start:position] hasn't matched anything, data[position:position + block_size] is the window
+        position = literal_start = 0
+        a = b = None
+        while True:
+            if len(data) - position <= block_size and not eof:
+                writer.literal(data[literal_start:position])
+                more = target.read(READ_SIZE)
+                eof = not more
+                data = data[position:] + more
+                position = literal_start = 0
+            if len(data) - position < block_size:
+                break
+
+            end = position + block_size
+            if a is None:
+                window = data[position:end]
+                a, b = sum(window), sum(accumulate(window))
+            candidates = signature.get(_weak(a, b))
+            if candidates is not None:
+                offset = candidates.get(_strong(data[position:end]))
+                if offset is not None:
+                    writer.literal(data[literal_start:position])
+                    writer.copy(offset, block_size)
+                    position += block_size
+                    literal_start = position
+                    a = None
+                    continue
+
+            if end < len(data):
+                removed, added = data[position], data[end]
+                a += added - removed
+                b += a - block_size * removed
+            else:
+                a = None
+            position += 1
+
+        writer.literal(data[literal_start:])
+        writer.close()
+    except _DeltaTooLarge:
+        return None
+    return writer.size
+
+
+def apply_delta(source, delta, output):
+    """Rebuilds the target file from the source file and a delta, checking the result against the delta's hash."""
+    magic, _, target_size, _, target_sha256 = _HEADER.unpack(_read_exact(delta, _HEADER.size))
+    if magic != DELTA_MAGIC:
+        raise DeltaError("Not a delta")
+    sha256 = hashlib.sha256()
+    written = 0
+
+    def write(data):
+        nonlocal written
+        sha256.update(data)
+        output.write(data)
+        written += len(data)
+
+    while op := delta.read(1):
+        if op[0] == OP_COPY:
+            offset, length = _COPY_ARGUMENTS.unpack(_read_exact(delta, _COPY_ARGUMENTS.size))
+            source.seek(offset)
+            while length:
+                data = _read_exact(source, min(length, READ_SIZE))
+                write(data)
+                length -= len(data)
+        elif op[0] == OP_LITERAL:
+            (length,) = _LITERAL_ARGUMENTS.unpack(_read_exact(delta, _LITERAL_ARGUMENTS.size))
+            while length:
+                data = _read_exact(delta, min(length, READ_SIZE))
+                write(data)
+                length -= len(data)
+        else:
+            raise DeltaError(f"Unknown operation {op[0]}")
+
+    if written != target_size or sha256.digest() != target_sha256:
+        raise DeltaError("Delta doesn't rebuild the expected file")
+
+
+def _read_exact(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise DeltaError("Delta or source file ends early")
+    return data
+
+
+def build_delta(source_name, target_name, output_name, block_size, max_size, source_sha256, target_sha256, target_size):
+    """
+    Builds the delta between two stored files and saves it to storage. Runs in a pool process, so it only takes and
+    returns plain values.
+    """
+    from django.core.files import File
+
+    from .models import Mod
+
+    storage = Mod._meta.get_field("file").storage
+    with tempfile.TemporaryFile() as output:
+        with storage.open(source_name, "rb") as source, storage.open(target_name, "rb") as target:
+            size = write_delta(source, target, output, block_size, max_size, source_sha256, target_sha256, target_size)
+        if size is None:
+            return {"file": "", "size": 0, "error": f"Delta would be larger than {max_size} bytes"}
+        output.seek(0)
+        return {"file": storage.save(output_name, File(output)), "size": size, "error": ""}
@@ -0,0 +1,47 @@
+from django.contrib.auth.forms import PasswordResetForm
+from django.contrib.sites.shortcuts import get_current_site
+
+from .jobs import enqueue
+
+
+class QueuedPasswordResetForm(PasswordResetForm):
+    """
+    Leaves making the reset token and sending the email to a background job. The job only gets the user's pk and what
+    the link is built from, so no reset link is stored in the job queue.
+    """
+
+    def save(
+        self,
+        domain_override=None,
+        subject_template_name="registration/password_reset_subject.txt",
+        email_template_name="registration/password_reset_email.html",
+        use_https=False,
+        token_generator=None,
+        from_email=None,
+        request=None,
+        html_email_template_name=None,
+        extra_email_context=None,
+    ):
+        # The job always uses the default token generator, a custom one can't be carried in a payload
+        if domain_override:
+            site_name = domain = domain_override
+        else:
+            current_site = get_current_site(request)
+            site_name, domain = current_site.name, current_site.domain
+
+        for user in self.get_users(self.cleaned_data["email"]):
+            enqueue(
+                "send_password_reset_email",
+                {
+                    "user_id": user.pk,
+                    "domain": domain,
+                    "site_name": site_name,
+                    "use_https": use_https,
+                    "subject_template_name": subject_template_name,
+                    "email_template_name": email_template_name,
+                    "html_email_template_name": html_email_template_name,
+                    "from_email": from_email,
+                    "extra_email_context": extra_email_context,
+                },
+                priority=10,
+            )
@@ -0,0 +1,124 @@
+import heapq
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from rest_framework import serializers
+
+from .metrics import record_query
+
+_request_timings = ContextVar("request_timings", default=None)
+
+TOP_QUERIES = 5
+STORAGE_METHODS = ("_open", "_save", "delete", "exists", "size", "url")
+
+
+class RequestTimings:
+    """Accumulates what a single request spends in the database, serializers, rendering and storage."""
+
+    __slots__ = ("started", "queries", "sql", "serializer", "render", "storage", "top_queries")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.serializer = 0.0
+        self.render = 0.0
+        self.storage = 0.0
+        # Min-heap of (duration, sql), so the cheapest of the slowest queries is the one replaced
+        self.top_queries = []
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.sql += duration
+        if len(self.top_queries) < TOP_QUERIES:
+            heapq.heappush(self.top_queries, (duration, sql))
+        elif duration > self.top_queries[0][0]:
+            heapq.heapreplace(self.top_queries, (duration, sql))
+
+    def slowest_queries(self):
+        return sorted(self.top_queries, reverse=True)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+
+def start_request_timings():
+    return _request_timings.set(RequestTimings())
+
+
+def stop_request_timings(token):
+    timings = _request_timings.get()
+    _request_timings.reset(token)
+    return timings
+
+
+def current_timings():
+    return _request_timings.get()
+
+
+@contextmanager
+def span(name):
+    """Adds the time spent in the block to the current request's `name` timing, if a request is being timed."""
+    timings = _request_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(timings, name, getattr(timings, name) + time.perf_counter() - started)
+
+
+def time_queries(execute, sql, params, many, context):
+    """Database execute wrapper feeding query counts and durations into the current request's timings."""
+    timings = _request_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        timings.add_query(sql, duration)
+        record_query(sql, duration)
+
+
+def _timed_storage_call(method):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        with span("storage"):
+            return method(*args, **kwargs)
+
+    wrapper._instrumented = True
+    return wrapper
+
+
+def instrument_storage(storage):
+    """Times the storage backend's I/O calls. Wraps the instance so any configured backend is covered."""
+    for name in STORAGE_METHODS:
+        method = getattr(storage, name, None)
+        if method is not None and not getattr(method, "_instrumented", False):
+            setattr(storage, name, _timed_storage_call(method))
+    return storage
+
+
+def instrument_serializers():
+    """
+    Times `data` on every DRF serializer. Serializer.data and ListSerializer.data both build on BaseSerializer.data,
+    so wrapping it once covers them all, and nested serializers, which go through to_representation, aren't counted
+    twice.
+    """
+    get_data = serializers.BaseSerializer.data.fget
+    if getattr(get_data, "_instrumented", False):
+        return
+
+    @wraps(get_data)
+    def data(self):
+        with span("serializer"):
+            return get_data(self)
+
+    data._instrumented = True
+    serializers.BaseSerializer.data = property(data)
@@ -0,0 +1,170 @@
+import logging
+import random
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .db import retry_on_database_locked
+from .metrics import registry
+from .models import Job
+
+logger = logging.getLogger("mods.jobs")
+
+_handlers = {}
+# Job name -> seconds a worker may hold it, for jobs that outlast JOB_LOCK_TIMEOUT
+_lock_timeouts = {}
+
+
+def job(name, lock_timeout=None):
+    """
+    Registers the decorated function as the handler for jobs called `name`. Payloads are passed as kwargs. Jobs that
+    can legitimately run for longer than JOB_LOCK_TIMEOUT seconds set their own `lock_timeout`.
+    """
+
+    def register(func):
+        _handlers[name] = func
+        if lock_timeout is not None:
+            _lock_timeouts[name] = lock_timeout
+        return func
+
+    return register
+
+
+def enqueue(name, payload=None, priority=0, delay=None, dedupe_key=None, max_attempts=None):
+    """
+    Queues a job. The row is written in the caller's transaction, so a worker only sees it once that transaction
+    commits and never sees it if it rolls back. A job whose `dedupe_key` matches one that is still queued is dropped.
+    """
+    if name not in _handlers:
+        raise LookupError(f"No job registered as {name!r}")
+    Job.objects.bulk_create(
+        [
+            Job(
+                name=name,
+                payload=payload or {},
+                priority=priority,
+                run_at=timezone.now() + (delay or timedelta()),
+                dedupe_key=dedupe_key,
+                max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+            )
+        ],
+        ignore_conflicts=dedupe_key is not None,
+    )
+
+
+@retry_on_database_locked
+def claim_jobs(worker, limit):
+    """Marks up to `limit` due jobs as running under `worker` and returns them, highest priority first."""
+    now = timezone.now()
+    # A unique claim lets one UPDATE take the jobs and the following SELECT find exactly the ones it took
+    claim = f"{worker}:{uuid.uuid4().hex[:12]}"
+    due = (
+        Job.objects.filter(status=Job.STATUS_QUEUED, run_at__lte=now)
+        .order_by("-priority", "run_at", "id")
+        .values("id")[:limit]
+    )
+    claimed = Job.objects.filter(id__in=due, status=Job.STATUS_QUEUED).update(
+        status=Job.STATUS_RUNNING, locked_by=claim, locked_at=now, attempts=F("attempts") + 1
+    )
+    if not claimed:
+        return []
+    return list(Job.objects.filter(locked_by=claim, status=Job.STATUS_RUNNING).order_by("-priority", "run_at", "id"))
+
+
+def _retry_delay(attempts):
+    delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+    # Jitter keeps jobs that failed together from retrying together
+    return timedelta(seconds=delay + random.uniform(0, delay / 4))
+
+
+def _claimed(job_id, claim):
+    # Once a job was taken as stale and claimed again, the worker that lost it no longer finishes it
+    jobs = Job.objects.filter(pk=job_id)
+    return jobs if claim is None else jobs.filter(locked_by=claim)
+
+
+@retry_on_database_locked
+def _requeue(job_id, claim=None, **fields):
+    try:
+        with transaction.atomic():
+            _claimed(job_id, claim).update(status=Job.STATUS_QUEUED, locked_by="", **fields)
+    except IntegrityError:
+        # A job with the same dedupe key was queued while this one ran, and it will do the work
+        _claimed(job_id, claim).delete()
+
+
+@retry_on_database_locked
+def _finish(job_id, claim, **fields):
+    if fields:
+        _claimed(job_id, claim).update(locked_by="", **fields)
+    else:
+        _claimed(job_id, claim).delete()
+
+
+def run_job(job):
+    """Runs a claimed job. Finished jobs are deleted, failed ones are retried later or kept as dead."""
+    handler = _handlers.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError(f"No job registered as {job.name!r}")
+        handler(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error("Job %s (%s) failed for good after %s attempts:\n%s", job.id, job.name, job.attempts, error)
+            _finish(job.pk, job.locked_by, status=Job.STATUS_DEAD, last_error=error)
+        else:
+            logger.warning("Job %s (%s) failed on attempt %s:\n%s", job.id, job.name, job.attempts, error)
+            _requeue(job.pk, job.locked_by, run_at=timezone.now() + _retry_delay(job.attempts), last_error=error)
+        return False
+    _finish(job.pk, job.locked_by)
+    return True
+
+
+def requeue_stale_jobs():
+    """Queues running jobs again once their worker has held them for longer than their lock timeout."""
+    now = timezone.now()
+    expired = Q(locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)) & ~Q(name__in=_lock_timeouts)
+    for name, lock_timeout in _lock_timeouts.items():
+        expired |= Q(name=name, locked_at__lt=now - timedelta(seconds=lock_timeout))
+    stale = Job.objects.filter(expired, status=Job.STATUS_RUNNING)
+    dead = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.STATUS_DEAD, locked_by="", last_error="Worker stopped before the job finished."
+    )
+    requeued = list(stale.values_list("id", flat=True))
+    for job_id in requeued:
+        _requeue(job_id)
+    return len(requeued) + dead
+
+
+def retry_jobs(job_ids):
+    """Queues jobs again to run now, with a fresh set of attempts."""
+    for job_id in job_ids:
+        _requeue(job_id, attempts=0, run_at=timezone.now())
+
+
+def run_pending(worker="inline", limit=100):
+    """Runs due jobs in this thread until none are left. Returns how many ran."""
+    ran = 0
+    while jobs := claim_jobs(worker, limit):
+        for claimed in jobs:
+            run_job(claimed)
+            ran += 1
+    return ran
+
+
+registry.register_gauge(
+    "job_queue_backlog",
+    "Jobs waiting to run, including retries scheduled for later.",
+    lambda: Job.objects.filter(status=Job.STATUS_QUEUED).count(),
+)
+registry.register_gauge(
+    "job_queue_dead",
+    "Jobs that failed on every attempt.",
+    lambda: Job.objects.filter(status=Job.STATUS_DEAD).count(),
+)
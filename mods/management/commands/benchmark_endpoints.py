@@ -0,0 +1,301 @@
+import json
+import secrets
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.urls import URLPattern, get_resolver
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from mods.models import Category, Gender, Mod, Race, Tag
+
+User = get_user_model()
+
+
+def _percentile(values, percentile):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[percentile - 1]
+
+
+def _benchmark_user():
+    """Creates a throwaway admin with a random password, deleted again once the run is over."""
+    username = f"benchmark_{secrets.token_hex(6)}"
+    password = secrets.token_urlsafe(24)
+    user = User.objects.create_user(username=username, email=f"{username}@example.com", password=password, role="admin")
+    return user, password
+
+
+def _request_specs(user, password):
+    """
+    Describes how to call each named URL against the current dataset. Write requests are rolled back after every
+    call so repeated iterations see the same data.
+    """
+    approved = list(Mod.objects.filter(approved=True).order_by("id").values_list("uuid", flat=True)[:100])
+    pending = Mod.objects.filter(approved=False).order_by("id").values_list("uuid", flat=True).first()
+    mod = Mod.objects.filter(uuid=approved[0]).values("uuid", "category_id", "user_id").first() if approved else None
+    category = Category.objects.order_by("id").values_list("id", flat=True).first()
+    tags = list(Tag.objects.order_by("id").values_list("id", flat=True)[:3])
+    races = list(Race.objects.order_by("id").values_list("id", flat=True)[:2])
+    genders = list(Gender.objects.order_by("id").values_list("id", flat=True)[:1])
+    refresh = RefreshToken.for_user(user)
+
+    def upload():
+        return {
+            "title": "Benchmark Mod",
+            "short_desc": "Benchmark",
+            "description": "Benchmark",
+            "version": "1.0.0",
+            "file": SimpleUploadedFile("mod.zip", b"benchmark", content_type="application/zip"),
+            "file_size": 9,
+            "user": user.id,
+            "category": category,
+            "tags": tags,
+        }
+
+    specs = {
+        "create": {"method": "post", "data": upload, "format": "multipart", "write": True},
+        "changes": {"method": "get", "data": {"since": 0}},
+        "check-updates": {
+            "method": "post",
+            "data": {"mods": [{"uuid": str(mod_uuid), "version": "0.0.1"} for mod_uuid in approved]},
+            "format": "json",
+        },
+        "bulk-detail": {
+            "method": "post",
+            "data": {"uuids": [str(mod_uuid) for mod_uuid in approved]},
+            "format": "json",
+        },
+        "search-by-tag": {"method": "get", "data": {"tag_ids": tags}},
+        "search-by-race": {"method": "get", "data": {"race_ids": races}},
+        "search-by-gender": {"method": "get", "data": {"gender_ids": genders}},
+        "register": {
+            "method": "post",
+            "data": {"username": "benchmark_register", "email": "register@example.com", "password": "Str0ng!pass"},
+            "format": "json",
+            "write": True,
+        },
+        "token_obtain_pair": {
+            "method": "post",
+            "data": {"username": user.username, "password": password},
+            "format": "json",
+        },
+        # Refreshing revokes the rotated token, so it is rolled back like other writes
+        "token_refresh": {"method": "post", "data": {"refresh": str(refresh)}, "format": "json", "write": True},
+        "password_reset_confirm": {
+            "kwargs": {
+                "uidb64": urlsafe_base64_encode(force_bytes(user.pk)),
+                "token": default_token_generator.make_token(user),
+            }
+        },
+    }
+    if mod:
+        mod_kwargs = {"uuid": mod["uuid"]}
+        specs.update(
+            {
+                "detail": {"kwargs": mod_kwargs},
+                "update": {
+                    "method": "patch",
+                    "kwargs": mod_kwargs,
+                    "data": {"title": "Benchmark update"},
+                    "write": True,
+                },
+                "delete": {"method": "delete", "kwargs": mod_kwargs, "write": True},
+                "search-by-category": {"kwargs": {"category_id": mod["category_id"]}},
+                "search-by-user": {"kwargs": {"user_id": mod["user_id"]}},
+                "search-by-title": {"kwargs": {"title": "Crystal"}},
+            }
+        )
+    if pending:
+        specs["approve"] = {
+            "method": "patch",
+            "kwargs": {"uuid": pending},
+            "data": {"approved": True},
+            "format": "json",
+            "write": True,
+        }
+    return specs
+
+
+def _endpoints(user, password):
+    """Yields (route, spec) for every URL in the root URLconf, skipping included URLconfs such as the admin."""
+    specs = _request_specs(user, password)
+    for pattern in get_resolver().url_patterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        route = str(pattern.pattern)
+        spec = dict(specs.get(pattern.name, {}))
+        converters = pattern.pattern.converters
+        if set(spec.get("kwargs", {})) != set(converters):
+            if converters:
+                # No sample data for the URL's arguments, e.g. an empty dataset
+                yield route, None
+                continue
+            spec.pop("kwargs", None)
+        yield route, spec
+
+
+def _call(client, route, spec):
+    path = "/" + route
+    for name, value in spec.get("kwargs", {}).items():
+        path = path.replace(f"<{name}>", str(value))
+        for converter in ("int", "str", "uuid", "slug", "path"):
+            path = path.replace(f"<{converter}:{name}>", str(value))
+
+    data = spec.get("data")
+    data = data() if callable(data) else data
+    request = getattr(client, spec.get("method", "get"))
+    kwargs = {"format": spec["format"]} if "format" in spec else {}
+
+    if spec.get("write"):
+        with transaction.atomic():
+            response = request(path, data, **kwargs)
+            transaction.set_rollback(True)
+    else:
+        response = request(path, data, **kwargs)
+
+    if response.streaming:
+        # Streaming responses do their work while being consumed
+        b"".join(response.streaming_content)
+    return response
+
+
+def _measure(client, route, spec, iterations, budget):
+    # Counted with a wrapper since the test client clears the query log when each request starts
+    queries = []
+    with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+        response = _call(client, route, spec)
+
+    tracemalloc.start()
+    _call(client, route, spec)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        iteration_started = time.perf_counter()
+        _call(client, route, spec)
+        latencies.append((time.perf_counter() - iteration_started) * 1000)
+        if time.perf_counter() - started > budget:
+            break
+
+    return {
+        "status": response.status_code,
+        "iterations": len(latencies),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "queries": len(queries),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures latency percentiles, query counts and peak memory for every URL in the root URLconf, optionally at "
+        "several seeded dataset sizes, and compares the results with a stored baseline. It writes to the database, "
+        "so it only runs with DEBUG on unless --i-know-this-is-destructive is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            help="Comma separated mod counts. Each size flushes the database and reseeds it with seed_catalog.",
+        )
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--budget", type=float, default=10.0, help="Maximum seconds spent timing one endpoint")
+        parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+        parser.add_argument("--compare", help="Compare the results with this baseline JSON file")
+        parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p95 slowdown before flagging")
+        parser.add_argument("--fail-on-regression", action="store_true")
+        parser.add_argument(
+            "--i-know-this-is-destructive",
+            action="store_true",
+            help="Run without DEBUG, e.g. against a staging database. --sizes deletes all of its data.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["i_know_this_is_destructive"]:
+            raise CommandError(
+                "benchmark_endpoints creates an admin user and --sizes flushes the database. Run it with DEBUG on, or "
+                "pass --i-know-this-is-destructive."
+            )
+        self.regressions = 0
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                baseline = json.load(file)
+
+        sizes = [int(size) for size in options["sizes"].split(",")] if options["sizes"] else [None]
+        results = {}
+        for size in sizes:
+            if size is not None:
+                self.stdout.write(f"Seeding {size} mods...")
+                call_command("seed_catalog", mods=size, users=max(10, size // 10), flush=True, verbosity=0)
+            label = str(Mod.objects.count())
+            results[label] = self._run(options["iterations"], options["budget"])
+            self._report(label, results[label], (baseline or {}).get("sizes", {}).get(label), options["threshold"])
+
+        if options["save_baseline"]:
+            with open(options["save_baseline"], "w") as file:
+                json.dump({"sizes": results}, file, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline written to {options['save_baseline']}")
+
+        if baseline and options["fail_on_regression"] and self.regressions:
+            raise CommandError(f"{self.regressions} endpoint(s) regressed against {options['compare']}")
+
+    def _run(self, iterations, budget):
+        cache.clear()
+        user, password = _benchmark_user()
+        client = APIClient(raise_request_exception=False)
+        client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(user).access_token))
+
+        results = {}
+        # Uploads from the create benchmark land in a throwaway media root, and DEBUG query logging stays off
+        try:
+            with (
+                tempfile.TemporaryDirectory() as media_root,
+                override_settings(MEDIA_ROOT=media_root, DEBUG=False, ALLOWED_HOSTS=["testserver"]),
+            ):
+                for route, spec in _endpoints(user, password):
+                    if spec is None:
+                        self.stdout.write(self.style.WARNING(f"Skipping {route}: no sample data"))
+                        continue
+                    results[route] = _measure(client, route, spec, iterations, budget)
+        finally:
+            user.delete()
+        return results
+
+    def _report(self, label, results, baseline, threshold):
+        self.stdout.write(f"\nDataset: {label} mods")
+        self.stdout.write(
+            f"{'endpoint':<40}{'status':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KiB':>10}"
+            + (f"{'p95 vs base':>13}" if baseline else "")
+        )
+        for route, result in results.items():
+            line = (
+                f"{route:<40}{result['status']:>7}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}{result['queries']:>9}{result['peak_kib']:>10.1f}"
+            )
+            previous = (baseline or {}).get(route)
+            if previous:
+                change = (result["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] if previous["p95_ms"] else 0.0
+                line += f"{change:>+13.0%}"
+                if change > threshold or result["queries"] > previous["queries"]:
+                    self.regressions += 1
+                    line = self.style.ERROR(line)
+            self.stdout.write(line)
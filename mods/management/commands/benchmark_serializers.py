@@ -0,0 +1,84 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from mods.fast_serializers import serialize_mods
+from mods.models import Mod
+from mods.serializers import ModSerializer
+
+
+def _model_serializer(request):
+    return ModSerializer(Mod.objects.filter(approved=True), many=True, context={"request": request}).data
+
+
+def _prefetched_model_serializer(request):
+    queryset = Mod.objects.filter(approved=True).prefetch_related("comments", "mod_downloads", "ratings", "tags")
+    return ModSerializer(queryset, many=True, context={"request": request}).data
+
+
+def _fast_serializer(request):
+    return serialize_mods(Mod.objects.filter(approved=True), request)
+
+
+SERIALIZERS = {
+    "ModSerializer": _model_serializer,
+    "ModSerializer + prefetch": _prefetched_model_serializer,
+    "serialize_mods": _fast_serializer,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares ModSerializer with the values()-based serialize_mods on a seeded catalog, reporting time per 1k mods "
+        "and query counts. The seeded data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mods", type=int, default=1000)
+        parser.add_argument("--iterations", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            call_command(
+                "seed_catalog",
+                mods=options["mods"],
+                users=max(10, options["mods"] // 10),
+                seed=options["seed"],
+                verbosity=0,
+            )
+            self._run(options["iterations"])
+            transaction.set_rollback(True)
+
+    def _run(self, iterations):
+        request = RequestFactory().get("/", HTTP_HOST="localhost")
+        count = Mod.objects.filter(approved=True).count()
+        self.stdout.write(f"Serializing {count} approved mods, best of {iterations}")
+        self.stdout.write(f"{'serializer':<28}{'ms':>10}{'ms / 1k mods':>14}{'queries':>9}{'speedup':>9}")
+
+        outputs = {}
+        baseline = None
+        for name, serialize in SERIALIZERS.items():
+            queries = []
+            with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+                outputs[name] = serialize(request)
+
+            best = float("inf")
+            for _ in range(iterations):
+                started = time.perf_counter()
+                serialize(request)
+                best = min(best, time.perf_counter() - started)
+            best *= 1000
+            baseline = baseline or best
+            per_thousand = best * 1000 / count if count else 0.0
+            self.stdout.write(f"{name:<28}{best:>10.1f}{per_thousand:>14.1f}{len(queries):>9}{baseline / best:>8.1f}x")
+
+        # Compared as rendered JSON, so key order and value types have to match as well
+        rendered = {JSONRenderer().render(output) for output in outputs.values()}
+        if len(rendered) > 1:
+            raise CommandError("Serializers produced different output")
+        self.stdout.write(self.style.SUCCESS("All serializers produced identical output"))
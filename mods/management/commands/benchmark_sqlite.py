@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Python's sqlite3 defaults, which is what Django used before the tuned profile
+_DEFAULT_PROFILE = {}
+
+
+def _connect(path, pragmas, timeout):
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    for pragma, value in pragmas.items():
+        connection.execute(f"PRAGMA {pragma} = {value}")
+    return connection
+
+
+def _prepare(path, rows):
+    connection = sqlite3.connect(path, isolation_level=None)
+    connection.execute("CREATE TABLE mods (id INTEGER PRIMARY KEY, title TEXT, downloads INTEGER)")
+    connection.execute("CREATE TABLE downloads (id INTEGER PRIMARY KEY, mod_id INTEGER, download_date REAL)")
+    connection.executemany("INSERT INTO mods (title, downloads) VALUES (?, 0)", ((f"Mod {i}",) for i in range(rows)))
+    connection.close()
+
+
+def _run_profile(pragmas, readers, writers, duration, rows, timeout):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.sqlite3")
+        _prepare(path, rows)
+
+        stop = threading.Event()
+        read_latencies, write_latencies = [], []
+        errors = {"locked": 0}
+        lock = threading.Lock()
+
+        def reader():
+            connection = _connect(path, pragmas, timeout)
+            latencies = []
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    connection.execute(
+                        "SELECT id, title, downloads FROM mods ORDER BY downloads DESC LIMIT 50"
+                    ).fetchall()
+                except sqlite3.OperationalError:
+                    with lock:
+                        errors["locked"] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            with lock:
+                read_latencies.extend(latencies)
+            connection.close()
+
+        def writer(seed):
+            connection = _connect(path, pragmas, timeout)
+            latencies = []
+            mod_id = seed
+            while not stop.is_set():
+                mod_id = mod_id % rows + 1
+                started = time.perf_counter()
+                try:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.execute(
+                        "INSERT INTO downloads (mod_id, download_date) VALUES (?, ?)", (mod_id, time.time())
+                    )
+                    connection.execute("UPDATE mods SET downloads = downloads + 1 WHERE id = ?", (mod_id,))
+                    connection.execute("COMMIT")
+                except sqlite3.OperationalError:
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                    with lock:
+                        errors["locked"] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            with lock:
+                write_latencies.extend(latencies)
+            connection.close()
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    return {
+        "reads_per_second": len(read_latencies) / duration,
+        "writes_per_second": len(write_latencies) / duration,
+        "read_p95_ms": _percentile(read_latencies, 95) * 1000,
+        "write_p95_ms": _percentile(write_latencies, 95) * 1000,
+        "locked_errors": errors["locked"],
+    }
+
+
+def _percentile(values, percentile):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[percentile - 1]
+
+
+class Command(BaseCommand):
+    help = "Compares concurrent SQLite read/write throughput with default settings and the tuned SQLITE_PRAGMAS."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per profile")
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--timeout", type=float, default=5.0, help="Busy timeout of the default profile")
+
+    def handle(self, *args, **options):
+        profiles = {
+            "default": (_DEFAULT_PROFILE, options["timeout"]),
+            "tuned": (settings.SQLITE_PRAGMAS, settings.DATABASES["default"]["OPTIONS"].get("timeout", 5)),
+        }
+        self.stdout.write(
+            f"{'profile':<10}{'reads/s':>12}{'writes/s':>12}{'read p95 ms':>14}{'write p95 ms':>14}{'locked':>9}"
+        )
+        for name, (pragmas, timeout) in profiles.items():
+            result = _run_profile(
+                pragmas, options["readers"], options["writers"], options["duration"], options["rows"], timeout
+            )
+            self.stdout.write(
+                f"{name:<10}{result['reads_per_second']:>12.0f}{result['writes_per_second']:>12.0f}"
+                f"{result['read_p95_ms']:>14.2f}{result['write_p95_ms']:>14.2f}{result['locked_errors']:>9}"
+            )
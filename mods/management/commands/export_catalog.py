@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from mods.catalog import EXPORT_CHUNK_SIZE, write_catalog_export
+
+
+class Command(BaseCommand):
+    help = "Exports all approved mods as gzip-compressed NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Destination file, e.g. catalog.ndjson.gz")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        write_catalog_export(options["path"], chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Catalog exported to {options['path']}"))
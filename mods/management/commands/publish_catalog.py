@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from mods.snapshots import publish_catalog_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Publishes the static catalog shards affected by changes since the last publish. Changes are published by a "
+        "job anyway, run this with --full to rebuild everything, e.g. to refresh download counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Rebuild every shard, not only the affected ones")
+
+    def handle(self, *args, **options):
+        names = publish_catalog_snapshot(full=options["full"])
+        self.stdout.write(self.style.SUCCESS(f"Published {len(names)} catalog shards"))
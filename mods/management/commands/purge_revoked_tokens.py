@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from mods.revocation import purge_expired_revocations
+
+
+class Command(BaseCommand):
+    help = "Deletes revoked refresh tokens that have expired. Run it on a schedule, e.g. daily from cron."
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_revocations()
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired revoked tokens"))
@@ -0,0 +1,74 @@
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from mods.jobs import claim_jobs, requeue_stale_jobs, run_job
+
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        # Pool threads get their own connections, which would otherwise stay open until the thread exits
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs queued background jobs on a pool of threads until stopped with SIGINT or SIGTERM, finishing the jobs "
+        "already started before exiting. Run more than one worker process to use more than one core."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--poll-interval", type=float, default=settings.JOB_POLL_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="Exit once no jobs are due instead of polling")
+
+    def handle(self, *args, **options):
+        threads = options["threads"]
+        worker = f"{socket.gethostname()}-{os.getpid()}"
+        stop = threading.Event()
+        previous_handlers = {
+            signum: signal.signal(signum, lambda *args: stop.set()) for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            ran, failed = self._work(worker, threads, stop, options)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write(self.style.SUCCESS(f"Worker {worker} stopped after running {ran} jobs, {failed} failed"))
+
+    def _work(self, worker, threads, stop, options):
+        self.stdout.write(f"Worker {worker} running jobs on {threads} threads")
+        ran = failed = 0
+        last_stale_check = float("-inf")
+        running = set()
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="job") as pool:
+            while True:
+                if not stop.is_set():
+                    if time.monotonic() - last_stale_check > settings.JOB_LOCK_TIMEOUT / 10:
+                        requeue_stale_jobs()
+                        last_stale_check = time.monotonic()
+                    if len(running) < threads:
+                        running.update(
+                            pool.submit(_run_in_thread, job) for job in claim_jobs(worker, threads - len(running))
+                        )
+
+                if not running:
+                    if stop.is_set() or options["once"]:
+                        break
+                    stop.wait(options["poll_interval"])
+                    continue
+
+                done, running = wait(running, timeout=options["poll_interval"], return_when=FIRST_COMPLETED)
+                for future in done:
+                    ran += 1
+                    failed += not future.result()
+        return ran, failed
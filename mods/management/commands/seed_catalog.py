@@ -0,0 +1,173 @@
+import random
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from mods.models import Category, Comment, Download, Gender, Mod, ModArchive, ModCompatibility, Race, Rating, Tag
+
+User = get_user_model()
+
+SEED_USERNAME_PREFIX = "seed_"
+SEED_PASSWORD = "seed-password"
+
+RACES = ["Hyur", "Elezen", "Lalafell", "Miqo'te", "Roegadyn", "Au Ra", "Hrothgar", "Viera"]
+GENDERS = ["Male", "Female"]
+CATEGORIES = {
+    # name: (requires_race, requires_gender)
+    "Gear": (False, False),
+    "Hair": (True, True),
+    "Face": (True, True),
+    "Body": (True, True),
+    "Animation": (False, False),
+    "VFX": (False, False),
+    "UI": (False, False),
+    "Mount": (False, False),
+    "Minion": (False, False),
+    "Housing": (False, False),
+}
+WORDS = [
+    "Crystal", "Shadow", "Aether", "Moogle", "Chocobo", "Ishgard", "Eorzea", "Primal", "Garlean", "Dawn",
+    "Dragoon", "Astral", "Umbral", "Void", "Sylph", "Radiant", "Ancient", "Starlight", "Ivalice", "Eternal",
+    "Outfit", "Armor", "Robe", "Boots", "Gloves", "Hairstyle", "Tattoo", "Emote", "Glamour", "Remaster",
+]  # fmt: skip
+
+
+def _title(rng):
+    return " ".join(rng.sample(WORDS, rng.randint(2, 4)))
+
+
+class Command(BaseCommand):
+    help = "Generates a synthetic catalog of users, mods, tags, compatibility, downloads, ratings and comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--mods", type=int, default=10000)
+        parser.add_argument("--tags", type=int, default=200)
+        parser.add_argument("--comments", type=float, default=3.0, help="Average comments per mod")
+        parser.add_argument("--ratings", type=float, default=5.0, help="Average ratings per mod")
+        parser.add_argument("--downloads", type=float, default=20.0, help="Average downloads per mod")
+        parser.add_argument("--approved-ratio", type=float, default=0.9)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, for reproducible datasets")
+        parser.add_argument("--flush", action="store_true", help="Delete all existing data first")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        if options["flush"]:
+            call_command("flush", interactive=False, verbosity=0)
+
+        categories = self._reference_data()
+        races = list(Race.objects.values_list("id", flat=True))
+        genders = list(Gender.objects.values_list("id", flat=True))
+        tag_ids = self._seed_tags(options["tags"])
+        user_ids = self._seed_users(options["users"], options["batch_size"])
+
+        created = 0
+        while created < options["mods"]:
+            size = min(options["batch_size"], options["mods"] - created)
+            with transaction.atomic():
+                self._seed_mod_batch(rng, size, options, categories, races, genders, tag_ids, user_ids)
+            created += size
+            self.stdout.write(f"Seeded {created}/{options['mods']} mods")
+
+        self.stdout.write(self.style.SUCCESS(f"Catalog seeded with {options['mods']} mods"))
+
+    def _reference_data(self):
+        for name in RACES:
+            Race.objects.get_or_create(name=name)
+        for name in GENDERS:
+            Gender.objects.get_or_create(name=name)
+
+        categories = []
+        for name, (requires_race, requires_gender) in CATEGORIES.items():
+            category, _ = Category.objects.get_or_create(
+                name=name, defaults={"requires_race": requires_race, "requires_gender": requires_gender}
+            )
+            categories.append(category)
+        return categories
+
+    def _seed_tags(self, count):
+        existing = set(Tag.objects.values_list("name", flat=True))
+        names = [f"tag-{index}" for index in range(count)]
+        Tag.objects.bulk_create([Tag(name=name) for name in names if name not in existing])
+        return list(Tag.objects.filter(name__in=names).values_list("id", flat=True))
+
+    def _seed_users(self, count, batch_size):
+        # Hashing once keeps seeding fast while still letting every seeded user log in
+        password = make_password(SEED_PASSWORD)
+        users = [
+            User(
+                username=f"{SEED_USERNAME_PREFIX}{index}",
+                email=f"{SEED_USERNAME_PREFIX}{index}@example.com",
+                password=password,
+            )
+            for index in range(count)
+        ]
+        User.objects.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
+        return list(User.objects.filter(username__startswith=SEED_USERNAME_PREFIX).values_list("id", flat=True)[:count])
+
+    def _seed_mod_batch(self, rng, size, options, categories, races, genders, tag_ids, user_ids):
+        mods = []
+        for _ in range(size):
+            mod_uuid = uuid.uuid4()
+            mods.append(
+                Mod(
+                    uuid=mod_uuid,
+                    title=_title(rng),
+                    short_desc="A synthetic mod generated for benchmarking.",
+                    description="Generated by manage.py seed_catalog. " * rng.randint(1, 20),
+                    version=f"{rng.randint(1, 3)}.{rng.randint(0, 9)}.{rng.randint(0, 20)}",
+                    file=f"user_uploads/{mod_uuid}/files/mod.pmp",
+                    file_size=rng.randint(1024, 1073741824),
+                    user_id=rng.choice(user_ids),
+                    downloads=0,
+                    category=rng.choice(categories),
+                    approved=rng.random() < options["approved_ratio"],
+                )
+            )
+        # bulk_create skips Mod.save(), so validation and change-log signals don't run for seeded rows
+        mods = Mod.objects.bulk_create(mods)
+
+        tag_links, compatibility, comments, ratings, downloads, archives = [], [], [], [], [], []
+        for mod in mods:
+            # Seeded files don't exist, so they are recorded as already validated
+            archives.append(
+                ModArchive(
+                    mod_id=mod.id,
+                    file=mod.file.name,
+                    status=ModArchive.STATUS_VALID,
+                    size=mod.file_size,
+                    sha256=f"{rng.getrandbits(256):064x}",
+                    crc32=rng.getrandbits(32),
+                )
+            )
+            for tag_id in rng.sample(tag_ids, min(len(tag_ids), rng.randint(0, 5))):
+                tag_links.append(Mod.tags.through(mod_id=mod.id, tag_id=tag_id))
+
+            if mod.category.requires_race or mod.category.requires_gender:
+                for race_id in rng.sample(races, rng.randint(1, len(races))):
+                    compatibility.append(
+                        ModCompatibility(mod_id=mod.id, race_id=race_id, gender_id=rng.choice(genders))
+                    )
+
+            for _ in range(int(rng.expovariate(1 / options["comments"])) if options["comments"] else 0):
+                comments.append(Comment(mod_id=mod.id, user_id=rng.choice(user_ids), text="Great mod!"))
+            for _ in range(int(rng.expovariate(1 / options["ratings"])) if options["ratings"] else 0):
+                ratings.append(Rating(mod_id=mod.id, user_id=rng.choice(user_ids), rating=rng.randint(1, 5)))
+
+            mod.downloads = int(rng.expovariate(1 / options["downloads"])) if options["downloads"] else 0
+            for _ in range(mod.downloads):
+                downloads.append(Download(mod_id=mod.id, user_id=rng.choice(user_ids)))
+
+        batch_size = options["batch_size"]
+        Mod.tags.through.objects.bulk_create(tag_links, batch_size=batch_size)
+        ModCompatibility.objects.bulk_create(compatibility, batch_size=batch_size)
+        Comment.objects.bulk_create(comments, batch_size=batch_size)
+        Rating.objects.bulk_create(ratings, batch_size=batch_size)
+        Download.objects.bulk_create(downloads, batch_size=batch_size)
+        ModArchive.objects.bulk_create(archives, batch_size=batch_size)
+        Mod.objects.bulk_update(mods, ["downloads"], batch_size=batch_size)
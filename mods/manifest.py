@@ -0,0 +1,212 @@
+import io
+import json
+import posixpath
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+# Top level folders of the game's file tree. Anything else in an archive is a readme, preview or the like.
+GAME_PATH_ROOTS = frozenset(
+    ["bg", "bgcommon", "chara", "common", "cut", "exd", "game_script", "music", "shader", "sound", "ui", "vfx"]
+)
+GAME_PATH_MAX_LENGTH = 255
+
+MODPACK_EXTENSIONS = (".pmp", ".ttmp", ".ttmp2")
+# Manifests are small JSON files, anything bigger is not worth decompressing
+MAX_MANIFEST_SIZE = 16 * 1024 * 1024
+MAX_GAME_PATHS = 50000
+# Defaults for the limits nested modpacks are checked against before they're decompressed
+MAX_NESTED_SIZE = 4 * 1024 * 1024 * 1024
+MAX_COMPRESSION_RATIO = 200
+# Small entries can compress absurdly well without being a threat, the ratio is only enforced above this size
+COMPRESSION_RATIO_MIN_SIZE = 1024 * 1024
+# Nested modpacks up to this size are spooled in memory, larger ones to a temporary file
+NESTED_SPOOL_MEMORY_SIZE = 16 * 1024 * 1024
+
+# Large enough that opening an archive takes a couple of ranged reads, one for its end and one for its directory
+RANGED_READ_BUFFER_SIZE = 64 * 1024
+
+
+class ManifestError(ValueError):
+    pass
+
+
+class RangedFile(io.RawIOBase):
+    """A read-only seekable file that fetches every read as a byte range, so only the parts read are transferred."""
+
+    def __init__(self, size, read_range):
+        self._size = size
+        self._read_range = read_range
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("Negative seek position")
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer):
+        end = min(self._position + len(buffer), self._size)
+        if end <= self._position:
+            return 0
+        data = self._read_range(self._position, end - 1)
+        size = len(data)
+        buffer[:size] = data
+        self._position += size
+        return size
+
+
+def s3_object(storage, name):
+    """Returns the S3 object behind a stored file, or None when the storage isn't S3."""
+    if not hasattr(storage, "bucket"):
+        return None
+
+    from storages.utils import clean_name
+
+    return storage.bucket.Object(storage._normalize_name(clean_name(name)))
+
+
+def open_archive(storage, name):
+    """
+    Opens a stored archive for reading. S3 objects are read with ranged GETs instead of being downloaded whole, which
+    is what the S3 backend's own files do on first read.
+    """
+    remote = s3_object(storage, name)
+    if remote is None:
+        return storage.open(name, "rb")
+
+    def read_range(start, end):
+        return remote.get(Range=f"bytes={start}-{end}")["Body"].read()
+
+    return io.BufferedReader(RangedFile(storage.size(name), read_range), buffer_size=RANGED_READ_BUFFER_SIZE)
+
+
+def normalize_game_path(path):
+    path = path.strip().replace("\\", "/").lower().lstrip("/")
+    if not path or len(path) > GAME_PATH_MAX_LENGTH or path.split("/", 1)[0] not in GAME_PATH_ROOTS:
+        return None
+    return path
+
+
+def _read_json(archive, info):
+    if info.file_size > MAX_MANIFEST_SIZE:
+        raise ManifestError(f"{info.filename} is too large to be a manifest")
+    text = archive.read(info).decode("utf-8-sig")
+    try:
+        return [json.loads(text)]
+    except ValueError:
+        # Older TexTools modpacks have one JSON object per line
+        try:
+            return [json.loads(line) for line in text.splitlines() if line.strip()]
+        except ValueError as exc:
+            raise ManifestError(f"{info.filename} is not valid JSON") from exc
+
+
+def _penumbra_paths(documents):
+    for document in documents:
+        if not isinstance(document, dict):
+            continue
+        options = [document] + [option for option in document.get("Options") or [] if isinstance(option, dict)]
+        for option in options:
+            # Swapped paths are overwritten as much as replaced files are
+            for key in ("Files", "FileSwaps"):
+                if isinstance(option.get(key), dict):
+                    yield from option[key]
+
+
+def _textools_paths(value):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key == "FullPath" and isinstance(item, str):
+                yield item
+            else:
+                yield from _textools_paths(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _textools_paths(item)
+
+
+def _nested_paths(archive, modpacks, max_size, max_ratio):
+    """
+    Reads modpacks zipped up in the archive. Each is decompressed once into a spool, since the central directory
+    reader seeks around and every seek back in a compressed entry decompresses it again from the start.
+    """
+    for info in modpacks:
+        if info.file_size > max_size:
+            raise ManifestError(f"{info.filename} expands to more than {max_size} bytes")
+        if info.file_size > COMPRESSION_RATIO_MIN_SIZE and info.file_size > info.compress_size * max_ratio:
+            raise ManifestError(f"{info.filename} is compressed more than {max_ratio} to 1")
+        with tempfile.SpooledTemporaryFile(max_size=NESTED_SPOOL_MEMORY_SIZE) as spool:
+            # Decompression stops at the declared size checked above
+            with archive.open(info) as entry:
+                shutil.copyfileobj(entry, spool, RANGED_READ_BUFFER_SIZE)
+            spool.seek(0)
+            with zipfile.ZipFile(spool) as modpack:
+                yield from _archive_paths(modpack)
+
+
+def _archive_paths(archive, nested=None):
+    entries = [info for info in archive.infolist() if not info.is_dir()]
+    names = {posixpath.basename(info.filename).lower(): info for info in entries}
+
+    if "ttmpl.mpl" in names:
+        return _textools_paths(_read_json(archive, names["ttmpl.mpl"]))
+    penumbra = [
+        info
+        for name, info in names.items()
+        if name == "default_mod.json" or (name.startswith("group_") and name.endswith(".json"))
+    ]
+    if penumbra:
+        return _penumbra_paths(document for info in penumbra for document in _read_json(archive, info))
+
+    if nested is not None:
+        # Archives are often a modpack zipped up again
+        modpacks = [info for info in entries if info.filename.lower().endswith(MODPACK_EXTENSIONS)]
+        if modpacks:
+            return _nested_paths(archive, modpacks, *nested)
+
+    # A plain archive of game files, possibly inside a folder or two. Only the central directory is read.
+    return _loose_paths(info.filename for info in entries)
+
+
+def _loose_paths(names):
+    for name in names:
+        parts = name.replace("\\", "/").lower().split("/")
+        for index, part in enumerate(parts[:-1]):
+            if part in GAME_PATH_ROOTS:
+                yield "/".join(parts[index:])
+                break
+
+
+def read_game_paths(file, max_nested_size=MAX_NESTED_SIZE, max_ratio=MAX_COMPRESSION_RATIO):
+    """
+    Returns the sorted, distinct game paths a zip, Penumbra (.pmp) or TexTools (.ttmp/.ttmp2) archive replaces. A
+    modpack nested in the archive is only read when its size and compression ratio are within the limits.
+    """
+    try:
+        with zipfile.ZipFile(file) as archive:
+            paths = set()
+            for path in _archive_paths(archive, (max_nested_size, max_ratio)):
+                path = normalize_game_path(path)
+                if path is not None:
+                    paths.add(path)
+                    if len(paths) > MAX_GAME_PATHS:
+                        raise ManifestError(f"Archive replaces more than {MAX_GAME_PATHS} game paths")
+    # RuntimeError is what zipfile raises for encrypted entries
+    except (zipfile.BadZipFile, EOFError, NotImplementedError, RuntimeError, UnicodeDecodeError, zlib.error) as exc:
+        raise ManifestError(f"Archive can't be read: {exc}") from exc
+    return sorted(paths)
@@ -0,0 +1,223 @@
+import glob
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    # name: (type, help)
+    "http_requests_total": ("counter", "Requests handled, by URL name, method and status."),
+    "http_request_duration_seconds": ("histogram", "Request latency by URL name."),
+    "http_request_db_seconds": ("histogram", "Time spent in the database per request, by URL name."),
+    "db_query_duration_seconds": ("histogram", "Query latency by statement verb and first table."),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result."),
+    "cache_hit_ratio": ("gauge", "Share of cache lookups that were hits."),
+    "compressed_responses_total": ("counter", "Responses served from the response cache, by content encoding."),
+    "compressed_response_bytes_saved_total": (
+        "counter",
+        "Bytes not sent thanks to precompressed response bodies, by content encoding.",
+    ),
+}
+
+_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+"?(\w+)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def query_shape(sql):
+    """Reduces a statement to its verb and first table, e.g. `SELECT mods_mod`, to keep label cardinality low."""
+    verb = sql.split(None, 1)[0].upper() if sql.strip() else ""
+    match = _TABLE.search(sql)
+    return f"{verb} {match.group(1)}" if match else verb
+
+
+class MetricsRegistry:
+    """
+    Counters and fixed-bucket histograms for this process. Updates take one short uncontended lock, which is cheaper
+    than any of the work being measured and keeps the registry safe across request threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gauges = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            # (name, labels) -> [per-bucket counts..., overflow count, sum]
+            self._histograms = {}
+            self._last_flush = 0.0
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        index = bisect_left(buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(buckets) + 2)
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def register_gauge(self, name, help_text, callback):
+        """Registers a gauge whose value is computed by `callback()` when metrics are collected."""
+        METRICS[name] = ("gauge", help_text)
+        self._gauges[name] = callback
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, labels, list(counts)] for (name, labels), counts in self._histograms.items()],
+            }
+
+    def gauges(self):
+        return {name: callback() for name, callback in self._gauges.items()}
+
+    def flush_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_flush < settings.METRICS_FLUSH_INTERVAL:
+                return False
+            self._last_flush = now
+            return True
+
+
+registry = MetricsRegistry()
+
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+
+def record_request(view, method, status_code, duration, db_duration):
+    labels = _labels(view=view)
+    registry.inc("http_requests_total", _labels(view=view, method=method, status=str(status_code)))
+    registry.observe("http_request_duration_seconds", duration, labels)
+    registry.observe("http_request_db_seconds", db_duration, labels)
+    flush_snapshot()
+
+
+def record_query(sql, duration):
+    registry.observe("db_query_duration_seconds", duration, _labels(shape=query_shape(sql)))
+
+
+def record_cache_lookup(name, hits, misses):
+    if hits:
+        registry.inc("cache_requests_total", _labels(cache=name, result="hit"), hits)
+    if misses:
+        registry.inc("cache_requests_total", _labels(cache=name, result="miss"), misses)
+
+
+def record_compressed_response(encoding, bytes_saved):
+    labels = _labels(encoding=encoding)
+    registry.inc("compressed_responses_total", labels)
+    if bytes_saved:
+        registry.inc("compressed_response_bytes_saved_total", labels, bytes_saved)
+
+
+def _snapshot_path(pid=None):
+    return os.path.join(settings.METRICS_DIR, f"metrics-{pid or os.getpid()}.json")
+
+
+def flush_snapshot(force=False):
+    """
+    Writes this process's metrics to METRICS_DIR so the metrics endpoint, served by any worker, can merge every
+    worker's numbers. Writes are throttled to one per METRICS_FLUSH_INTERVAL.
+    """
+    if not settings.METRICS_DIR or not (force or registry.flush_due()):
+        return
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", dir=settings.METRICS_DIR, suffix=".tmp", delete=False) as file:
+        json.dump(registry.snapshot(), file)
+    os.replace(file.name, _snapshot_path())
+
+
+def collect():
+    """Returns counters and histograms merged across every worker process that has written a snapshot."""
+    snapshots = [registry.snapshot()]
+    if settings.METRICS_DIR:
+        flush_snapshot(force=True)
+        snapshots = []
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, "metrics-*.json")):
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                # A worker exited or is replacing its file, its numbers are picked up on the next scrape
+                continue
+
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(counts))
+            for index, count in enumerate(counts):
+                merged[index] += count
+    return counters, histograms
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """Renders the merged metrics in the Prometheus text exposition format."""
+    counters, histograms = collect()
+
+    cache_totals = {}
+    for (name, labels), value in counters.items():
+        if name == "cache_requests_total":
+            labels = dict(labels)
+            hits, total = cache_totals.get(labels["cache"], (0, 0))
+            cache_totals[labels["cache"]] = (hits + (value if labels["result"] == "hit" else 0), total + value)
+    gauges = {
+        ("cache_hit_ratio", _labels(cache=cache_name)): hits / total
+        for cache_name, (hits, total) in cache_totals.items()
+    }
+    gauges.update({(name, ()): value for name, value in registry.gauges().items()})
+
+    samples = {}
+    for (name, labels), value in sorted(counters.items()) + sorted(gauges.items()):
+        samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), counts in sorted(histograms.items()):
+        lines = samples.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, le=str(bound))} {cumulative}")
+        cumulative += counts[len(LATENCY_BUCKETS)]
+        lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(counts[-1])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    output = []
+    for name in sorted(samples):
+        metric_type, help_text = METRICS.get(name, ("untyped", ""))
+        output.append(f"# HELP {name} {help_text}")
+        output.append(f"# TYPE {name} {metric_type}")
+        output.extend(samples[name])
+    return "\n".join(output) + "\n"
@@ -0,0 +1,133 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .instrumentation import current_timings, start_request_timings, stop_request_timings, time_queries
+from .metrics import record_request
+from .profiling import save_profile, should_profile, start_profiler, stop_profiler
+from .routers import pin_user_to_primary, start_write_tracking, stop_write_tracking
+
+logger = logging.getLogger("mods.requests")
+
+
+class ReplicaStickinessMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_write_tracking()
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = stop_write_tracking(token)
+
+        # DRF stores the authenticated user back on the Django request
+        if wrote:
+            pin_user_to_primary(getattr(request, "user", None))
+        return response
+
+
+class RequestTimingMiddleware:
+    """
+    Records query count, SQL, serializer, render and storage time for each request and feeds latency metrics. Adds a
+    Server-Timing header when SERVER_TIMING_ENABLED is set and logs requests slower than SLOW_REQUEST_THRESHOLD_MS
+    with their slowest queries.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_request_timings()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(time_queries))
+                response = self.get_response(request)
+        finally:
+            timings = stop_request_timings(token)
+
+        total = timings.total()
+        match = getattr(request, "resolver_match", None)
+        record_request(
+            match.view_name if match else "unmatched", request.method, response.status_code, total, timings.sql
+        )
+        if settings.SERVER_TIMING_ENABLED:
+            response["Server-Timing"] = self._server_timing(timings, total)
+        if total * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            self._log_slow_request(request, response, timings, total)
+        return response
+
+    def process_template_response(self, request, response):
+        timings = current_timings()
+        if timings is not None:
+            # Runs right before the response is rendered, the callback right after
+            started = time.perf_counter()
+
+            def record_render(rendered):
+                timings.render += time.perf_counter() - started
+
+            response.add_post_render_callback(record_render)
+        return response
+
+    def _server_timing(self, timings, total):
+        return ", ".join(
+            [
+                f'db;dur={timings.sql * 1000:.2f};desc="{timings.queries} queries"',
+                f"serializer;dur={timings.serializer * 1000:.2f}",
+                f"render;dur={timings.render * 1000:.2f}",
+                f"storage;dur={timings.storage * 1000:.2f}",
+                f"total;dur={total * 1000:.2f}",
+            ]
+        )
+
+    def _log_slow_request(self, request, response, timings, total):
+        top_queries = "".join(f"\n  {duration * 1000:.2f}ms {sql}" for duration, sql in timings.slowest_queries())
+        logger.warning(
+            "Slow request %s %s (%s): %.2fms total, %d queries in %.2fms, serializer %.2fms, render %.2fms, "
+            "storage %.2fms%s",
+            request.method,
+            # Query strings can carry tokens and personal data
+            request.path,
+            response.status_code,
+            total * 1000,
+            timings.queries,
+            timings.sql * 1000,
+            timings.serializer * 1000,
+            timings.render * 1000,
+            timings.storage * 1000,
+            top_queries,
+        )
+
+
+class RequestProfilerMiddleware:
+    """
+    Runs the view and its rendering under cProfile for a sampled fraction of requests (PROFILER_SAMPLE_RATE) and for
+    admins who send the X-Profile header. Profiles go to a bounded ring buffer in PROFILER_DIR.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling = getattr(request, "_profiling", None)
+            if profiling is not None:
+                stop_profiler(profiling[0])
+        if profiling is not None:
+            save_profile(profiling[0], request, response, time.perf_counter() - profiling[1])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The profiler runs from here until the response comes back rendered, so the view and its rendering go
+        # through the same middleware as unprofiled requests
+        if should_profile(request):
+            profiler = start_profiler()
+            if profiler is not None:
+                request._profiling = (profiler, time.perf_counter())
+        return None
@@ -11,6 +11,7 @@ from django.core.validators import (
     EmailValidator,
 )
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 
 
 _USER_UPLOADED_MODS_PATH = "user_uploads"
@@ -35,11 +36,33 @@ class User(AbstractUser):
         max_length=40, unique=True, db_index=True, validators=[MinLengthValidator(2), MaxLengthValidator(40)]
     )
     email = models.EmailField(unique=True, db_index=True, validators=[EmailValidator()])
-    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default="user", db_index=True)
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default="user")
+    # Carried in issued tokens, bumping it invalidates every token issued before
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_role = instance.__dict__.get("role")
+        return instance
 
     def save(self, *args, **kwargs):
         self.full_clean()
+        update_fields = kwargs.get("update_fields")
+
+        def saving(field):
+            return update_fields is None or field in update_fields
+
+        # A new password is held in _password until saved. Hash upgrades on login clear it first, so they don't count.
+        password_changed = self._password is not None and saving("password")
+        role_changed = saving("role") and self.role != getattr(self, "_loaded_role", self.role)
+        if self.pk and (password_changed or role_changed):
+            self.token_version += 1
+            if update_fields is not None:
+                kwargs["update_fields"] = [*update_fields, "token_version"]
         super().save(*args, **kwargs)
+        if saving("role"):
+            self._loaded_role = self.role
 
     def __str__(self):
         return self.username
@@ -80,8 +103,8 @@ class Category(models.Model):
         editable=False,
         validators=[MinLengthValidator(2), MaxLengthValidator(120)],
     )
-    requires_race = models.BooleanField(default=False, db_index=True)
-    requires_gender = models.BooleanField(default=False, db_index=True)
+    requires_race = models.BooleanField(default=False)
+    requires_gender = models.BooleanField(default=False)
 
     def clean(self):
         self.full_clean()
@@ -92,33 +115,50 @@ class Category(models.Model):
 
 class ModCompatibility(models.Model):
     mod = models.ForeignKey("Mod", on_delete=models.CASCADE, db_index=True)
-    race = models.ForeignKey(Race, on_delete=models.CASCADE, db_index=True)
-    gender = models.ForeignKey(Gender, on_delete=models.CASCADE, blank=True, null=True, db_index=True)
+    race = models.ForeignKey(Race, on_delete=models.CASCADE, db_index=False)
+    gender = models.ForeignKey(Gender, on_delete=models.CASCADE, blank=True, null=True, db_index=False)
+
+    class Meta:
+        indexes = [
+            # Race and gender searches join from the compatibility row to the mod
+            models.Index(fields=["race", "mod"], name="modcompat_race_mod_idx"),
+            models.Index(fields=["gender", "mod"], name="modcompat_gender_mod_idx"),
+        ]
 
     def __str__(self):
         return f"{self.mod.title} - {self.race.name} - {self.gender.name if self.gender else None}"
 
 
 class Mod(models.Model):
-    uuid = models.UUIDField(default=uuid4, editable=False, unique=True, db_index=True)
-    title = models.CharField(max_length=120, db_index=True, validators=[MinLengthValidator(5), MaxLengthValidator(120)])
-    short_desc = models.TextField(
-        max_length=200, validators=[MinLengthValidator(0), MaxLengthValidator(200)], db_index=True
-    )
+    MAXIMUM_FILE_SIZE = 1073741824  # 1GB
+
+    uuid = models.UUIDField(default=uuid4, editable=False, unique=True)
+    title = models.CharField(max_length=120, validators=[MinLengthValidator(5), MaxLengthValidator(120)])
+    short_desc = models.TextField(max_length=200, validators=[MinLengthValidator(0), MaxLengthValidator(200)])
     description = models.TextField(max_length=1000, validators=[MinLengthValidator(0), MaxLengthValidator(1000)])
     version = models.CharField(
         max_length=25, default="1.0.0", validators=[MinLengthValidator(1), MaxLengthValidator(25)]
     )
     upload_date = models.DateTimeField(auto_now_add=True, editable=False)
     updated_date = models.DateTimeField(auto_now=True, null=True)
-    file = models.FileField(upload_to=get_mod_upload_path, db_index=True)
-    file_size = models.PositiveBigIntegerField(validators=[MinValueValidator(1), MaxValueValidator(1073741824)])
+    file = models.FileField(upload_to=get_mod_upload_path)
+    file_size = models.PositiveBigIntegerField(validators=[MinValueValidator(1), MaxValueValidator(MAXIMUM_FILE_SIZE)])
     user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=True)
-    downloads = models.PositiveBigIntegerField(default=0, db_index=True, validators=[MinValueValidator(0)])
+    downloads = models.PositiveBigIntegerField(default=0, validators=[MinValueValidator(0)])
     category = models.ForeignKey(Category, on_delete=models.CASCADE, db_index=True)
-    tags = models.ManyToManyField(Tag, related_name="mods", blank=True, db_index=True)
-    approved = models.BooleanField(default=False, db_index=True)
-    thumbnail = models.URLField(blank=True, null=True, validators=[URLValidator()], db_index=True)
+    tags = models.ManyToManyField(Tag, related_name="mods", blank=True)
+    approved = models.BooleanField(default=False)
+    thumbnail = models.URLField(blank=True, null=True, validators=[URLValidator()])
+
+    class Meta:
+        indexes = [
+            # Catalog reads only ever look at approved mods, so these indexes leave unapproved rows out
+            models.Index(fields=["id"], condition=models.Q(approved=True), name="mod_approved_idx"),
+            models.Index(fields=["category"], condition=models.Q(approved=True), name="mod_approved_category_idx"),
+            models.Index(fields=["user"], condition=models.Q(approved=True), name="mod_approved_user_idx"),
+            # Covers the batch update check so databases with index-only scans never touch the table
+            models.Index(fields=["uuid", "approved", "version", "updated_date"], name="mod_update_check_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         self.full_clean()  # Perform model field validations
@@ -147,10 +187,9 @@ class ModImage(models.Model):
     mod = models.ForeignKey(Mod, on_delete=models.CASCADE, db_index=True)
     image = models.ImageField(
         upload_to=get_image_upload_path,
-        db_index=True,
         validators=[FileExtensionValidator(allowed_extensions=ALLOWED_EXTENSIONS)],
     )
-    is_thumbnail = models.BooleanField(default=False, db_index=True)
+    is_thumbnail = models.BooleanField(default=False)
 
     def clean(self):
         """Validate the ModImage before saving."""
@@ -224,3 +263,191 @@ class Rating(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.rating_date}"
+
+
+class ModChange(models.Model):
+    ACTION_UPSERT = "upsert"
+    ACTION_DELETE = "delete"
+    ACTION_CHOICES = [
+        (ACTION_UPSERT, "Upsert"),
+        (ACTION_DELETE, "Delete"),
+    ]
+
+    # The auto-incrementing primary key doubles as the client's sync cursor
+    mod_uuid = models.UUIDField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    change_date = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.id} - {self.action} - {self.mod_uuid}"
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=255, unique=True)
+    # Rows are only needed until the token would have expired anyway
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.jti} - {self.expires_at}"
+
+
+class Job(models.Model):
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DEAD = "dead"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DEAD, "Dead"),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # Higher priorities are claimed first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    # Queued jobs with the same key are enqueued once
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "priority", "run_at"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedupe_key"],
+                condition=models.Q(status="queued"),
+                name="unique_queued_job_dedupe_key",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.id} - {self.name} - {self.status}"
+
+
+class GamePath(models.Model):
+    # Each path is stored once and mods refer to it by id, so a mod's index rows are just pairs of integers
+    path = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.path
+
+
+class ModGamePath(models.Model):
+    mod = models.ForeignKey(Mod, related_name="game_paths", on_delete=models.CASCADE, db_index=False)
+    game_path = models.ForeignKey(GamePath, on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["mod", "game_path"], name="unique_mod_game_path")]
+        # The inverted index from a path to the mods replacing it, which conflict checks read
+        indexes = [models.Index(fields=["game_path", "mod"], name="game_path_mods_idx")]
+
+    def __str__(self):
+        return f"{self.mod_id} - {self.game_path_id}"
+
+
+class ModManifest(models.Model):
+    mod = models.OneToOneField(Mod, related_name="manifest", on_delete=models.CASCADE)
+    # The file that was indexed, a new upload gets indexed again
+    file = models.CharField(max_length=255)
+    path_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    indexed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.mod_id} - {self.file}"
+
+
+class ModArchive(models.Model):
+    STATUS_VALID = "valid"
+    STATUS_INVALID = "invalid"
+    STATUS_CHOICES = [
+        (STATUS_VALID, "Valid"),
+        (STATUS_INVALID, "Invalid"),
+    ]
+
+    mod = models.OneToOneField(Mod, related_name="archive", on_delete=models.CASCADE)
+    # The file that was validated, a new upload is validated again
+    file = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    crc32 = models.PositiveBigIntegerField()
+    entry_count = models.PositiveIntegerField(default=0)
+    uncompressed_size = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    validated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.mod_id} - {self.file} - {self.status}"
+
+
+class ModFileVersion(models.Model):
+    """A validated file a mod has had, kept so updates can be served as deltas from it."""
+
+    mod = models.ForeignKey(Mod, related_name="file_versions", on_delete=models.CASCADE, db_index=False)
+    version = models.CharField(max_length=25)
+    file = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["mod", "file"], name="unique_mod_file_version")]
+
+    def __str__(self):
+        return f"{self.mod_id} - {self.version} - {self.file}"
+
+
+class ModFileDelta(models.Model):
+    STATUS_READY = "ready"
+    STATUS_SKIPPED = "skipped"
+    STATUS_CHOICES = [
+        (STATUS_READY, "Ready"),
+        (STATUS_SKIPPED, "Skipped"),
+    ]
+
+    source = models.ForeignKey(ModFileVersion, related_name="deltas_from", on_delete=models.CASCADE, db_index=False)
+    target = models.ForeignKey(ModFileVersion, related_name="deltas_to", on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    file = models.CharField(max_length=255, blank=True)
+    size = models.PositiveBigIntegerField(default=0)
+    # Why no delta was kept, e.g. it wasn't smaller than the file itself
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["source", "target"], name="unique_mod_file_delta")]
+
+    def __str__(self):
+        return f"{self.source_id} -> {self.target_id} - {self.status}"
+
+
+class CatalogSnapshot(models.Model):
+    """The state of the published static catalog, a single row."""
+
+    # The last change log entry the published shards reflect
+    cursor = models.PositiveBigIntegerField(default=0)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Catalog snapshot at {self.cursor}"
+
+
+class CatalogShard(models.Model):
+    # e.g. categories/3 or top/downloads
+    name = models.CharField(max_length=100, unique=True)
+    # Which mods the shard was built from, so a mod leaving it is known to affect it
+    mod_uuids = models.JSONField(default=list)
+    # [{"file": storage name, "sha256": ..., "count": mods on the page}, ...]
+    pages = models.JSONField(default=list)
+    published_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
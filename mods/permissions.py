@@ -1,21 +1,27 @@
+from django.http import Http404
 from rest_framework.permissions import BasePermission
 
+MODERATOR_ROLES = ("moderator", "admin")
+
+
+def is_moderator_or_admin(user):
+    return user.is_authenticated and user.role in MODERATOR_ROLES
+
 
 class IsModeratorOrAdmin(BasePermission):
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.role in ["moderator", "admin"]
+        return is_moderator_or_admin(request.user)
 
 
 class IsOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.user == request.user
+        # Comparing ids avoids loading the related user
+        return obj.user_id == request.user.pk
 
 
 class IsModeratorOrAdminOrOwner(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return request.user.is_authenticated and (
-            request.user.role in ["moderator", "admin"] or obj.user == request.user
-        )
+        return is_moderator_or_admin(request.user) or obj.user_id == request.user.pk
 
 
 class IsAdmin(BasePermission):
@@ -31,3 +37,30 @@ class IsModerator(BasePermission):
 class IsUser(BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.role == "user"
+
+
+class OwnerScopedObjectMixin:
+    """
+    Limits the lookup of users who aren't moderators or admins to objects they own, so the one query that fetches the
+    object also decides access. Only a denied lookup pays for a second query, to keep answering 403 rather than 404
+    for objects that exist but belong to someone else. `only_fields` narrows the columns fetched.
+    """
+
+    only_fields = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.only_fields:
+            queryset = queryset.only(*self.only_fields)
+        if not is_moderator_or_admin(self.request.user):
+            queryset = queryset.filter(user_id=self.request.user.pk)
+        return queryset
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            lookup = {self.lookup_field: self.kwargs[self.lookup_url_kwarg or self.lookup_field]}
+            if not is_moderator_or_admin(self.request.user) and self.queryset.filter(**lookup).exists():
+                self.permission_denied(self.request)
+            raise
@@ -0,0 +1,119 @@
+import cProfile
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+PROFILE_NAME = re.compile(r"^\d+-[\w.-]+\.prof$")
+
+# cProfile can only run one profiler at a time on newer Pythons, and one at a time bounds the overhead anyway
+_profiling = threading.Lock()
+
+
+def _requested_by_admin(request):
+    if settings.PROFILER_HEADER not in request.META:
+        return False
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except APIException:
+        return False
+    return user.is_authenticated and user.role == "admin"
+
+
+def should_profile(request):
+    """Profiles a sampled fraction of requests plus any request from an admin that sends the profiling header."""
+    if settings.PROFILER_SAMPLE_RATE and random.random() < settings.PROFILER_SAMPLE_RATE:
+        return True
+    return _requested_by_admin(request)
+
+
+def start_profiler():
+    """Starts profiling the current thread. Returns the profiler, or None if another profile is running."""
+    if not _profiling.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another tool, such as a coverage tracer, holds the profiling hook
+        _profiling.release()
+        return None
+    return profiler
+
+
+def stop_profiler(profiler):
+    profiler.disable()
+    _profiling.release()
+
+
+def save_profile(profiler, request, response, duration):
+    """Writes the profile and its metadata to PROFILER_DIR, keeping only the newest PROFILER_MAX_PROFILES."""
+    os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+    match = getattr(request, "resolver_match", None)
+    view = re.sub(r"[^\w.-]", "_", match.view_name if match else "unmatched")
+    name = f"{time.time_ns()}-{view}.prof"
+    path = os.path.join(settings.PROFILER_DIR, name)
+
+    profiler.dump_stats(path)
+    with open(f"{path}.json", "w") as file:
+        json.dump(
+            {
+                "name": name,
+                "view": view,
+                "method": request.method,
+                # Without the query string, which can carry tokens and other secrets
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 2),
+            },
+            file,
+        )
+
+    # Names start with a nanosecond timestamp, so sorting them sorts by age
+    for stale in list_profile_names()[: -settings.PROFILER_MAX_PROFILES]:
+        stale = os.path.join(settings.PROFILER_DIR, stale)
+        for stale_path in (stale, f"{stale}.json"):
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                # Another worker pruned it first
+                pass
+    return name
+
+
+def list_profile_names():
+    if not os.path.isdir(settings.PROFILER_DIR):
+        return []
+    return sorted(name for name in os.listdir(settings.PROFILER_DIR) if PROFILE_NAME.match(name))
+
+
+def profile_path(name):
+    """Returns the path of a stored profile, or None for names that aren't stored profiles."""
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(settings.PROFILER_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def list_profiles():
+    profiles = []
+    for name in reversed(list_profile_names()):
+        path = os.path.join(settings.PROFILER_DIR, name)
+        try:
+            size = os.path.getsize(path)
+            with open(f"{path}.json") as file:
+                metadata = json.load(file)
+        except (OSError, ValueError):
+            # Pruned by another worker while listing
+            continue
+        metadata["size"] = size
+        profiles.append(metadata)
+    return profiles
@@ -0,0 +1,62 @@
+import math
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised by installs without orjson
+    orjson = None
+
+_LINE_SEPARATOR = "\u2028".encode()
+_PARAGRAPH_SEPARATOR = "\u2029".encode()
+
+# orjson handles UUIDs and datetimes natively. Everything else DRF's encoder knows about (Decimal, lazy strings,
+# querysets, ...) goes through the same `default` DRF uses, so the output matches JSONRenderer.
+_drf_default = encoders.JSONEncoder().default
+
+
+def _has_non_finite(value):
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, Decimal):
+        return not value.is_finite()
+    if isinstance(value, dict):
+        return any(_has_non_finite(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_has_non_finite(item) for item in value)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    A drop-in JSONRenderer that encodes with orjson when it is installed. Output is byte-for-byte what JSONRenderer
+    produces, except for floats beyond 1e16 or below 1e-4, which orjson writes without exponent padding (`1e16` rather
+    than `1e+16`). Indented output, ASCII-only output and anything orjson can't encode, such as integers wider than
+    64 bits, fall back to JSONRenderer. So does data holding NaN or infinity, which orjson writes as null, so that
+    JSONRenderer rejects it under STRICT_JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=_drf_default,
+                option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Only output with a null can have had a non-finite number in it
+        if b"null" in ret and _has_non_finite(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Keep the output a strict JavaScript subset, as JSONRenderer does
+        if b"\xe2\x80" in ret:
+            ret = ret.replace(_LINE_SEPARATOR, b"\\u2028").replace(_PARAGRAPH_SEPARATOR, b"\\u2029")
+        return ret
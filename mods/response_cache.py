@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.response import Response
+
+from .cache import get_activity_version, get_catalog_version
+from .metrics import record_cache_lookup, record_compressed_response
+from .routers import read_from_primary
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - exercised by installs without brotli
+    brotli = None
+
+RESPONSE_CACHE_TIMEOUT = 300
+# Larger bodies aren't cached, each entry holds the body up to three times over
+RESPONSE_CACHE_MAX_SIZE = 1024 * 1024
+# Below this, compression saves less than the headers announcing it cost
+MIN_COMPRESSED_SIZE = 1024
+
+# Cache fills compress inside the request that missed, so the levels are the ones that stay fast there. Past them,
+# brotli and gzip take several times longer for a few percent smaller bodies.
+_COMPRESSORS = {"gzip": lambda body: gzip.compress(body, compresslevel=6, mtime=0)}
+if brotli is not None:
+    _COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+# Preferred first when a client accepts several equally
+_PREFERENCE = ("br", "gzip", "identity")
+
+
+def compress_variants(body):
+    """Returns the body under each encoding that makes it smaller, and as is under identity."""
+    bodies = {"identity": body}
+    if len(body) >= MIN_COMPRESSED_SIZE:
+        for encoding, compress in _COMPRESSORS.items():
+            compressed = compress(body)
+            if len(compressed) < len(body):
+                bodies[encoding] = compressed
+    return bodies
+
+
+def accepted_encodings(header):
+    """Parses an Accept-Encoding header into a mapping of encoding to quality."""
+    qualities = {}
+    for part in header.split(","):
+        encoding, *params = [item.strip() for item in part.split(";")]
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[encoding.lower()] = quality
+    return qualities
+
+
+def negotiate_encoding(header, available):
+    qualities = accepted_encodings(header or "")
+    default = qualities.get("*", 0.0)
+    # Identity is acceptable unless refused outright
+    qualities.setdefault("identity", default if "*" in qualities else 1.0)
+    best = max(
+        (encoding for encoding in _PREFERENCE if encoding in available),
+        key=lambda encoding: (qualities.get(encoding, default), -_PREFERENCE.index(encoding)),
+    )
+    return best if qualities.get(best, default) > 0 else "identity"
+
+
+def _send(response, entry, request):
+    encoding = negotiate_encoding(request.headers.get("Accept-Encoding"), entry["bodies"])
+    body = entry["bodies"][encoding]
+    response.content = body
+    if encoding != "identity":
+        response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept-Encoding"])
+
+    record_compressed_response(encoding, len(entry["bodies"]["identity"]) - len(body))
+    return response
+
+
+class CachedResponseMixin:
+    """
+    Caches the rendered JSON of successful GETs together with gzip and brotli variants of it, so repeated requests
+    skip the queries, the rendering and the compression and get the best encoding they accept. Entries are keyed by
+    the catalog version, which every change to a mod moves on, so they never outlive the data they were built from.
+    Comments, downloads and ratings only move the activity version, at most once a minute, and otherwise show up once
+    entries expire. Misses are read from the primary, so a lagging replica can't fill a new version with old data.
+    """
+
+    def get(self, request, *args, **kwargs):
+        self._response_cache_key = None
+        if getattr(request, "accepted_renderer", None) is None or request.accepted_renderer.format != "json":
+            return super().get(request, *args, **kwargs)
+
+        uri = hashlib.sha256(request.build_absolute_uri().encode()).hexdigest()
+        version = f"{get_catalog_version()}.{get_activity_version()}"
+        key = f"responses:{version}:{type(self).__name__}:{uri}"
+        entry = cache.get(key)
+        record_cache_lookup("response", entry is not None, entry is None)
+        if entry is None:
+            self._response_cache_key = key
+            with read_from_primary():
+                return super().get(request, *args, **kwargs)
+        return _send(HttpResponse(content_type=entry["content_type"]), entry, request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, "_response_cache_key", None)
+        if key is None or not isinstance(response, Response) or response.status_code != 200:
+            return response
+
+        response.render()
+        if len(response.content) > RESPONSE_CACHE_MAX_SIZE:
+            return response
+        entry = {"content_type": response["Content-Type"], "bodies": compress_variants(response.content)}
+        cache.set(key, entry, RESPONSE_CACHE_TIMEOUT)
+        return _send(response, entry, request)
@@ -0,0 +1,123 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter sized for `capacity` keys at the given false positive rate."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing derives all positions from one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """
+    This process's view of the revoked tokens: a Bloom filter of every unexpired revoked jti. It is built from the
+    database on first use and then catches up with rows other processes added, by primary key, at most once per
+    REVOCATION_SYNC_INTERVAL seconds. A negative answer needs no query; a positive one is confirmed by the database.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+            self._last_id = 0
+            self._synced = 0.0
+
+    def _rebuild(self):
+        self._filter = BloomFilter(settings.REVOCATION_BLOOM_CAPACITY, settings.REVOCATION_BLOOM_ERROR_RATE)
+        self._last_id = RevokedToken.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        for jti in RevokedToken.objects.filter(expires_at__gt=timezone.now(), id__lte=self._last_id).values_list(
+            "jti", flat=True
+        ):
+            self._filter.add(jti)
+        self._synced = time.monotonic()
+
+    def _sync(self):
+        if self._filter is None:
+            self._rebuild()
+            return
+        if time.monotonic() - self._synced < settings.REVOCATION_SYNC_INTERVAL:
+            return
+        for row_id, jti in RevokedToken.objects.filter(id__gt=self._last_id).order_by("id").values_list("id", "jti"):
+            self._filter.add(jti)
+            self._last_id = row_id
+        self._synced = time.monotonic()
+        if self._filter.count > self._filter.capacity:
+            # Expired jtis can't be removed from a Bloom filter, so start over once it is full
+            self._rebuild()
+
+    def add(self, jti):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def might_contain(self, jti):
+        with self._lock:
+            self._sync()
+            return jti in self._filter
+
+
+revocations = RevocationList()
+
+
+def revoke_token(token):
+    """
+    Revokes the token. Returns False when it already was, so of several requests revoking the same token at once,
+    whichever insert lands first is the only one to get True, in this process or any other.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=jti, expires_at=datetime_from_epoch(token["exp"]))
+    except IntegrityError:
+        return False
+    finally:
+        revocations.add(jti)
+    return True
+
+
+def is_token_revoked(token):
+    """
+    Checks a token that isn't being revoked. The filter can lag behind other processes by REVOCATION_SYNC_INTERVAL,
+    so anything that must not let a token through twice should go by revoke_token() instead.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    return revocations.might_contain(jti) and RevokedToken.objects.filter(jti=jti).exists()
+
+
+def purge_expired_revocations():
+    deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -0,0 +1,90 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+_read_alias = ContextVar("read_alias", default=None)
+_wrote_to_primary = ContextVar("wrote_to_primary", default=False)
+
+
+def _sticky_cache_key(user_id):
+    return f"mods:db-sticky:{user_id}"
+
+
+def choose_replica():
+    return random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None
+
+
+def pin_user_to_primary(user):
+    """Keeps the user's reads on the primary for a short while so they see their own writes."""
+    if user is not None and user.is_authenticated:
+        cache.set(_sticky_cache_key(user.pk), True, settings.REPLICA_STICKINESS_SECONDS)
+
+
+def is_pinned_to_primary(user):
+    return user.is_authenticated and cache.get(_sticky_cache_key(user.pk)) is not None
+
+
+def route_reads_to(alias):
+    return _read_alias.set(alias)
+
+
+def reset_read_routing(token):
+    _read_alias.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Sends the reads inside the block to the primary. Used for anything cached past the request, since a lagging
+    replica would put back data the primary has already invalidated.
+    """
+    token = route_reads_to(None)
+    try:
+        yield
+    finally:
+        reset_read_routing(token)
+
+
+def start_write_tracking():
+    return _wrote_to_primary.set(False)
+
+
+def stop_write_tracking(token):
+    """Returns whether anything was written to the primary since tracking started."""
+    wrote = _wrote_to_primary.get()
+    _wrote_to_primary.reset(token)
+    return wrote
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # None falls through to the primary
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        _wrote_to_primary.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaReadMixin:
+    """Routes a read-only view's queries to a replica unless the user has written recently."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not is_pinned_to_primary(request.user):
+            self._read_routing_token = route_reads_to(choose_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_read_routing_token", None)
+        if token is not None:
+            reset_read_routing(token)
+            self._read_routing_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
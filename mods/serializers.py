@@ -1,11 +1,24 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.utils import timezone
 
-from .models import Mod, ModCompatibility, Tag, Race, Gender, Download, Rating, Comment
+from .authentication import add_user_claims
+from .cache import invalidate_mod_details
+from .changes import CHANGE_FEED_DEFAULT_LIMIT, CHANGE_FEED_MAX_LIMIT, record_mod_change
+from .models import Mod, ModArchive, ModCompatibility, Tag, Race, Gender, Download, Rating, Comment
+from .revocation import is_token_revoked, revoke_token
 
 User = get_user_model()
 
+MOD_UPDATE_CHECK_MAX_ENTRIES = 500
+MOD_BULK_FETCH_MAX_ENTRIES = 100
+AUTOCOMPLETE_MAX_LIMIT = 20
+
 
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -33,6 +46,8 @@ class ModSerializer(serializers.ModelSerializer):
     class Meta:
         model = Mod
         fields = "__all__"
+        # Only moderators approve, through the approval endpoint once the archive has passed validation
+        read_only_fields = ["approved"]
 
     def create(self, validated_data):
         category = validated_data.pop("category", None)
@@ -56,6 +71,38 @@ class ModSerializer(serializers.ModelSerializer):
 
         return mod
 
+    def update(self, instance, validated_data):
+        # A new file hasn't been validated, so it goes back through moderation
+        if "file" in validated_data and instance.file != validated_data["file"]:
+            instance.approved = False
+        return super().update(instance, validated_data)
+
+
+class ModApprovalSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Mod
+        fields = ["uuid", "approved", "updated_date"]
+        read_only_fields = ["uuid", "updated_date"]
+
+    def validate_approved(self, value):
+        if (
+            value
+            and not ModArchive.objects.filter(
+                mod_id=self.instance.pk, file=F("mod__file"), status=ModArchive.STATUS_VALID
+            ).exists()
+        ):
+            raise serializers.ValidationError("Only mods whose current archive passed validation can be approved.")
+        return value
+
+    def update(self, instance, validated_data):
+        # Approval only flips one flag, so a single UPDATE replaces Mod.save() and its validation queries
+        instance.approved = validated_data.get("approved", instance.approved)
+        instance.updated_date = timezone.now()
+        Mod.objects.filter(pk=instance.pk).update(approved=instance.approved, updated_date=instance.updated_date)
+        invalidate_mod_details([instance.uuid])
+        record_mod_change(instance.uuid, instance.approved)
+        return instance
+
 
 class ModCatalogCardSerializer(serializers.ModelSerializer):
     class Meta:
@@ -63,6 +110,37 @@ class ModCatalogCardSerializer(serializers.ModelSerializer):
         fields = ["title", "short_desc", "thumbnail", "category", "downloads", "upload_date", "updated_date", "user"]
 
 
+class AutocompleteQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=100, trim_whitespace=True)
+    limit = serializers.IntegerField(min_value=1, max_value=AUTOCOMPLETE_MAX_LIMIT, default=10)
+
+
+class ModChangeFeedQuerySerializer(serializers.Serializer):
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=CHANGE_FEED_MAX_LIMIT, default=CHANGE_FEED_DEFAULT_LIMIT)
+
+
+class ModUpdateCheckEntrySerializer(serializers.Serializer):
+    uuid = serializers.UUIDField()
+    version = serializers.CharField(max_length=25, required=False)
+    updated_date = serializers.DateTimeField(required=False)
+
+    def validate(self, attrs):
+        if "version" not in attrs and "updated_date" not in attrs:
+            raise serializers.ValidationError("Either version or updated_date is required.")
+        return attrs
+
+
+class ModUpdateCheckSerializer(serializers.Serializer):
+    mods = ModUpdateCheckEntrySerializer(many=True, allow_empty=False, max_length=MOD_UPDATE_CHECK_MAX_ENTRIES)
+
+
+class ModBulkFetchSerializer(serializers.Serializer):
+    uuids = serializers.ListField(
+        child=serializers.UUIDField(), allow_empty=False, max_length=MOD_BULK_FETCH_MAX_ENTRIES
+    )
+
+
 class ModCompatibilitySerializer(serializers.ModelSerializer):
     class Meta:
         model = ModCompatibility
@@ -97,3 +175,31 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             username=validated_data["username"], email=validated_data["email"], password=validated_data["password"]
         )
         return user
+
+
+class ModTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class ModTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            # The revoking insert is the check, so concurrent refreshes with the same token can't both succeed
+            if not revoke_token(refresh):
+                raise TokenError("Token is blacklisted")
+        elif is_token_revoked(refresh):
+            raise TokenError("Token is blacklisted")
+
+        data = {"access": str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+
+            data["refresh"] = str(refresh)
+
+        return data
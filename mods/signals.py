@@ -0,0 +1,129 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import evict_cached_user
+from .autocomplete import autocomplete
+from .cache import invalidate_mod_details
+from .changes import record_mod_change, record_mod_changes, record_mod_deleted
+from .db import apply_sqlite_pragmas
+from .jobs import enqueue
+from .models import (
+    Comment,
+    Download,
+    Mod,
+    ModArchive,
+    ModCompatibility,
+    ModFileVersion,
+    ModManifest,
+    Rating,
+    Tag,
+    User,
+)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor == "sqlite":
+        apply_sqlite_pragmas(connection)
+
+
+@receiver(post_save, sender=Mod)
+def log_mod_saved(sender, instance, created, **kwargs):
+    invalidate_mod_details([instance.uuid])
+    if created and not instance.approved:
+        # Nothing to tell clients about until the mod is approved
+        return
+    record_mod_change(instance.uuid, instance.approved)
+
+
+@receiver(pre_save, sender=Mod)
+def note_mod_file_upload(sender, instance, **kwargs):
+    # The file is stored during the save, after which a new upload can't be told from the old file
+    instance._file_uploaded = bool(instance.file) and not instance.file._committed
+
+
+@receiver(post_save, sender=Mod)
+def process_mod_file(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and "file" not in update_fields:
+        return
+    if getattr(instance, "_file_uploaded", False):
+        # Storage that overwrites keeps the name of the file it replaced, so results for that name are stale
+        ModArchive.objects.filter(mod=instance).delete()
+        ModManifest.objects.filter(mod=instance).delete()
+        ModFileVersion.objects.filter(mod=instance, file=instance.file.name).delete()
+    # The job skips files it has already handled, so saves that keep the same file cost next to nothing. Validation
+    # gates moderation, and queues the manifest's indexing once the archive has passed its limits.
+    enqueue(
+        "validate_mod_archive", {"mod_id": instance.pk}, priority=5, dedupe_key=f"validate_mod_archive:{instance.pk}"
+    )
+
+
+@receiver(post_delete, sender=Mod)
+def log_mod_deleted(sender, instance, **kwargs):
+    invalidate_mod_details([instance.uuid])
+    record_mod_deleted(instance.uuid)
+
+
+@receiver(post_save, sender=ModCompatibility)
+@receiver(post_delete, sender=ModCompatibility)
+def log_mod_compatibility_changed(sender, instance, **kwargs):
+    # The mod row is already gone when compatibility is removed by a cascading delete
+    record_mod_changes(Mod.objects.filter(pk=instance.mod_id).values_list("uuid", "approved"))
+
+
+@receiver(m2m_changed, sender=Mod.tags.through)
+def log_mod_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if action != "pre_clear" and not pk_set:
+        return
+
+    if not reverse:
+        if action != "pre_clear" or instance.tags.exists():
+            invalidate_mod_details([instance.uuid])
+            record_mod_change(instance.uuid, instance.approved)
+        return
+
+    # Reverse changes come from a tag, so every affected mod needs an entry
+    mods = instance.mods.all() if action == "pre_clear" else Mod.objects.filter(pk__in=pk_set)
+    rows = list(mods.values_list("uuid", "approved"))
+    invalidate_mod_details([mod_uuid for mod_uuid, _ in rows])
+    record_mod_changes(rows)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Download)
+@receiver(post_delete, sender=Download)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=Rating)
+def invalidate_mod_activity(sender, instance, **kwargs):
+    # Comments, downloads and ratings are nested in the cached mod details
+    invalidate_mod_details(Mod.objects.filter(pk=instance.mod_id).values_list("uuid", flat=True), activity=True)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_authenticated_user(sender, instance, **kwargs):
+    evict_cached_user(instance)
+
+
+@receiver(post_save, sender=Mod)
+@receiver(post_delete, sender=Mod)
+@receiver(m2m_changed, sender=Mod.tags.through)
+def refresh_autocomplete(sender, **kwargs):
+    # Mod changes are in the change log, which this process's index applies on its next lookup
+    autocomplete.mark_stale()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def rebuild_autocomplete(sender, instance, signal, **kwargs):
+    # Renames aren't logged as mod changes, so only a rebuild picks them up
+    if sender is Tag:
+        autocomplete.mark_renamed("tags", instance.pk, instance.name if signal is post_save else None)
+    else:
+        autocomplete.mark_renamed("users", instance.pk, instance.username if signal is post_save else None)
@@ -0,0 +1,173 @@
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .changes import get_latest_cursor
+from .fast_serializers import RELATED_CHUNK_SIZE, serialize_mods
+from .models import CatalogShard, CatalogSnapshot, Mod, ModChange, ModCompatibility
+from .renderers import FastJSONRenderer
+from .response_cache import compress_variants
+
+SNAPSHOT_FIELDS = (
+    "uuid",
+    "title",
+    "short_desc",
+    "version",
+    "thumbnail",
+    "category",
+    "tags",
+    "downloads",
+    "user",
+    "upload_date",
+    "updated_date",
+)
+# Rebuilt on every publish, since downloads reorder them without logging a change
+TOP_SHARDS = {"top/downloads": ("-downloads", "-id"), "top/recent": ("-upload_date", "-id")}
+_SUFFIXES = {"identity": "", "gzip": ".gz", "br": ".br"}
+
+_renderer = FastJSONRenderer()
+
+
+def _shard_mods(name):
+    kind, key = name.split("/")
+    approved = Mod.objects.filter(approved=True)
+    if kind == "top":
+        size = settings.CATALOG_SNAPSHOT_TOP_SIZE
+        return approved.order_by(*TOP_SHARDS[name])[:size]
+    if kind == "categories":
+        return approved.filter(category_id=key).order_by("-id")
+    compatible = ModCompatibility.objects.filter(**{"race_id" if kind == "races" else "gender_id": key})
+    return approved.filter(id__in=compatible.values("mod_id")).order_by("-id")
+
+
+def _shards_of(mods):
+    """Returns the category, race and gender shards the approved mods among `mods` belong in."""
+    mods = mods.filter(approved=True)
+    names = {f"categories/{category_id}" for category_id in mods.values_list("category_id", flat=True).distinct()}
+    for race_id, gender_id in (
+        ModCompatibility.objects.filter(mod__in=mods).values_list("race_id", "gender_id").distinct()
+    ):
+        names.add(f"races/{race_id}")
+        if gender_id is not None:
+            names.add(f"genders/{gender_id}")
+    return names
+
+
+def _replace(storage, name, content):
+    """Writes over a file without deleting it first, so clients never find it missing in between."""
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Object stores replace a whole object on upload, unless configured to keep both
+        if storage.save(name, content) != name:
+            storage.delete(name)
+            storage.save(name, content)
+        return
+    # Written beside it, then renamed over it in one step
+    os.replace(storage.path(storage.save(f"{name}.tmp", content)), path)
+
+
+def _save_variants(storage, name, body, overwrite=False):
+    variants = compress_variants(body)
+    for encoding, suffix in _SUFFIXES.items():
+        if encoding not in variants:
+            if overwrite:
+                storage.delete(name + suffix)
+        elif overwrite:
+            _replace(storage, name + suffix, ContentFile(variants[encoding]))
+        elif not storage.exists(name + suffix):
+            storage.save(name + suffix, ContentFile(variants[encoding]))
+
+
+def _delete_variants(storage, name):
+    for suffix in _SUFFIXES.values():
+        storage.delete(name + suffix)
+
+
+def _build_shard(storage, name):
+    """Writes a shard's pages, named by their content so unchanged pages are neither uploaded nor re-cached."""
+    rows = list(_shard_mods(name).values_list("id", "uuid"))
+    pages = []
+    for index, start in enumerate(range(0, len(rows), settings.CATALOG_SNAPSHOT_PAGE_SIZE)):
+        end = start + settings.CATALOG_SNAPSHOT_PAGE_SIZE
+        chunk = rows[start:end]
+        position = {str(mod_uuid): offset for offset, (_, mod_uuid) in enumerate(chunk)}
+        mods = serialize_mods(Mod.objects.filter(id__in=[mod_id for mod_id, _ in chunk]), None, SNAPSHOT_FIELDS)
+        mods.sort(key=lambda mod: position[mod["uuid"]])
+
+        body = _renderer.render({"shard": name, "page": index, "mods": mods})
+        sha256 = hashlib.sha256(body).hexdigest()
+        file = f"{settings.CATALOG_SNAPSHOT_PREFIX}/{name}/{index}.{sha256[:16]}.json"
+        _save_variants(storage, file, body)
+        pages.append({"file": file, "sha256": sha256, "count": len(chunk)})
+    return [str(mod_uuid) for _, mod_uuid in rows], pages
+
+
+def publish_catalog_snapshot(full=False, storage=default_storage):
+    """
+    Publishes the shards affected by the changes logged since the last publish, or every shard when `full` is set,
+    followed by index.json, which lists each shard's pages. Returns the names of the shards that were rebuilt.
+    """
+    snapshot, _ = CatalogSnapshot.objects.get_or_create(pk=1)
+    cursor = get_latest_cursor()
+    shards = {shard.name: shard for shard in CatalogShard.objects.all()}
+
+    if full or snapshot.published_at is None:
+        names = _shards_of(Mod.objects.all()) | set(shards)
+    else:
+        changed = {
+            str(mod_uuid)
+            for mod_uuid in ModChange.objects.filter(id__gt=snapshot.cursor, id__lte=cursor)
+            .values_list("mod_uuid", flat=True)
+            .distinct()
+        }
+        # Shards a mod has left are found from what they were built from, the ones it's in now from the database
+        names = {name for name, shard in shards.items() if not changed.isdisjoint(shard.mod_uuids)}
+        changed = list(changed)
+        for start in range(0, len(changed), RELATED_CHUNK_SIZE):
+            end = start + RELATED_CHUNK_SIZE
+            names |= _shards_of(Mod.objects.filter(uuid__in=changed[start:end]))
+    names |= set(TOP_SHARDS)
+
+    stale = []
+    for name in sorted(names):
+        mod_uuids, pages = _build_shard(storage, name)
+        shard = shards.get(name)
+        if shard is not None:
+            files = {page["file"] for page in pages}
+            stale.extend(page["file"] for page in shard.pages if page["file"] not in files)
+        if not pages and name not in TOP_SHARDS:
+            if shard is not None:
+                shard.delete()
+                del shards[name]
+            continue
+        if shard is None:
+            shard = shards[name] = CatalogShard(name=name)
+        shard.mod_uuids, shard.pages = mod_uuids, pages
+        shard.save()
+
+    now = timezone.now()
+    index = {
+        "cursor": cursor,
+        "generated_at": now,
+        "shards": {
+            name: {
+                "count": len(shard.mod_uuids),
+                "pages": [{"url": storage.url(page["file"]), "count": page["count"]} for page in shard.pages],
+            }
+            for name, shard in sorted(shards.items())
+        },
+    }
+    _save_variants(storage, f"{settings.CATALOG_SNAPSHOT_PREFIX}/index.json", _renderer.render(index), overwrite=True)
+    # Only once the index no longer points at them, clients holding an older index refetch it on a miss
+    for file in stale:
+        _delete_variants(storage, file)
+
+    snapshot.cursor = cursor
+    snapshot.published_at = now
+    snapshot.save()
+    return sorted(names)
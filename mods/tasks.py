@@ -0,0 +1,170 @@
+from django.conf import settings
+from django.contrib.auth.forms import PasswordResetForm
+from django.contrib.auth.tokens import default_token_generator
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .cache import invalidate_mod_details
+from .conflicts import store_game_paths
+from .deltas import block_size_for, build_delta
+from .jobs import enqueue, job
+from .manifest import ManifestError, open_archive, read_game_paths
+from .models import (
+    _USER_UPLOADED_MODS_PATH,
+    Mod,
+    ModArchive,
+    ModFileDelta,
+    ModFileVersion,
+    ModImage,
+    ModManifest,
+    User,
+)
+from .snapshots import publish_catalog_snapshot as publish_snapshot
+from .validation import run_on_pool, validate_stored_file
+
+
+@job("delete_mod_files")
+def delete_mod_files(mod_ids):
+    """Deletes the files and images of rejected mods, keeping their metadata."""
+    # Mods approved again since they were rejected keep their files
+    for mod in Mod.objects.filter(id__in=mod_ids, approved=False).only("id", "file"):
+        if mod.file:
+            mod.file.delete(save=False)
+
+    images = ModImage.objects.filter(mod_id__in=mod_ids, mod__approved=False)
+    for image in images:
+        image.image.delete(save=False)
+    images.delete()
+
+
+@job("send_password_reset_email")
+def send_password_reset_email(
+    user_id,
+    domain,
+    site_name,
+    use_https,
+    subject_template_name,
+    email_template_name,
+    html_email_template_name=None,
+    from_email=None,
+    extra_email_context=None,
+):
+    """Makes the reset token and renders the email here, so the reset link only ever exists in the email itself."""
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    # Deactivated, or its password was made unusable, since the reset was requested
+    if user is None or not user.has_usable_password():
+        return
+    email = getattr(user, User.get_email_field_name())
+    context = {
+        "email": email,
+        "domain": domain,
+        "site_name": site_name,
+        "uid": urlsafe_base64_encode(force_bytes(user.pk)),
+        "user": user,
+        "token": default_token_generator.make_token(user),
+        "protocol": "https" if use_https else "http",
+        **(extra_email_context or {}),
+    }
+    PasswordResetForm().send_mail(
+        subject_template_name, email_template_name, context, from_email, email, html_email_template_name
+    )
+
+
+@job("index_mod_manifest")
+def index_mod_manifest(mod_id):
+    """
+    Indexes the game paths a mod's archive replaces, unless its current file is already indexed. Queued by validation,
+    so only archives that passed its limits are ever opened here.
+    """
+    mod = Mod.objects.filter(pk=mod_id).only("id", "file").first()
+    if mod is None or not mod.file or ModManifest.objects.filter(mod=mod, file=mod.file.name).exists():
+        return
+    if not ModArchive.objects.filter(mod=mod, file=mod.file.name, status=ModArchive.STATUS_VALID).exists():
+        return
+    try:
+        with open_archive(mod.file.storage, mod.file.name) as file:
+            paths = read_game_paths(
+                file, settings.ARCHIVE_MAX_UNCOMPRESSED_SIZE, settings.ARCHIVE_MAX_COMPRESSION_RATIO
+            )
+    except ManifestError as exc:
+        # Retrying won't make a broken archive readable, storage errors are left to raise and be retried
+        store_game_paths(mod, [], error=str(exc))
+        return
+    store_game_paths(mod, paths)
+
+
+@job("validate_mod_archive")
+def validate_mod_archive(mod_id):
+    """Hashes and checks a mod's uploaded archive, unless its current file has already been validated."""
+    mod = Mod.objects.filter(pk=mod_id).only("id", "uuid", "file", "file_size", "version").first()
+    if mod is None or not mod.file or ModArchive.objects.filter(mod=mod, file=mod.file.name).exists():
+        return
+
+    result = validate_stored_file(mod.file)
+    if not result["error"] and result["size"] > Mod.MAXIMUM_FILE_SIZE:
+        result["error"] = "Archive is larger than mods may be"
+    status = ModArchive.STATUS_INVALID if result["error"] else ModArchive.STATUS_VALID
+    ModArchive.objects.update_or_create(mod=mod, defaults={"file": mod.file.name, "status": status, **result})
+
+    # The uploader's file_size is only a claim, the stored size is the truth
+    if status == ModArchive.STATUS_VALID and result["size"] != mod.file_size:
+        Mod.objects.filter(pk=mod.pk, file=mod.file.name).update(file_size=result["size"])
+        invalidate_mod_details([mod.uuid])
+
+    if status == ModArchive.STATUS_VALID:
+        record_file_version(mod, result["size"], result["sha256"])
+        enqueue("index_mod_manifest", {"mod_id": mod.pk}, dedupe_key=f"index_mod_manifest:{mod.pk}")
+    else:
+        # Archives that failed validation are never opened for their manifest
+        store_game_paths(mod, [], error=result["error"])
+
+
+def record_file_version(mod, size, sha256):
+    """Keeps a validated file in the mod's history and queues the delta from the version before it."""
+    version, created = ModFileVersion.objects.get_or_create(
+        mod=mod, file=mod.file.name, defaults={"version": mod.version, "size": size, "sha256": sha256}
+    )
+    if not created:
+        return
+    previous = ModFileVersion.objects.filter(mod=mod, id__lt=version.id).order_by("-id").first()
+    if previous is not None:
+        enqueue(
+            "build_mod_delta",
+            {"source_id": previous.id, "target_id": version.id},
+            dedupe_key=f"build_mod_delta:{previous.id}:{version.id}",
+        )
+
+
+@job("build_mod_delta", lock_timeout=settings.MOD_DELTA_LOCK_TIMEOUT)
+def build_mod_delta(source_id, target_id):
+    """Builds the delta from one version of a mod's file to the next, keeping it only when it's worth downloading."""
+    versions = ModFileVersion.objects.select_related("mod").in_bulk([source_id, target_id])
+    source, target = versions.get(source_id), versions.get(target_id)
+    if source is None or target is None or ModFileDelta.objects.filter(source=source, target=target).exists():
+        return
+
+    output_name = f"{_USER_UPLOADED_MODS_PATH}/{target.mod.uuid}/deltas/{source.id}-{target.id}.delta"
+    # Unmatched bytes are scanned one at a time and all end up in the delta, so its size also bounds the build's time
+    max_size = min(int(target.size * settings.MOD_DELTA_MAX_RATIO), settings.MOD_DELTA_MAX_SIZE)
+    try:
+        result = run_on_pool(
+            build_delta,
+            source.file,
+            target.file,
+            output_name,
+            block_size_for(target.size, settings.MOD_DELTA_BLOCK_SIZE),
+            max_size,
+            source.sha256,
+            target.sha256,
+            target.size,
+        )
+    except FileNotFoundError:
+        # The old file was deleted, e.g. with a rejected mod
+        result = {"file": "", "size": 0, "error": "Source file no longer exists"}
+    status = ModFileDelta.STATUS_READY if result["file"] else ModFileDelta.STATUS_SKIPPED
+    ModFileDelta.objects.create(source=source, target=target, status=status, **result)
+
+
+@job("publish_catalog_snapshot")
+def publish_catalog_snapshot():
+    publish_snapshot()
@@ -1,28 +1,96 @@
+import gzip
+import hashlib
 import io
+import json
 import os
+import pstats
+import re
 import random
 import uuid
+import zipfile
+import zlib
 import time
 import shutil
+import threading
+import unittest
+from collections import OrderedDict
+from datetime import date, datetime, time as datetime_time, timedelta, timezone as datetime_timezone
+from decimal import Decimal
+from unittest import mock
+import tempfile
 from urllib.parse import urlparse
 from os.path import basename
 
+from django.conf import settings
+from django.contrib import admin
 from django.core import mail
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
+from .catalog import iter_catalog_records
 from .models import Comment, Download, Rating
 
 from django.contrib.auth import get_user_model
-from django.db import IntegrityError, transaction
-from django.test import TestCase
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
 from rest_framework import status
-from rest_framework.test import APITestCase
-
-from .models import Category, Gender, Mod, ModCompatibility, ModImage, Race, Tag
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+
+from .models import (
+    CatalogShard,
+    Category,
+    Gender,
+    Job,
+    Mod,
+    ModArchive,
+    ModChange,
+    ModCompatibility,
+    ModFileDelta,
+    ModFileVersion,
+    ModImage,
+    ModManifest,
+    Race,
+    RevokedToken,
+    Tag,
+)
 from .models import _USER_UPLOADED_MODS_PATH
+from .admin import ModAdmin
+from .authentication import user_cache
+from .cache import _ACTIVITY_THROTTLE_KEY, get_catalog_version, warn_if_cache_is_not_shared
+from .autocomplete import PrefixIndex, autocomplete
+from .db import retry_on_database_locked
+from .fast_serializers import serialize_mod_cards, serialize_mods
+from .conflicts import find_conflicts
+from .deltas import DeltaError, apply_delta, block_size_for, write_delta
+from .jobs import claim_jobs, enqueue, job, requeue_stale_jobs, run_job, run_pending
+from .manifest import ManifestError, RangedFile, read_game_paths
+from .metrics import query_shape, registry
+from .modpack import Modpack, ModpackEntry
+from .validation import validate_archive, validate_stored_file
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .response_cache import negotiate_encoding
+from .revocation import BloomFilter, revocations, revoke_token
+from .snapshots import publish_catalog_snapshot
+from .routers import PrimaryReplicaRouter, reset_read_routing, route_reads_to
+from .serializers import (
+    MOD_BULK_FETCH_MAX_ENTRIES,
+    MOD_UPDATE_CHECK_MAX_ENTRIES,
+    ModCatalogCardSerializer,
+    ModSerializer,
+)
 
 User = get_user_model()
 
@@ -828,6 +896,27 @@ class ModAPITests(APITestCase):
         self.mod.refresh_from_db()
         self.assertEqual(self.mod.title, "Updated Mod")
 
+    def test_owners_cannot_approve_their_own_mods(self):
+        self.mod.approved = False
+        self.mod.save()
+        response = self.client.patch(reverse("update", kwargs={"uuid": self.mod.uuid}), {"approved": True})
+        self.assertEqual(response.status_code, 200)
+        self.mod.refresh_from_db()
+        self.assertFalse(self.mod.approved)
+
+    def test_replacing_the_file_unapproves_the_mod(self):
+        url = reverse("update", kwargs={"uuid": self.mod.uuid})
+        response = self.client.patch(url, {"title": "Renamed"}, format="multipart")
+        self.assertEqual(response.status_code, 200)
+        self.mod.refresh_from_db()
+        self.assertTrue(self.mod.approved)
+
+        file = SimpleUploadedFile("other.zip", b"other_content", content_type="application/zip")
+        response = self.client.patch(url, {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, 200)
+        self.mod.refresh_from_db()
+        self.assertFalse(self.mod.approved)
+
     def test_mod_delete_api_view_deletes_mod(self):
         url = reverse("delete", kwargs={"uuid": self.mod.uuid})
         response = self.client.delete(url)
@@ -1108,7 +1197,10 @@ class ModIntegrationTests(APITestCase):
         }
         response = self.client.post(create_url, mod_data, format="multipart")
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(response.data["approved"])
         mod_uuid = response.data["uuid"]
+        # A moderator approves it
+        Mod.objects.filter(uuid=mod_uuid).update(approved=True)
 
         # 2. Retrieve the mod details
         detail_url = reverse("detail", kwargs={"uuid": mod_uuid})
@@ -1131,6 +1223,8 @@ class ModIntegrationTests(APITestCase):
         response = self.client.put(update_url, updated_data, format="multipart")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["title"], "Updated Mod")
+        # The new file goes back through moderation
+        self.assertFalse(response.data["approved"])
 
         # 4. Delete the mod
         delete_url = reverse("delete", kwargs={"uuid": mod_uuid})
@@ -1166,6 +1260,15 @@ class ModApprovalAPITests(APITestCase):
             file="path/to/file.zip",
             category=Category.objects.create(name="Test Category"),
         )
+        # Only mods whose archive passed validation can be approved
+        ModArchive.objects.create(
+            mod=self.mod,
+            file=self.mod.file.name,
+            status=ModArchive.STATUS_VALID,
+            size=1000000,
+            sha256="0" * 64,
+            crc32=0,
+        )
         self.url = reverse("approve", kwargs={"uuid": self.mod.uuid})
 
     def test_allows_moderator_to_approve_mod(self):
@@ -1173,6 +1276,7 @@ class ModApprovalAPITests(APITestCase):
         self.mod.refresh_from_db()
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(self.mod.approved)
+        self.assertEqual(response.data, ModSerializer(self.mod, context={"request": response.wsgi_request}).data)
 
     def test_allows_moderator_to_disapprove_mod(self):
         self.mod.approved = True
@@ -1182,6 +1286,18 @@ class ModApprovalAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertFalse(self.mod.approved)
 
+    def test_refuses_to_approve_mod_without_a_valid_archive(self):
+        ModArchive.objects.filter(mod=self.mod).update(status=ModArchive.STATUS_INVALID)
+        response = self.client.patch(self.url, {"approved": True}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # An archive validated for a previous upload doesn't count either
+        ModArchive.objects.filter(mod=self.mod).update(status=ModArchive.STATUS_VALID, file="path/to/old.zip")
+        response = self.client.patch(self.url, {"approved": True}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.mod.refresh_from_db()
+        self.assertFalse(self.mod.approved)
+
     def test_returns_404_if_mod_not_found(self):
         url = reverse("approve", kwargs={"uuid": "00000000-0000-0000-0000-000000000000"})
         response = self.client.patch(url, {"approved": True}, format="json")
@@ -1328,5 +1444,2191 @@ class PasswordResetTests(TestCase):
     def test_password_reset_email(self):
         response = self.client.post(reverse("password_reset"), {"email": self.user.email})
         self.assertEqual(response.status_code, 302)
+        # The email is sent by a background job rather than during the request
+        self.assertEqual(len(mail.outbox), 0)
+        # Only the user and how to build the link are queued, never the token
+        self.assertEqual(Job.objects.get().payload["user_id"], self.user.pk)
+        self.assertNotIn("reset/", json.dumps(Job.objects.get().payload))
+        self.assertEqual(run_pending(), 1)
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn("test@example.com", mail.outbox[0].to)
+
+        link = re.search(r"https?://[^/]+(/reset/\S+/)", mail.outbox[0].body).group(1)
+        response = self.client.get(link, follow=True)
+        self.assertTemplateUsed(response, "registration/password_reset_confirm.html")
+        self.assertTrue(response.context["validlink"])
+
+    def test_job_admin_hides_payloads(self):
+        admin_user = User.objects.create_superuser(username="admin", email="admin@example.com", password="password123")
+        self.client.force_login(admin_user)
+        enqueue("send_password_reset_email", {"user_id": self.user.pk})
+        response = self.client.get(reverse("admin:mods_job_change", args=[Job.objects.get().pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("payload", response.context["adminform"].form.fields)
+
+
+class ModCatalogExportTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+
+        self.category = Category.objects.create(name="Test Category")
+        self.tag = Tag.objects.create(name="Test Tag")
+        self.race = Race.objects.create(name="Test Race")
+        self.gender = Gender.objects.create(name="Test Gender")
+
+        self.mods = []
+        for index in range(3):
+            mod = Mod.objects.create(
+                title=f"Test Mod {index}",
+                short_desc="Short description",
+                description="Long description",
+                version="1.0.0",
+                file_size=1000000,
+                user=self.user,
+                approved=True,
+                file="path/to/file.zip",
+                category=self.category,
+            )
+            mod.tags.add(self.tag)
+            ModCompatibility.objects.create(mod=mod, race=self.race, gender=self.gender)
+            self.mods.append(mod)
+
+        Mod.objects.create(
+            title="Unapproved Mod",
+            short_desc="Short description",
+            description="Long description",
+            file_size=1000000,
+            user=self.user,
+            approved=False,
+            file="path/to/file.zip",
+            category=self.category,
+        )
+
+    def _read_ndjson(self, data):
+        return [json.loads(line) for line in gzip.decompress(data).decode("utf-8").splitlines()]
+
+    def test_export_streams_approved_mods_as_gzip_ndjson(self):
+        response = self.client.get(reverse("export"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+
+        records = self._read_ndjson(b"".join(response.streaming_content))
+        self.assertEqual([record["uuid"] for record in records], [str(mod.uuid) for mod in self.mods])
+        self.assertEqual(records[0]["tags"], [self.tag.id])
+        self.assertEqual(records[0]["compatibility"], [{"race": self.race.id, "gender": self.gender.id}])
+
+    def test_export_batches_related_lookups_per_chunk(self):
+        # One query for the mods, then one tag and one compatibility query per chunk of two mods
+        with self.assertNumQueries(5):
+            records = list(iter_catalog_records(chunk_size=2))
+        self.assertEqual(len(records), 3)
+
+    def test_export_catalog_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "catalog.ndjson.gz")
+            call_command("export_catalog", path, "--chunk-size", "2", stdout=io.StringIO())
+            with open(path, "rb") as export_file:
+                records = self._read_ndjson(export_file.read())
+        self.assertEqual(len(records), 3)
+
+
+class ModChangeFeedTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+
+        self.category = Category.objects.create(name="Test Category")
+        self.tag = Tag.objects.create(name="Test Tag")
+        self.race = Race.objects.create(name="Test Race")
+        self.mod = Mod.objects.create(
+            title="Test Mod",
+            short_desc="Short description",
+            description="Long description",
+            file_size=1000000,
+            user=self.user,
+            approved=True,
+            file="path/to/file.zip",
+            category=self.category,
+        )
+        self.url = reverse("changes")
+
+    def test_feed_returns_upserts_with_current_record(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["changes"]), 1)
+        change = response.data["changes"][0]
+        self.assertEqual(change["action"], ModChange.ACTION_UPSERT)
+        self.assertEqual(change["mod"]["title"], "Test Mod")
+        self.assertFalse(response.data["has_more"])
+
+    def test_feed_only_returns_changes_after_cursor(self):
+        cursor = self.client.get(self.url).data["cursor"]
+
+        self.mod.tags.add(self.tag)
+        ModCompatibility.objects.create(mod=self.mod, race=self.race)
+
+        response = self.client.get(self.url, {"since": cursor})
+        self.assertEqual(len(response.data["changes"]), 1)
+        self.assertEqual(response.data["changes"][0]["mod"]["tags"], [self.tag.id])
+        self.assertEqual(self.client.get(self.url, {"since": response.data["cursor"]}).data["changes"], [])
+
+    def test_unapproved_and_deleted_mods_appear_as_tombstones(self):
+        cursor = self.client.get(self.url).data["cursor"]
+        self.mod.approved = False
+        self.mod.save()
+
+        response = self.client.get(self.url, {"since": cursor})
+        self.assertEqual(response.data["changes"][0]["action"], ModChange.ACTION_DELETE)
+        self.assertIsNone(response.data["changes"][0]["mod"])
+
+        mod_uuid = self.mod.uuid
+        self.mod.delete()
+        response = self.client.get(self.url, {"since": response.data["cursor"]})
+        self.assertEqual(response.data["changes"][0]["uuid"], mod_uuid)
+        self.assertEqual(response.data["changes"][0]["action"], ModChange.ACTION_DELETE)
+
+    def test_feed_pages_with_limit(self):
+        self.mod.tags.add(self.tag)
+        response = self.client.get(self.url, {"limit": 1})
+        self.assertTrue(response.data["has_more"])
+        response = self.client.get(self.url, {"since": response.data["cursor"], "limit": 1})
+        self.assertFalse(response.data["has_more"])
+
+    def test_feed_rejects_invalid_cursor(self):
+        response = self.client.get(self.url, {"since": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ModUpdateCheckAPITests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+
+        self.category = Category.objects.create(name="Test Category")
+        self.mods = [
+            Mod.objects.create(
+                title=f"Test Mod {index}",
+                short_desc="Short description",
+                description="Long description",
+                version="1.0.1",
+                file_size=1000000,
+                user=self.user,
+                approved=True,
+                file="path/to/file.zip",
+                category=self.category,
+            )
+            for index in range(2)
+        ]
+        self.url = reverse("check-updates")
+
+    def test_returns_only_outdated_and_missing_entries(self):
+        missing_uuid = uuid.uuid4()
+        data = {
+            "mods": [
+                {"uuid": str(self.mods[0].uuid), "version": "1.0.0"},
+                {"uuid": str(self.mods[1].uuid), "version": "1.0.1"},
+                {"uuid": str(missing_uuid), "version": "1.0.0"},
+            ]
+        }
+        with self.assertNumQueries(2):  # User lookup for authentication, then the single uuid__in query
+            response = self.client.post(self.url, data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(result["uuid"], result["status"]) for result in response.data["results"]],
+            [(self.mods[0].uuid, "outdated"), (missing_uuid, "missing")],
+        )
+        self.assertEqual(response.data["results"][0]["version"], "1.0.1")
+
+    def test_compares_updated_date(self):
+        data = {
+            "mods": [
+                {"uuid": str(self.mods[0].uuid), "updated_date": (timezone.now() - timedelta(days=1)).isoformat()},
+                {"uuid": str(self.mods[1].uuid), "updated_date": (timezone.now() + timedelta(days=1)).isoformat()},
+            ]
+        }
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual([result["uuid"] for result in response.data["results"]], [self.mods[0].uuid])
+
+    def test_rejects_oversized_and_incomplete_requests(self):
+        entries = [{"uuid": str(uuid.uuid4()), "version": "1.0.0"}] * (MOD_UPDATE_CHECK_MAX_ENTRIES + 1)
+        response = self.client.post(self.url, {"mods": entries}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(self.url, {"mods": [{"uuid": str(self.mods[0].uuid)}]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "Query plan output is SQLite specific")
+    def test_lookup_is_an_index_search(self):
+        plan = (
+            Mod.objects.filter(uuid__in=[mod.uuid for mod in self.mods], approved=True)
+            .values_list("uuid", "version", "updated_date")
+            .explain()
+        )
+        self.assertIn("SEARCH mods_mod USING", plan)
+        self.assertIn("(uuid=?)", plan)
+
+
+class ModBulkDetailAPITests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+
+        self.category = Category.objects.create(name="Test Category")
+        self.tag = Tag.objects.create(name="Test Tag")
+        self.mods = []
+        for index in range(3):
+            mod = Mod.objects.create(
+                title=f"Test Mod {index}",
+                short_desc="Short description",
+                description="Long description",
+                file_size=1000000,
+                user=self.user,
+                approved=index < 2,
+                file="path/to/file.zip",
+                category=self.category,
+            )
+            mod.tags.add(self.tag)
+            Comment.objects.create(mod=mod, user=self.user, text="This is a comment")
+            self.mods.append(mod)
+        self.url = reverse("bulk-detail")
+
+    def test_returns_mods_in_request_order_and_reports_missing_ids(self):
+        missing_uuid = uuid.uuid4()
+        uuids = [self.mods[1].uuid, missing_uuid, self.mods[2].uuid, self.mods[0].uuid]
+        response = self.client.post(self.url, {"uuids": [str(mod_uuid) for mod_uuid in uuids]}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([mod["title"] for mod in response.data["results"]], ["Test Mod 1", "Test Mod 0"])
+        self.assertEqual(response.data["results"][0]["tags"], [self.tag.id])
+        self.assertEqual(len(response.data["results"][0]["comments"]), 1)
+        self.assertEqual(response.data["missing"], [missing_uuid])
+        self.assertEqual(response.data["unapproved"], [self.mods[2].uuid])
+
+    def test_matches_detail_view_and_reuses_its_cache(self):
+        detail = self.client.get(reverse("detail", kwargs={"uuid": self.mods[0].uuid})).data
+
+        # The detail view already cached the mod and the authenticated user
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, {"uuids": [str(self.mods[0].uuid)]}, format="json")
+        self.assertEqual(response.data["results"], [detail])
+
+    def test_uses_constant_number_of_queries(self):
+        # Authentication, the mods, four prefetches and the unapproved lookup
+        with self.assertNumQueries(7):
+            self.client.post(self.url, {"uuids": [str(mod.uuid) for mod in self.mods]}, format="json")
+
+    def test_cache_is_invalidated_when_mod_changes(self):
+        self.client.post(self.url, {"uuids": [str(self.mods[0].uuid)]}, format="json")
+        Comment.objects.create(mod=self.mods[0], user=self.user, text="Another comment")
+
+        response = self.client.post(self.url, {"uuids": [str(self.mods[0].uuid)]}, format="json")
+        self.assertEqual(len(response.data["results"][0]["comments"]), 2)
+
+    def test_rejects_too_many_uuids(self):
+        uuids = [str(uuid.uuid4()) for _ in range(MOD_BULK_FETCH_MAX_ENTRIES + 1)]
+        response = self.client.post(self.url, {"uuids": uuids}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        self.mod = Mod.objects.create(
+            title="Test Mod",
+            short_desc="Short description",
+            description="Long description",
+            file_size=1000000,
+            user=self.user,
+            approved=True,
+            file="path/to/file.zip",
+            category=Category.objects.create(name="Test Category"),
+        )
+
+    def _read_aliases_for(self, method, url, data=None):
+        aliases = []
+        route = PrimaryReplicaRouter.db_for_read
+
+        def spy(router, model, **hints):
+            aliases.append(route(router, model, **hints))
+            return None  # Keep querying the test database
+
+        with mock.patch.object(PrimaryReplicaRouter, "db_for_read", spy):
+            response = getattr(self.client, method)(url, data, format="json")
+        return response, aliases
+
+    def test_router_sends_writes_to_primary(self):
+        router = PrimaryReplicaRouter()
+        token = route_reads_to("replica")
+        try:
+            self.assertEqual(router.db_for_read(Mod), "replica")
+            self.assertEqual(router.db_for_write(Mod), "default")
+        finally:
+            reset_read_routing(token)
+        self.assertIsNone(router.db_for_read(Mod))
+
+    def test_read_views_use_replica(self):
+        response, aliases = self._read_aliases_for("get", reverse("tag-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("replica", aliases)
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        response, _ = self._read_aliases_for(
+            "patch", reverse("update", kwargs={"uuid": self.mod.uuid}), {"title": "New title"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response, aliases = self._read_aliases_for("get", reverse("detail", kwargs={"uuid": self.mod.uuid}))
+        self.assertEqual(response.data["title"], "New title")
+        self.assertNotIn("replica", aliases)
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "The replica is a separate SQLite file")
+@override_settings(DATABASE_REPLICAS=["lagging_replica"])
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Routes against a replica that is its own database file and hasn't caught up with the primary."""
+
+    client_class = APIClient
+    replica = "lagging_replica"
+    # Resolved when the class is set up, which is after the replica is added
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        # Added before the test case checks its databases exist, and set up the way the test database is
+        cls.directory = tempfile.mkdtemp()
+        databases = {
+            "default": settings.DATABASES["default"],
+            cls.replica: {"ENGINE": "django.db.backends.sqlite3", "NAME": os.path.join(cls.directory, "replica.db")},
+        }
+        connections.settings[cls.replica] = connections.configure_settings(databases)[cls.replica]
+        call_command("migrate", database=cls.replica, run_syncdb=True, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.replica].close()
+        del connections[cls.replica]
+        del connections.settings[cls.replica]
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        category = Category.objects.create(name="Test Category")
+        self.mod = Mod.objects.create(
+            title="Current title",
+            short_desc="Short description",
+            description="Long description",
+            file_size=1000000,
+            user=self.user,
+            approved=True,
+            file="path/to/file.zip",
+            category=category,
+        )
+        stale = Mod.objects.get(pk=self.mod.pk)
+        stale.title = "Stale title"
+        reader = User.objects.create_user(username="reader", email="reader@example.com", password="testpassword")
+        self.reader_token = str(RefreshToken.for_user(reader).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.reader_token)
+        User.objects.using(self.replica).bulk_create(User.objects.all())
+        Category.objects.using(self.replica).bulk_create([category])
+        Mod.objects.using(self.replica).bulk_create([stale])
+
+    def _title(self, **params):
+        response = self.client.get(reverse("detail", kwargs={"uuid": self.mod.uuid}), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["title"]
+
+    def test_reads_that_are_not_cached_come_from_the_replica(self):
+        self.assertEqual(self._title(fields="title"), "Stale title")
+
+    def test_cache_fills_come_from_the_primary(self):
+        self.assertEqual(self._title(), "Current title")
+        # Served from the cache the first request filled, not from the replica
+        self.assertEqual(self._title(fields="title"), "Current title")
+
+        cache.clear()
+        response = self.client.post(reverse("bulk-detail"), {"uuids": [str(self.mod.uuid)]}, format="json")
+        self.assertEqual(response.data["results"][0]["title"], "Current title")
+        response = self.client.get(reverse("list"))
+        self.assertEqual([mod["title"] for mod in response.data], ["Current title"])
+
+    def test_writes_go_to_the_primary_and_keep_the_writer_there(self):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        response = self.client.patch(
+            reverse("update", kwargs={"uuid": self.mod.uuid}), {"title": "New title"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Mod.objects.using(self.replica).get(pk=self.mod.pk).title, "Stale title")
+        self.assertEqual(self._title(fields="title"), "New title")
+
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + self.reader_token)
+        self.assertEqual(self._title(fields="title"), "Stale title")
+
+
+class SQLiteProfileTests(TransactionTestCase):
+    @unittest.skipUnless(connection.vendor == "sqlite", "SQLite specific")
+    def test_connection_uses_tuned_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_retry_on_database_locked_runs_outermost_writes_again(self):
+        attempts = []
+
+        @retry_on_database_locked(base_delay=0)
+        def write():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError("database is locked")
+            return "written"
+
+        self.assertEqual(write(), "written")
+        self.assertEqual(len(attempts), 3)
+
+    def test_retry_on_database_locked_does_not_retry_nested_or_other_errors(self):
+        attempts = []
+
+        @retry_on_database_locked(base_delay=0)
+        def write():
+            attempts.append(1)
+            raise OperationalError("database is locked")
+
+        with transaction.atomic(), self.assertRaises(OperationalError):
+            write()
+        self.assertEqual(len(attempts), 1)
+
+        @retry_on_database_locked(base_delay=0)
+        def broken_write():
+            attempts.append(1)
+            raise OperationalError("no such table: mods_missing")
+
+        with self.assertRaises(OperationalError):
+            broken_write()
+        self.assertEqual(len(attempts), 2)
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN output is SQLite specific")
+class QueryPlanTests(APITestCase):
+    # Reference data is small and listed in full by design
+    FULL_SCAN_ALLOWED = {"mods_tag", "mods_race", "mods_gender"}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+
+        self.category = Category.objects.create(name="Test Category")
+        self.tag = Tag.objects.create(name="Test Tag")
+        self.race = Race.objects.create(name="Test Race")
+        self.gender = Gender.objects.create(name="Test Gender")
+        self.mod = Mod.objects.create(
+            title="Test Mod",
+            short_desc="Short description",
+            description="Long description",
+            file_size=1000000,
+            user=self.user,
+            approved=True,
+            file="path/to/file.zip",
+            category=self.category,
+        )
+        self.mod.tags.add(self.tag)
+        ModCompatibility.objects.create(mod=self.mod, race=self.race, gender=self.gender)
+        Comment.objects.create(mod=self.mod, user=self.user, text="This is a comment")
+        cache.clear()
+
+    def _scans(self, sql, allow_index_scans):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            steps = [row[3] for row in cursor.fetchall()]
+
+        scans = []
+        for step in steps:
+            match = re.match(r"SCAN (\w+)(.*)", step)
+            if not match or match.group(1) in self.FULL_SCAN_ALLOWED:
+                continue
+            if allow_index_scans and "INDEX" in match.group(2):
+                continue
+            scans.append(step)
+        return scans
+
+    def assertNoFullScans(self, method, url, data=None, allow_index_scans=False):
+        """
+        Fails when any SELECT issued by the request scans a table. Endpoints that list every approved mod may walk
+        an index instead, which only touches approved rows.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, format="json")
+            if response.streaming:
+                b"".join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+
+        for query in context.captured_queries:
+            if query["sql"].startswith("SELECT"):
+                self.assertEqual(self._scans(query["sql"], allow_index_scans), [], query["sql"])
+
+    def test_list_endpoints(self):
+        self.assertNoFullScans("get", reverse("list"), allow_index_scans=True)
+        self.assertNoFullScans("get", reverse("tag-list"))
+        self.assertNoFullScans("get", reverse("race-list"))
+        self.assertNoFullScans("get", reverse("gender-list"))
+
+    def test_detail_endpoints(self):
+        self.assertNoFullScans("get", reverse("detail", kwargs={"uuid": self.mod.uuid}))
+        self.assertNoFullScans("post", reverse("bulk-detail"), {"uuids": [str(self.mod.uuid), str(uuid.uuid4())]})
+        self.assertNoFullScans(
+            "post", reverse("check-updates"), {"mods": [{"uuid": str(self.mod.uuid), "version": "0.9.0"}]}
+        )
+
+    def test_search_endpoints(self):
+        self.assertNoFullScans("get", reverse("search-by-category", kwargs={"category_id": self.category.id}))
+        self.assertNoFullScans("get", reverse("search-by-tag"), {"tag_ids": [self.tag.id]})
+        # A substring match can't use a b-tree, so the best plan walks the approved mods
+        self.assertNoFullScans("get", reverse("search-by-title", kwargs={"title": "Test"}), allow_index_scans=True)
+        self.assertNoFullScans("get", reverse("search-by-user", kwargs={"user_id": self.user.id}))
+        self.assertNoFullScans("get", reverse("search-by-race"), {"race_ids": [self.race.id]})
+        self.assertNoFullScans("get", reverse("search-by-gender"), {"gender_ids": [self.gender.id]})
+
+    def test_sync_endpoints(self):
+        self.assertNoFullScans("get", reverse("export"), allow_index_scans=True)
+        self.assertNoFullScans("get", reverse("changes"), {"since": 0})
+
+    def test_cascading_deletes_use_indexes(self):
+        category = Category.objects.create(name="Empty Category")
+        with CaptureQueriesContext(connection) as context:
+            category.delete()
+            self.user.delete()
+        for query in context.captured_queries:
+            if query["sql"].startswith("SELECT") and "mods_mod" in query["sql"]:
+                self.assertEqual(self._scans(query["sql"], False), [], query["sql"])
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_seed_catalog_generates_related_rows(self):
+        call_command(
+            "seed_catalog", "--users", "5", "--mods", "30", "--tags", "10", "--batch-size", "7", stdout=io.StringIO()
+        )
+        self.assertEqual(Mod.objects.count(), 30)
+        self.assertEqual(User.objects.filter(username__startswith="seed_").count(), 5)
+        self.assertTrue(Mod.objects.filter(approved=True).exists())
+        self.assertEqual(sum(Mod.objects.values_list("downloads", flat=True)), Download.objects.count())
+        # Compatibility is only generated for categories that need it
+        self.assertFalse(ModCompatibility.objects.filter(mod__category__requires_race=False).exists())
+
+    def test_benchmark_endpoints_writes_and_compares_baseline(self):
+        call_command("seed_catalog", "--users", "3", "--mods", "10", "--tags", "5", stdout=io.StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            with override_settings(DEBUG=True):
+                call_command("benchmark_endpoints", "--iterations", "2", "--save-baseline", path, stdout=io.StringIO())
+            with open(path) as baseline_file:
+                results = json.load(baseline_file)["sizes"]["10"]
+
+            output = io.StringIO()
+            call_command(
+                "benchmark_endpoints",
+                "--iterations",
+                "2",
+                "--compare",
+                path,
+                "--i-know-this-is-destructive",
+                stdout=output,
+            )
+
+        self.assertEqual(results["m"]["status"], status.HTTP_200_OK)
+        self.assertGreater(results["m"]["queries"], 0)
+        self.assertEqual(results["m/<uuid:uuid>/"]["status"], status.HTTP_200_OK)
+        self.assertEqual(results["m/<uuid:uuid>/approve/"]["status"], status.HTTP_200_OK)
+        self.assertEqual(results["api/token/refresh/"]["status"], status.HTTP_200_OK)
+        self.assertIn("p95 vs base", output.getvalue())
+        # Write benchmarks are rolled back
+        self.assertEqual(Mod.objects.count(), 10)
+        self.assertFalse(Mod.objects.filter(title="Benchmark Mod").exists())
+        # The admin it signs in with doesn't outlive the run
+        self.assertFalse(User.objects.filter(role="admin").exists())
+
+    def test_benchmark_endpoints_refuses_to_run_without_debug(self):
+        with self.assertRaises(CommandError):
+            call_command("benchmark_endpoints", "--sizes", "10", stdout=io.StringIO())
+        self.assertFalse(User.objects.exists())
+
+
+class RequestTimingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        self.category = Category.objects.create(name="Test Category")
+        self.mod = Mod.objects.create(
+            title="Test Mod",
+            short_desc="Short description",
+            description="Long description",
+            file_size=1000000,
+            user=self.user,
+            approved=True,
+            file="path/to/file.zip",
+            category=self.category,
+        )
+
+    def _timings(self, response):
+        return dict(re.findall(r"(\w+);dur=([\d.]+)", response["Server-Timing"]))
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_server_timing_header_reports_queries_and_phases(self):
+        response = self.client.get(reverse("detail", kwargs={"uuid": self.mod.uuid}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        queries = int(re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response["Server-Timing"]).group(1))
+        self.assertGreater(queries, 0)
+        timings = self._timings(response)
+        self.assertEqual(set(timings), {"db", "serializer", "render", "storage", "total"})
+        self.assertGreater(float(timings["serializer"]), 0)
+        self.assertGreater(float(timings["render"]), 0)
+        # The serialized file URL comes from the storage backend
+        self.assertGreater(float(timings["storage"]), 0)
+        self.assertGreaterEqual(float(timings["total"]), float(timings["db"]))
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_serializer_timing_covers_every_drf_serializer(self):
+        Tag.objects.create(name="Test Tag")
+        response = self.client.get(reverse("tag-list"))
+        self.assertGreater(float(self._timings(response)["serializer"]), 0)
+
+        response = self.client.post(
+            reverse("register"), {"username": "newuser", "email": "new@example.com", "password": "Str0ng!pass"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(float(self._timings(response)["serializer"]), 0)
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_server_timing_header_is_opt_in(self):
+        response = self.client.get(reverse("detail", kwargs={"uuid": self.mod.uuid}))
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_requests_are_logged_with_top_queries(self):
+        with self.assertLogs("mods.requests", level="WARNING") as logs:
+            self.client.get(reverse("list"), {"token": "secret"})
+        self.assertIn("Slow request GET /m", logs.output[0])
+        self.assertNotIn("secret", logs.output[0])
+        self.assertIn('FROM "mods_mod"', logs.output[0])
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.metrics_dir.cleanup)
+        override = override_settings(METRICS_DIR=self.metrics_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = User.objects.create_user(
+            username="adminuser", email="admin@example.com", password="adminpassword", role="admin"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.admin).access_token))
+        self.category = Category.objects.create(name="Test Category")
+        self.mod = Mod.objects.create(
+            title="Test Mod",
+            short_desc="Short description",
+            description="Long description",
+            file_size=1000000,
+            user=self.admin,
+            approved=True,
+            file="path/to/file.zip",
+            category=self.category,
+        )
+
+    def _sample(self, text, sample):
+        match = re.search(rf"^{re.escape(sample)} (\S+)$", text, re.MULTILINE)
+        return float(match.group(1)) if match else None
+
+    def test_metrics_report_requests_latency_db_time_and_cache(self):
+        self.client.get(reverse("list"))
+        self.client.get(reverse("detail", kwargs={"uuid": self.mod.uuid}))
+        self.client.get(reverse("detail", kwargs={"uuid": self.mod.uuid}))
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+        self.assertEqual(self._sample(text, 'http_requests_total{method="GET",status="200",view="detail"}'), 2)
+        self.assertEqual(self._sample(text, 'http_request_duration_seconds_count{view="detail"}'), 2)
+        self.assertEqual(self._sample(text, 'http_request_duration_seconds_bucket{view="list",le="+Inf"}'), 1)
+        self.assertGreater(self._sample(text, 'http_request_db_seconds_sum{view="list"}'), 0)
+        self.assertGreater(self._sample(text, 'db_query_duration_seconds_count{shape="SELECT mods_mod"}'), 0)
+        self.assertEqual(self._sample(text, 'cache_requests_total{cache="mod_detail",result="hit"}'), 1)
+        self.assertEqual(self._sample(text, 'cache_hit_ratio{cache="mod_detail"}'), 0.5)
+
+    def test_metrics_merge_snapshots_from_other_workers(self):
+        self.client.get(reverse("list"))
+        other_worker = {
+            "counters": [["http_requests_total", [["method", "GET"], ["status", "200"], ["view", "list"]], 4]],
+            "histograms": [],
+        }
+        with open(os.path.join(self.metrics_dir.name, "metrics-999999.json"), "w") as snapshot:
+            json.dump(other_worker, snapshot)
+
+        text = self.client.get(reverse("metrics")).content.decode()
+        self.assertEqual(self._sample(text, 'http_requests_total{method="GET",status="200",view="list"}'), 5)
+
+    def test_metrics_require_admin(self):
+        user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(user).access_token))
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_counters_are_safe_across_threads(self):
+        def increment():
+            for _ in range(1000):
+                registry.inc("test_total")
+                registry.observe("test_seconds", 0.01)
+
+        threads = [threading.Thread(target=increment) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot["counters"], [["test_total", (), 8000]])
+        self.assertEqual(sum(snapshot["histograms"][0][2][:-1]), 8000)
+
+    def test_query_shape(self):
+        self.assertEqual(query_shape('SELECT "mods_mod"."id" FROM "mods_mod" WHERE "id" = %s'), "SELECT mods_mod")
+        self.assertEqual(query_shape('UPDATE "mods_mod" SET "downloads" = %s'), "UPDATE mods_mod")
+        self.assertEqual(query_shape('INSERT INTO "mods_download" ("mod_id") VALUES (%s)'), "INSERT mods_download")
+        self.assertEqual(query_shape('SAVEPOINT "s1_x1"'), "SAVEPOINT")
+
+
+class RequestProfilerTests(APITestCase):
+    def setUp(self):
+        self.profiles_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profiles_dir.cleanup)
+        override = override_settings(PROFILER_DIR=self.profiles_dir.name, PROFILER_MAX_PROFILES=2)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.admin = User.objects.create_user(
+            username="adminuser", email="admin@example.com", password="adminpassword", role="admin"
+        )
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self._authenticate(self.admin)
+
+    def _authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(user).access_token))
+
+    def test_admin_header_profiles_request(self):
+        response = self.client.get(reverse("search-by-tag"), {"tag_ids": [1, 2]}, HTTP_X_PROFILE="1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        profiles = self.client.get(reverse("profile-list")).data
+        self.assertEqual(len(profiles), 1)
+        self.assertEqual(profiles[0]["view"], "search-by-tag")
+        self.assertEqual(profiles[0]["path"], "/m/tag/")
+        self.assertEqual(profiles[0]["status"], status.HTTP_200_OK)
+
+        response = self.client.get(reverse("profile-download", kwargs={"name": profiles[0]["name"]}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with tempfile.NamedTemporaryFile() as downloaded:
+            downloaded.write(b"".join(response.streaming_content))
+            downloaded.flush()
+            self.assertTrue(pstats.Stats(downloaded.name).total_calls > 0)
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0, SERVER_TIMING_ENABLED=True)
+    def test_profiled_requests_render_normally(self):
+        Tag.objects.create(name="Test Tag")
+        response = self.client.get(reverse("tag-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        render = float(re.search(r"render;dur=([\d.]+)", response["Server-Timing"]).group(1))
+        self.assertGreater(render, 0)
+
+        profile = self.client.get(reverse("profile-list")).data[-1]
+        path = os.path.join(self.profiles_dir.name, profile["name"])
+        functions = {function for _, _, function in pstats.Stats(path).stats}
+        # Rendering happened while the profiler was running
+        self.assertIn("render", functions)
+
+    def test_header_from_non_admin_is_ignored(self):
+        self._authenticate(self.user)
+        self.client.get(reverse("tag-list"), HTTP_X_PROFILE="1")
+        self.assertEqual(os.listdir(self.profiles_dir.name), [])
+
+    @override_settings(PROFILER_SAMPLE_RATE=1.0)
+    def test_sampled_requests_are_kept_in_a_bounded_ring_buffer(self):
+        for _ in range(3):
+            self.client.get(reverse("tag-list"))
+        self.assertEqual(len(self.client.get(reverse("profile-list")).data), 2)
+        # Each profile has its metadata file next to it
+        self.assertEqual(len(os.listdir(self.profiles_dir.name)), 4)
+
+    def test_profile_views_require_admin_and_valid_names(self):
+        self.assertEqual(
+            self.client.get(reverse("profile-download", kwargs={"name": "..passwd"})).status_code,
+            status.HTTP_404_NOT_FOUND,
+        )
+        self._authenticate(self.user)
+        self.assertEqual(self.client.get(reverse("profile-list")).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class CachedJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(
+            username="adminuser", email="admin@example.com", password="adminpassword", role="admin"
+        )
+
+    def _login(self):
+        response = self.client.post(
+            reverse("token_obtain_pair"), {"username": "adminuser", "password": "adminpassword"}, format="json"
+        )
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + response.data["access"])
+        return AccessToken(response.data["access"])
+
+    def _user_queries(self, method, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = method(url)
+        return response, [query["sql"] for query in queries if '"mods_user"' in query["sql"]]
+
+    def test_tokens_carry_role_and_version_claims(self):
+        token = self._login()
+        self.assertEqual(token["role"], "admin")
+        self.assertEqual(token["ver"], self.user.token_version)
+
+    def test_repeated_requests_do_not_query_users(self):
+        self._login()
+        response, user_queries = self._user_queries(self.client.get, reverse("tag-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(user_queries), 1)
+
+        response, user_queries = self._user_queries(self.client.get, reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(user_queries, [])
+
+    @override_settings(JWT_USER_CACHE_TTL=0)
+    def test_cached_users_expire(self):
+        self._login()
+        self.client.get(reverse("tag-list"))
+        _, user_queries = self._user_queries(self.client.get, reverse("tag-list"))
+        self.assertEqual(len(user_queries), 1)
+
+    def test_password_change_invalidates_tokens(self):
+        self._login()
+        self.assertEqual(self.client.get(reverse("tag-list")).status_code, status.HTTP_200_OK)
+
+        self.user.set_password("newpassword")
+        self.user.save()
+        self.assertEqual(self.client.get(reverse("tag-list")).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_role_change_invalidates_tokens(self):
+        self._login()
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_200_OK)
+
+        user = User.objects.get(pk=self.user.pk)
+        user.role = "user"
+        user.save()
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Saving without a role change keeps existing tokens valid
+        token_version = user.token_version
+        user.first_name = "Renamed"
+        user.save()
+        self.assertEqual(user.token_version, token_version)
+
+    def test_partial_saves_persist_the_version_bump(self):
+        token_version = self.user.token_version
+        self.user.set_password("newpassword")
+        self.user.save(update_fields=["password"])
+        self.user.role = "moderator"
+        self.user.save(update_fields=["role"])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, token_version + 2)
+
+    @override_settings(
+        PASSWORD_HASHERS=[
+            "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+            "django.contrib.auth.hashers.MD5PasswordHasher",
+        ]
+    )
+    def test_password_hash_upgrade_keeps_tokens_valid(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password("adminpassword", hasher="md5"))
+        token_version = User.objects.get(pk=self.user.pk).token_version
+
+        token = self._login()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+        self.assertEqual(self.user.token_version, token_version)
+        self.assertEqual(token["ver"], token_version)
+        self.assertEqual(self.client.get(reverse("tag-list")).status_code, status.HTTP_200_OK)
+
+
+class RefreshTokenRevocationTests(APITestCase):
+    def setUp(self):
+        revocations.reset()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.url = reverse("token_refresh")
+
+    def _refresh(self, token):
+        return self.client.post(self.url, {"refresh": str(token)}, format="json")
+
+    def _revocation_lookups(self, token):
+        with CaptureQueriesContext(connection) as queries:
+            response = self._refresh(token)
+        lookups = [q["sql"] for q in queries if q["sql"].startswith("SELECT") and '"mods_revokedtoken"' in q["sql"]]
+        return response, lookups
+
+    def test_rotated_refresh_token_cannot_be_reused(self):
+        refresh = RefreshToken.for_user(self.user)
+        response = self._refresh(refresh)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("refresh", response.data)
+        self.assertTrue(RevokedToken.objects.filter(jti=refresh["jti"]).exists())
+
+        self.assertEqual(self._refresh(refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._refresh(response.data["refresh"]).status_code, status.HTTP_200_OK)
+
+    def test_revocations_from_other_processes_are_seen_at_once(self):
+        # The first refresh loads the filter, which then doesn't sync for REVOCATION_SYNC_INTERVAL
+        self._refresh(RefreshToken.for_user(self.user))
+
+        refresh = RefreshToken.for_user(self.user)
+        RevokedToken.objects.create(jti=refresh["jti"], expires_at=timezone.now() + timedelta(days=1))
+        self.assertEqual(self._refresh(refresh).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_only_one_concurrent_revocation_wins(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.assertTrue(revoke_token(refresh))
+        # Another worker's filter hasn't seen the first revocation yet
+        revocations.reset()
+        self.assertFalse(revoke_token(refresh))
+        self.assertEqual(RevokedToken.objects.filter(jti=refresh["jti"]).count(), 1)
+
+    # Without rotation a refresh doesn't revoke anything, so revocation is only checked
+    @mock.patch("mods.serializers.api_settings.ROTATE_REFRESH_TOKENS", False)
+    def test_unrevoked_tokens_are_checked_without_the_database(self):
+        # The first check loads the filter
+        self._refresh(RefreshToken.for_user(self.user))
+
+        response, lookups = self._revocation_lookups(RefreshToken.for_user(self.user))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(lookups, [])
+
+    @mock.patch("mods.serializers.api_settings.ROTATE_REFRESH_TOKENS", False)
+    @override_settings(REVOCATION_SYNC_INTERVAL=0)
+    def test_picks_up_revocations_from_other_processes(self):
+        self._refresh(RefreshToken.for_user(self.user))
+
+        refresh = RefreshToken.for_user(self.user)
+        RevokedToken.objects.create(jti=refresh["jti"], expires_at=timezone.now() + timedelta(days=1))
+        response, lookups = self._revocation_lookups(refresh)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        # The catch-up read and the confirmation of the positive
+        self.assertEqual(len(lookups), 2)
+
+    def test_purge_removes_only_expired_revocations(self):
+        RevokedToken.objects.create(jti="expired", expires_at=timezone.now() - timedelta(seconds=1))
+        RevokedToken.objects.create(jti="active", expires_at=timezone.now() + timedelta(days=1))
+        call_command("purge_revoked_tokens", stdout=io.StringIO())
+        self.assertEqual(list(RevokedToken.objects.values_list("jti", flat=True)), ["active"])
+
+    def test_bloom_filter_has_no_false_negatives_and_few_false_positives(self):
+        bloom = BloomFilter(1000, 0.01)
+        keys = [str(uuid.uuid4()) for _ in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+        false_positives = sum(str(uuid.uuid4()) in bloom for _ in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class ScopedObjectPermissionTests(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.owner = User.objects.create_user(username="owner", email="owner@example.com", password="password")
+        self.other_user = User.objects.create_user(username="other", email="other@example.com", password="password")
+        self.moderator = User.objects.create_user(
+            username="moderator", email="moderator@example.com", password="password", role="moderator"
+        )
+        self.category = Category.objects.create(name="Test Category")
+        self.mod = Mod.objects.create(
+            title="Test Mod",
+            short_desc="Short description",
+            description="Long description",
+            file_size=1000000,
+            user=self.owner,
+            approved=False,
+            file="path/to/file.zip",
+            category=self.category,
+        )
+
+    def _authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(user).access_token))
+        # Warm the authentication cache so only the view's queries are captured
+        self.client.get(reverse("tag-list"))
+
+    def _mod_selects(self, queries):
+        return [q["sql"] for q in queries if q["sql"].startswith("SELECT") and 'FROM "mods_mod"' in q["sql"]]
+
+    def test_owner_lookup_decides_access_in_one_query(self):
+        self._authenticate(self.owner)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(reverse("delete", kwargs={"uuid": self.mod.uuid}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        selects = self._mod_selects(queries)
+        self.assertEqual(len(selects), 1)
+        self.assertIn('"mods_mod"."user_id" = ', selects[0])
+        self.assertNotIn('"mods_mod"."description"', selects[0])
+        self.assertFalse(any('FROM "mods_user"' in q["sql"] for q in queries))
+
+    def test_non_owner_gets_403_and_missing_mod_404(self):
+        self._authenticate(self.other_user)
+        response = self.client.delete(reverse("delete", kwargs={"uuid": self.mod.uuid}))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.delete(reverse("delete", kwargs={"uuid": uuid.uuid4()}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertTrue(Mod.objects.filter(pk=self.mod.pk).exists())
+
+    def test_approval_fetches_only_what_it_writes(self):
+        ModArchive.objects.create(
+            mod=self.mod,
+            file=self.mod.file.name,
+            status=ModArchive.STATUS_VALID,
+            size=1000000,
+            sha256="0" * 64,
+            crc32=0,
+        )
+        cursor = ModChange.objects.count()
+        self._authenticate(self.moderator)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(
+                reverse("approve", kwargs={"uuid": self.mod.uuid}), {"approved": True}, format="json"
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["approved"], True)
+
+        # One narrow lookup before the write, the full mod is only read afterwards for the response
+        update = next(index for index, q in enumerate(queries) if q["sql"].startswith('UPDATE "mods_mod"'))
+        selects = self._mod_selects(queries[:update])
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn('"mods_mod"."title"', selects[0])
+        # Approval skips Mod.save(), so the category and compatibility checks don't run
+        self.assertFalse(any('"mods_category"' in q["sql"] for q in queries))
+
+        self.mod.refresh_from_db()
+        self.assertTrue(self.mod.approved)
+        self.assertEqual(ModChange.objects.count(), cursor + 1)
+
+
+class FastJSONTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        self.category = Category.objects.create(name="Test Category")
+        self.tag = Tag.objects.create(name="Test Tag")
+        self.mod = Mod.objects.create(
+            title="Miqo'te Outfit \u2606",
+            short_desc="Line\u2028separated",
+            description="Long description",
+            version="1.0.0",
+            file_size=1000000,
+            user=self.user,
+            approved=True,
+            file="path/to/file.zip",
+            category=self.category,
+        )
+        self.mod.tags.add(self.tag)
+        Comment.objects.create(mod=self.mod, user=self.user, text="Great mod!")
+
+    def assertRendersLikeJSONRenderer(self, data, accepted_media_type=None):
+        self.assertEqual(
+            FastJSONRenderer().render(data, accepted_media_type), JSONRenderer().render(data, accepted_media_type)
+        )
+
+    def test_api_responses_match_json_renderer(self):
+        responses = [
+            self.client.get(reverse("list")),
+            self.client.get(reverse("detail", kwargs={"uuid": self.mod.uuid})),
+            self.client.get(reverse("tag-list")),
+            self.client.get(reverse("changes")),
+            self.client.post(reverse("bulk-detail"), {"uuids": [str(self.mod.uuid)]}, format="json"),
+            self.client.post(reverse("bulk-detail"), {"uuids": []}, format="json"),
+        ]
+        for response in responses:
+            self.assertEqual(response["Content-Type"], "application/json")
+            self.assertEqual(response.content, JSONRenderer().render(response.data))
+        self.assertIn(b"\\u2028", responses[0].content)
+
+    def test_edge_values_match_json_renderer(self):
+        self.assertRendersLikeJSONRenderer(
+            OrderedDict(
+                [
+                    ("uuid", uuid.uuid4()),
+                    ("utc", datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=datetime_timezone.utc)),
+                    ("offset", datetime(2024, 5, 1, 12, 30, tzinfo=datetime_timezone(timedelta(hours=2)))),
+                    ("naive", datetime(2024, 5, 1, 12, 30)),
+                    ("date", date(2024, 5, 1)),
+                    ("time", datetime_time(12, 30, 15, 500)),
+                    ("decimal", Decimal("1.10")),
+                    ("duration", timedelta(minutes=5)),
+                    ("lazy", gettext_lazy("This field is required.")),
+                    ("separators", "a\u2028b\u2029c"),
+                    ("unicode", "\u00e9\u2606"),
+                    ("int_keys", {1: "one"}),
+                    ("nested", [None, True, 0.1, -5, {"queryset": Tag.objects.values_list("name", flat=True)}]),
+                ]
+            )
+        )
+
+    def test_unsupported_values_fall_back_to_json_renderer(self):
+        self.assertRendersLikeJSONRenderer({"big": 2**70})
+        self.assertRendersLikeJSONRenderer({"title": "Test"}, "application/json; indent=4")
+        with mock.patch("mods.renderers.orjson", None):
+            self.assertRendersLikeJSONRenderer({"uuid": uuid.uuid4()})
+
+    def test_non_finite_numbers_are_rejected_like_json_renderer(self):
+        for value in (float("nan"), float("inf"), -float("inf"), Decimal("NaN")):
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render({"nested": [{"rating": value}]})
+        with mock.patch.object(FastJSONRenderer, "strict", False):
+            self.assertEqual(FastJSONRenderer().render({"rating": float("nan")}), b'{"rating":NaN}')
+
+    def test_parser_matches_json_parser(self):
+        body = json.dumps({"uuids": [str(uuid.uuid4())], "nested": {"value": 2.5, "text": "\u00e9"}}).encode()
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+
+        for invalid in (b'{"a": ', b'{"a": NaN}'):
+            with self.assertRaises(ParseError) as expected:
+                JSONParser().parse(io.BytesIO(invalid))
+            with self.assertRaises(ParseError) as fast:
+                FastJSONParser().parse(io.BytesIO(invalid))
+            self.assertEqual(str(fast.exception), str(expected.exception))
+
+
+class FastModSerializerTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.other = User.objects.create_user(username="other", email="other@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        self.category = Category.objects.create(name="Test Category")
+        self.tags = [Tag.objects.create(name=f"Tag {index}") for index in range(3)]
+        self.mods = []
+        for index in range(3):
+            mod = Mod.objects.create(
+                title=f"Mod {index}",
+                short_desc="Short description",
+                description="Description",
+                file_size=1000000,
+                user=self.user,
+                approved=True,
+                file="path/to/file.zip",
+                category=self.category,
+            )
+            mod.tags.set(self.tags[index:])
+            Comment.objects.create(mod=mod, user=self.other, text=f"Comment {index}")
+            Rating.objects.create(mod=mod, user=self.other, rating=index + 1)
+            Download.objects.create(mod=mod, user=self.other)
+            self.mods.append(mod)
+        self.request = RequestFactory().get("/", HTTP_HOST="localhost")
+
+    def test_matches_mod_serializer(self):
+        queryset = Mod.objects.order_by("id")
+        expected = ModSerializer(queryset, many=True, context={"request": self.request}).data
+        # Rendered, so key order and value types are compared too
+        self.assertEqual(JSONRenderer().render(serialize_mods(queryset, self.request)), JSONRenderer().render(expected))
+        self.assertEqual(
+            JSONRenderer().render(serialize_mod_cards(queryset)),
+            JSONRenderer().render(ModCatalogCardSerializer(queryset, many=True).data),
+        )
+
+    def test_accepts_model_instances_in_order(self):
+        mods = [self.mods[2], self.mods[0]]
+        self.assertEqual([mod["id"] for mod in serialize_mods(mods, self.request)], [mod.id for mod in mods])
+
+    def test_query_count_does_not_grow_with_mods(self):
+        # One query for the mods and one per nested relation
+        with self.assertNumQueries(5):
+            serialize_mods(Mod.objects.all(), self.request)
+
+    def test_list_and_detail_views_match_mod_serializer(self):
+        response = self.client.get(reverse("list"))
+        expected = ModSerializer(
+            Mod.objects.filter(approved=True), many=True, context={"request": response.wsgi_request}
+        )
+        self.assertEqual(response.json(), json.loads(JSONRenderer().render(expected.data)))
+
+        response = self.client.get(reverse("detail", kwargs={"uuid": self.mods[0].uuid}))
+        expected = ModSerializer(self.mods[0], context={"request": response.wsgi_request})
+        self.assertEqual(response.json(), json.loads(JSONRenderer().render(expected.data)))
+
+    def test_benchmark_serializers_reports_identical_output(self):
+        output = io.StringIO()
+        call_command("benchmark_serializers", "--mods", "20", "--iterations", "1", stdout=output)
+        self.assertIn("identical output", output.getvalue())
+        # The seeded catalog is rolled back
+        self.assertEqual(Mod.objects.count(), 3)
+
+    def test_sparse_fieldset_selects_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            data = serialize_mods(Mod.objects.all(), self.request, fields=("title", "thumbnail"))
+        self.assertEqual(data[0], {"title": "Mod 0", "thumbnail": None})
+        self.assertEqual(len(context.captured_queries), 1)
+        sql = context.captured_queries[0]["sql"]
+        self.assertNotIn("JOIN", sql)
+        self.assertNotIn("description", sql)
+
+    def test_list_fields_and_expand_query_params(self):
+        response = self.client.get(reverse("list"), {"fields": "tags,title,user", "expand": "user,tags"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first = response.json()[0]
+        # Keys follow the serializer's order rather than the requested order
+        self.assertEqual(list(first), ["title", "user", "tags"])
+        self.assertEqual(first["user"], {"id": self.user.id, "username": "testuser"})
+        self.assertEqual(first["tags"], [{"id": tag.id, "name": tag.name} for tag in self.tags])
+
+    def test_detail_fields_are_cut_from_cached_details(self):
+        url = reverse("detail", kwargs={"uuid": self.mods[0].uuid})
+        full = self.client.get(url).json()
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"fields": "uuid,comments"})
+        self.assertEqual(response.json(), {"uuid": full["uuid"], "comments": full["comments"]})
+
+        response = self.client.get(url, {"fields": "category", "expand": "category"})
+        self.assertEqual(response.json(), {"category": {"id": self.category.id, "name": "Test Category"}})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(reverse("list"), {"fields": "title,password", "expand": "comments"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("fields", response.json())
+        self.assertIn("expand", response.json())
+
+
+_job_calls = []
+
+
+@job("test_record")
+def _record_job(value):
+    _job_calls.append(value)
+
+
+@job("test_fail")
+def _failing_job():
+    raise RuntimeError("Job failed")
+
+
+@job("test_slow", lock_timeout=settings.JOB_LOCK_TIMEOUT * 2)
+def _slow_job():
+    pass
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        _job_calls.clear()
+
+    def test_jobs_run_by_priority_and_are_deleted(self):
+        enqueue("test_record", {"value": "low"})
+        enqueue("test_record", {"value": "high"}, priority=5)
+        enqueue("test_record", {"value": "later"}, delay=timedelta(hours=1))
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(_job_calls, ["high", "low"])
+        self.assertEqual(list(Job.objects.values_list("payload", flat=True)), [{"value": "later"}])
+
+    def test_enqueue_is_part_of_the_callers_transaction(self):
+        with transaction.atomic():
+            enqueue("test_record", {"value": 1})
+            transaction.set_rollback(True)
+        self.assertFalse(Job.objects.exists())
+
+    def test_queued_jobs_are_deduplicated(self):
+        enqueue("test_record", {"value": 1}, dedupe_key="same")
+        enqueue("test_record", {"value": 2}, dedupe_key="same")
+        self.assertEqual(Job.objects.count(), 1)
+        with self.assertRaises(LookupError):
+            enqueue("not_registered")
+
+    def test_failed_jobs_are_retried_with_backoff_then_dead_lettered(self):
+        enqueue("test_fail", max_attempts=2)
+        with self.assertLogs("mods.jobs", "WARNING"):
+            self.assertEqual(run_pending(), 1)
+        failed = Job.objects.get()
+        self.assertEqual((failed.status, failed.attempts), (Job.STATUS_QUEUED, 1))
+        self.assertGreater(failed.run_at, timezone.now() + timedelta(seconds=9))
+        self.assertIn("RuntimeError: Job failed", failed.last_error)
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs("mods.jobs", "ERROR"):
+            run_pending()
+        failed.refresh_from_db()
+        self.assertEqual((failed.status, failed.attempts), (Job.STATUS_DEAD, 2))
+        self.assertEqual(run_pending(), 0)
+
+    def test_jobs_held_by_a_lost_worker_are_requeued(self):
+        enqueue("test_record", {"value": 1})
+        (claimed,) = claim_jobs("lost-worker", 10)
+        self.assertEqual(claim_jobs("other-worker", 10), [])
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT + 1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        (reclaimed,) = claim_jobs("other-worker", 10)
+        self.assertEqual(reclaimed.attempts, 2)
+        self.assertTrue(run_job(reclaimed))
+        self.assertEqual(_job_calls, [1])
+
+    def test_workers_that_lost_a_job_do_not_finish_it(self):
+        enqueue("test_record", {"value": 1})
+        (lost,) = claim_jobs("lost-worker", 10)
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT + 1))
+        requeue_stale_jobs()
+        (claimed,) = claim_jobs("other-worker", 10)
+
+        self.assertTrue(run_job(lost))
+        self.assertEqual(Job.objects.values_list("status", "locked_by").get(), (Job.STATUS_RUNNING, claimed.locked_by))
+        self.assertTrue(run_job(claimed))
+        self.assertFalse(Job.objects.exists())
+
+    def test_jobs_with_their_own_lock_timeout_are_requeued_after_it(self):
+        enqueue("test_slow")
+        claim_jobs("worker", 10)
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT + 1))
+        self.assertEqual(requeue_stale_jobs(), 0)
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT * 2 + 1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+
+    @override_settings(ARCHIVE_VALIDATION_PROCESSES=0)
+    def test_rejecting_mods_deletes_their_files_in_a_job(self):
+        user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        category = Category.objects.create(name="Test Category")
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            mod = Mod.objects.create(
+                title="Test Mod",
+                short_desc="Short description",
+                description="Description",
+                file_size=1000000,
+                user=user,
+                approved=True,
+                file=_get_test_file_content(),
+                category=category,
+            )
+            path = mod.file.path
+            # Validate and index the upload first so only the rejection's job is left
+            run_pending()
+            ModAdmin(Mod, admin.site).reject_mods(None, Mod.objects.filter(approved=True))
+            # Rejection is immediate, the file goes once the job runs
+            self.assertFalse(Mod.objects.get(pk=mod.pk).approved)
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(run_pending(), 1)
+            self.assertFalse(os.path.exists(path))
+
+
+class RunWorkerCommandTests(TransactionTestCase):
+    def setUp(self):
+        _job_calls.clear()
+
+    def test_run_worker_drains_the_queue(self):
+        for value in range(5):
+            enqueue("test_record", {"value": value})
+        enqueue("test_fail", max_attempts=1)
+        output = io.StringIO()
+        with self.assertLogs("mods.jobs", "ERROR"):
+            call_command("run_worker", "--threads", "2", "--once", stdout=output)
+        self.assertEqual(sorted(_job_calls), list(range(5)))
+        self.assertIn("running 6 jobs, 1 failed", output.getvalue())
+        self.assertEqual(list(Job.objects.values_list("status", flat=True)), [Job.STATUS_DEAD])
+
+
+def _zip_bytes(files, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+class ManifestTests(TestCase):
+    def test_reads_penumbra_modpacks(self):
+        archive = _zip_bytes(
+            {
+                "meta.json": json.dumps({"Name": "Mod"}),
+                "default_mod.json": json.dumps({"Files": {"chara/equipment/e0001/model.mdl": "model.mdl"}}),
+                "group_001_colors.json": json.dumps(
+                    {
+                        "Options": [
+                            {"Files": {"Chara\\Equipment\\e0001\\texture.tex": "a.tex"}},
+                            {"FileSwaps": {"vfx/effect.avfx": "vfx/other.avfx"}, "Files": {"readme.txt": "x"}},
+                        ]
+                    }
+                ),
+            }
+        )
+        self.assertEqual(
+            read_game_paths(io.BytesIO(archive)),
+            ["chara/equipment/e0001/model.mdl", "chara/equipment/e0001/texture.tex", "vfx/effect.avfx"],
+        )
+
+    def test_reads_textools_modpacks(self):
+        ttmp2 = {
+            "SimpleModsList": [{"FullPath": "chara/human/c0101/obj/hair/h0001/model.mdl"}],
+            "ModPackPages": [{"ModGroups": [{"OptionList": [{"ModsJsons": [{"FullPath": "ui/icon/000000.tex"}]}]}]}],
+        }
+        self.assertEqual(
+            read_game_paths(io.BytesIO(_zip_bytes({"TTMPL.mpl": json.dumps(ttmp2), "TTMPD.mpd": b"data"}))),
+            ["chara/human/c0101/obj/hair/h0001/model.mdl", "ui/icon/000000.tex"],
+        )
+        # The original format has one JSON object per line
+        ttmp = "\n".join(json.dumps({"FullPath": path}) for path in ["bg/a.tex", "bg/b.tex"])
+        self.assertEqual(read_game_paths(io.BytesIO(_zip_bytes({"TTMPL.mpl": ttmp}))), ["bg/a.tex", "bg/b.tex"])
+
+    def test_reads_plain_and_nested_archives(self):
+        plain = _zip_bytes({"My Mod/chara/weapon/w0101/model.mdl": b"", "My Mod/readme.txt": b"", "preview.png": b""})
+        self.assertEqual(read_game_paths(io.BytesIO(plain)), ["chara/weapon/w0101/model.mdl"])
+
+        pmp = _zip_bytes({"default_mod.json": json.dumps({"Files": {"ui/uld/a.uld": "a.uld"}})})
+        self.assertEqual(read_game_paths(io.BytesIO(_zip_bytes({"mod/My Mod.pmp": pmp}))), ["ui/uld/a.uld"])
+
+        # Nested modpacks are checked against the limits before they're decompressed
+        bomb = _zip_bytes(
+            {"mod/My Mod.pmp": _zip_bytes({"chara/a.tex": b"\0" * (4 * 1024 * 1024)}, zipfile.ZIP_STORED)}
+        )
+        with self.assertRaisesMessage(ManifestError, "compressed more than"):
+            read_game_paths(io.BytesIO(bomb))
+        with self.assertRaisesMessage(ManifestError, "expands to more than"):
+            read_game_paths(io.BytesIO(_zip_bytes({"mod/My Mod.pmp": pmp})), max_nested_size=len(pmp) - 1)
+
+        with self.assertRaises(ManifestError):
+            read_game_paths(io.BytesIO(b"not a zip"))
+        with self.assertRaises(ManifestError):
+            read_game_paths(io.BytesIO(_zip_bytes({"default_mod.json": "{"})))
+
+    def test_plain_archives_are_read_from_their_central_directory(self):
+        content = random.Random(0).randbytes(2 * 1024 * 1024)
+        archive = _zip_bytes({"chara/a.tex": content, "chara/b.tex": content}, zipfile.ZIP_STORED)
+        reads = []
+
+        def read_range(start, end):
+            end += 1
+            reads.append(end - start)
+            return archive[start:end]
+
+        file = io.BufferedReader(RangedFile(len(archive), read_range), buffer_size=64 * 1024)
+        self.assertEqual(read_game_paths(file), ["chara/a.tex", "chara/b.tex"])
+        self.assertLess(sum(reads), 256 * 1024)
+
+
+@override_settings(ARCHIVE_VALIDATION_PROCESSES=0)
+class ModConflictTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        self.category = Category.objects.create(name="Test Category")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def _mod(self, archive, approved=True):
+        return Mod.objects.create(
+            title="Test Mod",
+            short_desc="Short description",
+            description="Description",
+            file_size=len(archive),
+            user=self.user,
+            approved=approved,
+            file=SimpleUploadedFile("mod.zip", archive, content_type="application/zip"),
+            category=self.category,
+        )
+
+    def test_uploads_are_indexed_and_conflicts_grouped(self):
+        first = self._mod(_zip_bytes({"chara/a.tex": b"", "chara/b.tex": b"", "chara/c.tex": b""}))
+        second = self._mod(_zip_bytes({"chara/a.tex": b"", "chara/b.tex": b""}))
+        third = self._mod(_zip_bytes({"chara/c.tex": b"", "ui/d.tex": b""}))
+        unrelated = self._mod(_zip_bytes({"ui/e.tex": b""}))
+        broken = self._mod(b"not a zip")
+        run_pending()
+        self.assertEqual(ModManifest.objects.get(mod=first).path_count, 3)
+        self.assertTrue(ModManifest.objects.get(mod=broken).error)
+
+        missing = uuid.uuid4()
+        mods = [first, second, third, unrelated, broken]
+        response = self.client.post(
+            reverse("conflicts"), {"uuids": [str(mod.uuid) for mod in mods] + [str(missing)]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json()["conflicts"],
+            [
+                {"mods": [str(first.uuid), str(second.uuid)], "paths": ["chara/a.tex", "chara/b.tex"]},
+                {"mods": [str(first.uuid), str(third.uuid)], "paths": ["chara/c.tex"]},
+            ],
+        )
+        self.assertEqual(response.json()["unindexed"], [str(broken.uuid)])
+        self.assertEqual(response.json()["missing"], [str(missing)])
+
+    def test_only_validated_archives_are_indexed(self):
+        with mock.patch("mods.tasks.read_game_paths") as read:
+            mod = self._mod(_zip_bytes({"../chara/a.tex": b""}))
+            run_pending()
+        read.assert_not_called()
+        self.assertIn("outside the mod's folder", ModManifest.objects.get(mod=mod).error)
+
+    def test_new_uploads_are_indexed_again(self):
+        mod = self._mod(_zip_bytes({"chara/a.tex": b""}))
+        other = self._mod(_zip_bytes({"chara/b.tex": b""}))
+        run_pending()
+        self.assertEqual(find_conflicts([mod.id, other.id]), [])
+
+        mod.file = SimpleUploadedFile("mod.zip", _zip_bytes({"chara/b.tex": b""}))
+        mod.save()
+        response = self.client.post(reverse("conflicts"), {"uuids": [str(mod.uuid), str(other.uuid)]}, format="json")
+        # Until the worker gets to it, the stale index isn't reported as current
+        self.assertEqual(response.json()["unindexed"], [str(mod.uuid)])
+
+        run_pending()
+        self.assertEqual(find_conflicts([mod.id, other.id]), [([mod.id, other.id], ["chara/b.tex"])])
+
+
+@override_settings(ARCHIVE_VALIDATION_PROCESSES=0)
+class ArchiveValidationTests(TestCase):
+    LIMITS = (20000, 4 * 1024 * 1024 * 1024, 200)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _validate(self, content, limits=LIMITS):
+        path = os.path.join(self.directory, "mod.zip")
+        with open(path, "wb") as file:
+            file.write(content)
+        return validate_archive(path, "mod.zip", limits)
+
+    def test_valid_archives_are_hashed(self):
+        content = _zip_bytes({"chara/a.tex": b"a" * 1000, "readme.txt": b"hello"})
+        result = self._validate(content)
+        self.assertEqual(result["error"], "")
+        self.assertEqual(result["size"], len(content))
+        self.assertEqual(result["sha256"], hashlib.sha256(content).hexdigest())
+        self.assertEqual(result["crc32"], zlib.crc32(content))
+        self.assertEqual((result["entry_count"], result["uncompressed_size"]), (2, 1005))
+
+    def test_corrupt_and_truncated_archives_fail(self):
+        content = _zip_bytes({"chara/a.tex": b"abcdefgh" * 100}, zipfile.ZIP_STORED)
+        corrupt = content.replace(b"abcdefgh", b"abcdefgX", 1)
+        self.assertIn("CRC", self._validate(corrupt)["error"])
+        self.assertIn("corrupt", self._validate(content[: len(content) // 2])["error"])
+        self.assertIn("corrupt", self._validate(b"not a zip")["error"])
+
+    def test_decompression_bombs_and_unsafe_paths_fail(self):
+        self.assertIn("compressed more than", self._validate(_zip_bytes({"bomb.bin": bytes(8 * 1024 * 1024)}))["error"])
+        self.assertIn("more than 1 entries", self._validate(_zip_bytes({"a": b"", "b": b""}), (1, 100, 200))["error"])
+        self.assertIn("expands to more", self._validate(_zip_bytes({"a": b"x" * 200}), (10, 100, 200))["error"])
+        self.assertIn("outside", self._validate(_zip_bytes({"../../evil.dll": b""}))["error"])
+
+    def test_upload_is_validated_by_a_job_and_gates_approval(self):
+        user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        content = _zip_bytes({"chara/a.tex": b"a" * 1000})
+        with override_settings(MEDIA_ROOT=self.directory):
+            mod = Mod.objects.create(
+                title="Test Mod",
+                short_desc="Short description",
+                description="Description",
+                file_size=999999,
+                user=user,
+                file=SimpleUploadedFile("mod.zip", content),
+                category=Category.objects.create(name="Test Category"),
+            )
+            broken = Mod.objects.create(
+                title="Broken Mod",
+                short_desc="Short description",
+                description="Description",
+                file_size=1000,
+                user=user,
+                file=SimpleUploadedFile("broken.zip", content[:-10]),
+                category=mod.category,
+            )
+            run_pending()
+
+        archive = ModArchive.objects.get(mod=mod)
+        self.assertEqual(archive.status, ModArchive.STATUS_VALID)
+        self.assertEqual(archive.sha256, hashlib.sha256(content).hexdigest())
+        # The stored size replaces the one the uploader claimed
+        mod.refresh_from_db()
+        self.assertEqual(mod.file_size, len(content))
+        self.assertEqual(ModArchive.objects.get(mod=broken).status, ModArchive.STATUS_INVALID)
+
+        model_admin = ModAdmin(Mod, admin.site)
+        with mock.patch.object(model_admin, "message_user") as message_user:
+            model_admin.approve_mods(None, Mod.objects.filter(pk__in=[mod.pk, broken.pk]))
+        self.assertIn("Skipped 1 mod", message_user.call_args.args[1])
+        self.assertEqual(list(Mod.objects.filter(approved=True)), [mod])
+
+    @override_settings(ARCHIVE_VALIDATION_PROCESSES=1)
+    def test_validates_on_a_process_pool(self):
+        content = _zip_bytes({"chara/a.tex": b"a" * 1000})
+        with override_settings(MEDIA_ROOT=self.directory):
+            field_file = Mod._meta.get_field("file").storage.save("mod.zip", io.BytesIO(content))
+            result = validate_stored_file(Mod(file=field_file).file)
+        self.assertEqual((result["error"], result["sha256"]), ("", hashlib.sha256(content).hexdigest()))
+
+
+@override_settings(ARCHIVE_VALIDATION_PROCESSES=0)
+class ModpackDownloadTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        self.category = Category.objects.create(name="Test Category")
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.contents = [_zip_bytes({"chara/a.tex": os.urandom(5000)}), _zip_bytes({"ui/b.tex": b"b" * 3000})]
+        self.mods = [
+            Mod.objects.create(
+                title=f"Test Mod {index}",
+                short_desc="Short description",
+                description="Description",
+                file_size=len(content),
+                user=self.user,
+                approved=True,
+                file=SimpleUploadedFile("mod.pmp", content),
+                category=self.category,
+            )
+            for index, content in enumerate(self.contents)
+        ]
+        run_pending()
+        self.url = reverse("modpack") + "?uuids=" + ",".join(str(mod.uuid) for mod in self.mods)
+
+    def test_streams_stored_zip_of_mod_files(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = b"".join(response.streaming_content)
+        self.assertEqual(int(response["Content-Length"]), len(body))
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertIsNone(archive.testzip())
+            entries = archive.infolist()
+            self.assertEqual(
+                [info.filename for info in entries],
+                [f"Test_Mod_{index}-{mod.uuid}.pmp" for index, mod in enumerate(self.mods)],
+            )
+            self.assertEqual({info.compress_type for info in entries}, {zipfile.ZIP_STORED})
+            self.assertEqual([archive.read(info) for info in entries], self.contents)
+
+        self.assertEqual(Download.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(list(Mod.objects.order_by("id").values_list("downloads", flat=True)), [1, 1])
+
+    def test_range_requests_resume_without_counting_again(self):
+        body = b"".join(self.client.get(self.url).streaming_content)
+        etag = self.client.head(self.url)["ETag"]
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response["Content-Range"], f"bytes 100-{len(body) - 1}/{len(body)}")
+        self.assertEqual(b"".join(response.streaming_content), body[100:])
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), body[-10:])
+        self.assertEqual(Download.objects.count(), 2)
+
+        # A stale validator gets the whole file again
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(body)}-")
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response["Content-Range"], f"bytes */{len(body)}")
+
+    def test_refuses_mods_without_a_validated_archive(self):
+        pending = Mod.objects.create(
+            title="Pending Mod",
+            short_desc="Short description",
+            description="Description",
+            file_size=1000,
+            user=self.user,
+            approved=True,
+            file=SimpleUploadedFile("mod.zip", b"not validated yet"),
+            category=self.category,
+        )
+        missing = uuid.uuid4()
+        response = self.client.get(reverse("modpack") + f"?uuids={self.mods[0].uuid},{pending.uuid},{missing}")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"missing": [str(missing)], "unvalidated": [str(pending.uuid)]})
+        self.assertEqual(Download.objects.count(), 0)
+
+    def test_large_offsets_use_zip64(self):
+        storage = Mod._meta.get_field("file").storage
+        entries = [
+            ModpackEntry(f"{index}.pmp", storage, mod.file.name, len(content), zlib.crc32(content), mod.updated_date)
+            for index, (mod, content) in enumerate(zip(self.mods, self.contents))
+        ]
+        with mock.patch("mods.modpack.ZIP64_LIMIT", 1000):
+            modpack = Modpack(entries)
+        body = b"".join(modpack.iter_range())
+        self.assertEqual(len(body), modpack.size)
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            self.assertEqual([archive.read(name) for name in ("0.pmp", "1.pmp")], self.contents)
+            self.assertGreater(archive.getinfo("1.pmp").header_offset, 1000)
+
+
+@override_settings(ARCHIVE_VALIDATION_PROCESSES=0)
+class ModFileDeltaTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.texture = os.urandom(200000)
+        self.old = _zip_bytes({"chara/a.tex": self.texture, "chara/b.tex": os.urandom(100000)}, zipfile.ZIP_STORED)
+        self.mod = Mod.objects.create(
+            title="Test Mod",
+            short_desc="Short description",
+            description="Description",
+            file_size=len(self.old),
+            user=self.user,
+            approved=True,
+            file=SimpleUploadedFile("mod.pmp", self.old),
+            category=Category.objects.create(name="Test Category"),
+        )
+        run_pending()
+
+    def _upload(self, content, version):
+        self.mod.file = SimpleUploadedFile("mod.pmp", content)
+        self.mod.version = version
+        self.mod.save()
+        run_pending()
+
+    def _download(self, **params):
+        response = self.client.get(reverse("download", kwargs={"uuid": self.mod.uuid}), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, b"".join(response.streaming_content)
+
+    def test_only_validated_files_are_downloaded(self):
+        url = reverse("download", kwargs={"uuid": self.mod.uuid})
+        self.mod.file = SimpleUploadedFile("mod.pmp", _zip_bytes({"chara/a.tex": self.texture}, zipfile.ZIP_STORED))
+        self.mod.version = "1.1.0"
+        self.mod.save()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        run_pending()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+    def test_reuploads_under_the_same_name_are_validated_again(self):
+        name = self.mod.file.name
+        with mock.patch.object(Mod._meta.get_field("file").storage, "_allow_overwrite", True):
+            self.mod.file = SimpleUploadedFile(os.path.basename(name), b"not a zip")
+            self.mod.save()
+        self.assertEqual(self.mod.file.name, name)
+        self.assertFalse(ModArchive.objects.filter(mod=self.mod).exists())
+        run_pending()
+        self.assertEqual(ModArchive.objects.get(mod=self.mod).status, ModArchive.STATUS_INVALID)
+        response = self.client.get(reverse("download", kwargs={"uuid": self.mod.uuid}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_write_and_apply_delta(self):
+        source = os.urandom(100000)
+        target = source[:30000] + b"inserted" + source[30000:70000] + source[70500:]
+        sha256 = (hashlib.sha256(source).hexdigest(), hashlib.sha256(target).hexdigest())
+        delta = io.BytesIO()
+        size = write_delta(io.BytesIO(source), io.BytesIO(target), delta, 1024, len(target), *sha256, len(target))
+        self.assertLess(size, 3000)
+
+        rebuilt = io.BytesIO()
+        apply_delta(io.BytesIO(source), io.BytesIO(delta.getvalue()), rebuilt)
+        self.assertEqual(rebuilt.getvalue(), target)
+        with self.assertRaises(DeltaError):
+            apply_delta(io.BytesIO(source[::-1]), io.BytesIO(delta.getvalue()), io.BytesIO())
+        self.assertEqual(block_size_for(len(target), 1024), 1024)
+        self.assertEqual(block_size_for(1024**3, 1024), 32 * 1024)
+        self.assertEqual(block_size_for(1024**4, 1024), 128 * 1024)
+        # Giving up once the delta is too large to be worth it
+        self.assertIsNone(
+            write_delta(io.BytesIO(source), io.BytesIO(os.urandom(100000)), io.BytesIO(), 1024, 80000, *sha256, 1)
+        )
+
+    def test_clients_on_the_previous_version_get_a_delta(self):
+        new = _zip_bytes(
+            {"chara/a.tex": self.texture[:1000] + b"changed" + self.texture[1007:], "chara/b.tex": os.urandom(100000)},
+            zipfile.ZIP_STORED,
+        )
+        self._upload(new, "1.1.0")
+        self.assertEqual(list(ModFileVersion.objects.values_list("version", flat=True)), ["1.0.0", "1.1.0"])
+        delta = ModFileDelta.objects.get()
+        self.assertEqual(delta.status, ModFileDelta.STATUS_READY)
+
+        response, body = self._download(from_version="1.0.0")
+        self.assertEqual(response["X-Delta-From-Version"], "1.0.0")
+        self.assertEqual(response["X-Mod-Version"], "1.1.0")
+        self.assertLess(len(body), len(new) // 2)
+        rebuilt = io.BytesIO()
+        apply_delta(io.BytesIO(self.old), io.BytesIO(body), rebuilt)
+        self.assertEqual(rebuilt.getvalue(), new)
+
+        # Versions without a delta to the current file get all of it
+        for params in ({}, {"from_version": "0.9.0"}):
+            response, body = self._download(**params)
+            self.assertNotIn("X-Delta-From-Version", response)
+            self.assertEqual(body, new)
+        self.assertEqual(Download.objects.count(), 3)
+        self.mod.refresh_from_db()
+        self.assertEqual(self.mod.downloads, 3)
+
+    def test_deltas_that_are_not_smaller_are_skipped(self):
+        new = _zip_bytes({"chara/a.tex": os.urandom(300000)}, zipfile.ZIP_STORED)
+        self._upload(new, "2.0.0")
+        self.assertEqual(ModFileDelta.objects.get().status, ModFileDelta.STATUS_SKIPPED)
+
+        response, body = self._download(from_version="1.0.0")
+        self.assertNotIn("X-Delta-From-Version", response)
+        self.assertEqual(body, new)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        registry.reset()
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        self.category = Category.objects.create(name="Test Category")
+        for index in range(20):
+            Mod.objects.create(
+                title=f"Test Mod {index}",
+                short_desc="Short description",
+                description="A fairly long and repetitive description. " * 10,
+                file_size=1000000,
+                user=self.user,
+                approved=True,
+                file="path/to/file.zip",
+                category=self.category,
+            )
+
+    def _counter(self, name, **labels):
+        counters = {(counter, tuple(map(tuple, key))): value for counter, key, value in registry.snapshot()["counters"]}
+        return counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def test_list_pages_are_cached_with_compressed_variants(self):
+        identity = self.client.get(reverse("list"))
+        self.assertNotIn("Content-Encoding", identity)
+        self.assertIn("Accept-Encoding", identity["Vary"])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("list"), HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), identity.content)
+        self.assertLess(len(response.content), len(identity.content) // 4)
+
+        self.assertEqual(self._counter("cache_requests_total", cache="response", result="hit"), 1)
+        self.assertEqual(
+            self._counter("compressed_response_bytes_saved_total", encoding="gzip"),
+            len(identity.content) - len(response.content),
+        )
+
+    def test_changes_to_mods_replace_cached_pages(self):
+        self.client.get(reverse("list"))
+        mod = Mod.objects.first()
+        Comment.objects.create(mod=mod, user=self.user, text="New comment")
+        response = self.client.get(reverse("list"))
+        self.assertIn("New comment", response.content.decode())
+
+        mod.approved = False
+        mod.save()
+        self.assertNotIn(str(mod.uuid), self.client.get(reverse("list")).content.decode())
+
+    def test_downloads_do_not_replace_cached_pages_each_time(self):
+        self.client.get(reverse("list"))
+        catalog_version = get_catalog_version()
+        mod = Mod.objects.first()
+        # The first download after a quiet spell shows up on the next fill
+        Download.objects.create(mod=mod, user=self.user)
+        self.assertEqual(get_catalog_version(), catalog_version)
+        self.client.get(reverse("list"))
+        with self.assertNumQueries(0):
+            self.client.get(reverse("list"))
+
+        # Later ones wait for the activity interval, or for pages to expire
+        Comment.objects.create(mod=mod, user=self.user, text="New comment")
+        with self.assertNumQueries(0):
+            self.client.get(reverse("list"))
+        cache.delete(_ACTIVITY_THROTTLE_KEY)
+        Comment.objects.create(mod=mod, user=self.user, text="Another comment")
+        self.assertIn("Another comment", self.client.get(reverse("list")).content.decode())
+
+    def test_large_bodies_are_not_cached(self):
+        with mock.patch("mods.response_cache.RESPONSE_CACHE_MAX_SIZE", 100):
+            self.client.get(reverse("list"))
+            self.client.get(reverse("list"))
+        self.assertEqual(self._counter("cache_requests_total", cache="response", result="miss"), 2)
+
+    def test_process_local_cache_is_warned_about(self):
+        with override_settings(DEBUG=False), self.assertLogs("mods.cache", "WARNING"):
+            warn_if_cache_is_not_shared()
+        with override_settings(DEBUG=True), self.assertNoLogs("mods.cache", "WARNING"):
+            warn_if_cache_is_not_shared()
+
+    def test_best_accepted_encoding_is_sent(self):
+        with mock.patch.dict("mods.response_cache._COMPRESSORS", {"br": lambda body: b"brotli"}):
+            response = self.client.get(reverse("list"), HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual((response["Content-Encoding"], response.content), ("br", b"brotli"))
+
+        available = {"identity", "gzip", "br"}
+        self.assertEqual(negotiate_encoding("", available), "identity")
+        self.assertEqual(negotiate_encoding("gzip;q=1.0, br;q=0.5", available), "gzip")
+        self.assertEqual(negotiate_encoding("br;q=0, *", available), "gzip")
+        self.assertEqual(negotiate_encoding("gzip", {"identity"}), "identity")
+        self.assertEqual(negotiate_encoding("identity;q=0, gzip", available), "gzip")
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root, CATALOG_SNAPSHOT_PAGE_SIZE=2)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create_user(username="testuser", email="test@example.com", password="testpassword")
+        self.first, self.second = Category.objects.create(name="First"), Category.objects.create(name="Second")
+        self.race = Race.objects.create(name="Hyur")
+        self.mods = [self._mod(self.first) for _ in range(3)] + [self._mod(self.second)]
+        ModCompatibility.objects.create(mod=self.mods[3], race=self.race)
+
+    def _mod(self, category):
+        return Mod.objects.create(
+            title="Test Mod",
+            short_desc="Short description",
+            description="Description",
+            file_size=1000000,
+            user=self.user,
+            approved=True,
+            file="path/to/file.zip",
+            category=category,
+        )
+
+    def _read(self, name):
+        with default_storage.open(f"catalog/{name}") as file:
+            return json.loads(file.read())
+
+    def _shard_uuids(self, name):
+        pages = [
+            self._read("/".join(page["url"].split("/")[-3:]))
+            for page in self._read("index.json")["shards"][name]["pages"]
+        ]
+        return [mod["uuid"] for page in pages for mod in page["mods"]]
+
+    def test_publishes_index_and_precompressed_pages(self):
+        with mock.patch("mods.response_cache.MIN_COMPRESSED_SIZE", 0):
+            publish_catalog_snapshot()
+        index = self._read("index.json")
+        first, second = f"categories/{self.first.id}", f"categories/{self.second.id}"
+        self.assertEqual(
+            sorted(index["shards"]), [first, second, f"races/{self.race.id}", "top/downloads", "top/recent"]
+        )
+        self.assertEqual(index["shards"][first]["count"], 3)
+        self.assertEqual([page["count"] for page in index["shards"][first]["pages"]], [2, 1])
+        self.assertEqual(self._shard_uuids(first), [str(mod.uuid) for mod in reversed(self.mods[:3])])
+        self.assertEqual(self._shard_uuids(f"races/{self.race.id}"), [str(self.mods[3].uuid)])
+
+        page = CatalogShard.objects.get(name=first).pages[0]["file"]
+        with default_storage.open(page) as file, default_storage.open(page + ".gz") as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()), file.read())
+
+    def test_only_affected_shards_are_rebuilt(self):
+        publish_catalog_snapshot()
+        first, second = f"categories/{self.first.id}", f"categories/{self.second.id}"
+        old_pages = CatalogShard.objects.get(name=first).pages
+
+        # A mod moving category affects the shard it left as well as the one it joined
+        self.mods[0].category = self.second
+        self.mods[0].save()
+        self.assertEqual(publish_catalog_snapshot(), [first, second, "top/downloads", "top/recent"])
+        new_pages = CatalogShard.objects.get(name=first).pages
+        self.assertEqual(self._shard_uuids(first), [str(self.mods[2].uuid), str(self.mods[1].uuid)])
+        # The unchanged page keeps its file, the one that is gone is deleted
+        self.assertEqual(new_pages, old_pages[:1])
+        self.assertFalse(default_storage.exists(old_pages[1]["file"]))
+
+        self.mods[3].approved = False
+        self.mods[3].save()
+        self.assertIn(f"races/{self.race.id}", publish_catalog_snapshot())
+        self.assertNotIn(f"races/{self.race.id}", self._read("index.json")["shards"])
+        self.assertEqual(CatalogShard.objects.get(name=first).pages, new_pages)
+
+    def test_index_is_replaced_without_being_deleted(self):
+        with mock.patch("mods.response_cache.MIN_COMPRESSED_SIZE", 0):
+            publish_catalog_snapshot()
+            self.mods[3].approved = False
+            self.mods[3].save()
+            with mock.patch.object(default_storage, "delete", wraps=default_storage.delete) as delete:
+                publish_catalog_snapshot()
+        deleted = {name for (name,), _ in delete.call_args_list}
+        self.assertTrue(deleted.isdisjoint({"catalog/index.json", "catalog/index.json.gz"}))
+        self.assertNotIn(f"races/{self.race.id}", self._read("index.json")["shards"])
+        with default_storage.open("catalog/index.json.gz") as compressed:
+            self.assertEqual(json.loads(gzip.decompress(compressed.read())), self._read("index.json"))
+        self.assertEqual([name for name in default_storage.listdir("catalog")[1] if name.endswith(".tmp")], [])
+
+    def test_changes_queue_one_debounced_publish(self):
+        # Leaves only the publish the mods created above queued
+        Job.objects.exclude(name="publish_catalog_snapshot").delete()
+        for mod in self.mods:
+            mod.save(update_fields=["title"])
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual(run_pending(), 0)
+
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(self._read("index.json")["shards"][f"categories/{self.first.id}"]["count"], 3)
+
+
+# Test data lives in the test's transaction, which a background thread's connection can't see
+@override_settings(AUTOCOMPLETE_REBUILD_IN_BACKGROUND=False)
+class AutocompleteTests(APITestCase):
+    def setUp(self):
+        autocomplete.reset()
+        self.addCleanup(autocomplete.reset)
+        self.user = User.objects.create_user(username="ironsmith", email="test@example.com", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION="Bearer " + str(RefreshToken.for_user(self.user).access_token))
+        self.category = Category.objects.create(name="Test Category")
+        self.tag = Tag.objects.create(name="Iron")
+        self.armor = self._mod("Heavy Iron-Armor", downloads=10)
+        self.sword = self._mod("Iron Sword", downloads=50)
+        self.hidden = self._mod("Iron Secret", approved=False)
+        self.armor.tags.add(self.tag)
+
+    def _mod(self, title, downloads=0, approved=True):
+        return Mod.objects.create(
+            title=title,
+            short_desc="Short description",
+            description="Description",
+            file_size=1000000,
+            downloads=downloads,
+            user=self.user,
+            approved=approved,
+            file="path/to/file.zip",
+            category=self.category,
+        )
+
+    def _titles(self, query):
+        response = self.client.get(reverse("autocomplete"), {"q": query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [mod["title"] for mod in response.json()["mods"]]
+
+    def test_suggests_approved_titles_tags_and_authors_by_popularity(self):
+        response = self.client.get(reverse("autocomplete"), {"q": "IR"})
+        self.assertEqual([mod["title"] for mod in response.json()["mods"]], ["Iron Sword", "Heavy Iron-Armor"])
+        self.assertEqual(response.json()["tags"], [{"id": self.tag.id, "name": "Iron"}])
+        self.assertEqual(response.json()["users"], [{"id": self.user.id, "username": "ironsmith"}])
+
+        # Any word starts a match, and the words after it narrow it
+        self.assertEqual(self._titles("iron arm"), ["Heavy Iron-Armor"])
+        self.assertEqual(self._titles("heavy  iron"), ["Heavy Iron-Armor"])
+        self.assertEqual(self._titles("sword iron"), [])
+        self.assertEqual(self.client.get(reverse("autocomplete"), {"q": ""}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_changes_are_applied_without_a_rebuild(self):
+        self.assertEqual(self._titles("iron s"), ["Iron Sword"])
+        self.hidden.approved = True
+        self.hidden.save()
+        self.sword.delete()
+
+        with mock.patch.object(autocomplete, "_rebuild") as rebuild:
+            self.assertEqual(self._titles("iron s"), ["Iron Secret"])
+        rebuild.assert_not_called()
+
+        self.armor.tags.remove(self.tag)
+        response = self.client.get(reverse("autocomplete"), {"q": "iron"})
+        self.assertEqual(response.json()["tags"], [])
+
+    def test_rebuilds_are_swapped_in_while_lookups_continue(self):
+        self.assertEqual(self._titles("iron s"), ["Iron Sword"])
+        autocomplete.mark_stale(rebuild=True)
+        searched = []
+
+        def rebuild_later(now):
+            # Another lookup meanwhile is served from the current indexes, without waiting on this rebuild
+            self.assertTrue(autocomplete._lock.acquire(blocking=False))
+            autocomplete._lock.release()
+            searched.append(autocomplete.search("iron s")["mods"])
+            real_rebuild(now)
+
+        real_rebuild = autocomplete._rebuild
+        with mock.patch.object(autocomplete, "_rebuild", side_effect=rebuild_later):
+            self.assertEqual(self._titles("iron s"), ["Iron Sword"])
+        self.assertEqual(searched, [[{"uuid": self.sword.uuid, "title": "Iron Sword"}]])
+
+    def test_rebuilds_after_the_first_run_in_the_background(self):
+        self.assertEqual(self._titles("iron s"), ["Iron Sword"])
+        autocomplete.mark_stale(rebuild=True)
+        started, release = threading.Event(), threading.Event()
+
+        def rebuild(now):
+            started.set()
+            release.wait(5)
+
+        with (
+            override_settings(AUTOCOMPLETE_REBUILD_IN_BACKGROUND=True),
+            mock.patch.object(autocomplete, "_rebuild", side_effect=rebuild),
+            mock.patch("mods.autocomplete.connections"),
+        ):
+            self.assertEqual(self._titles("iron s"), ["Iron Sword"])
+            self.assertTrue(started.wait(5))
+            # Lookups meanwhile neither wait nor start another rebuild
+            self.assertEqual(self._titles("iron s"), ["Iron Sword"])
+            release.set()
+            with autocomplete._refresh_lock:
+                pass
+
+    def test_changes_are_queried_outside_the_lock(self):
+        self._titles("iron")
+        self.hidden.approved = True
+        self.hidden.save()
+        real_filter = ModChange.objects.filter
+
+        def filter_changes(*args, **kwargs):
+            self.assertFalse(autocomplete._lock.locked())
+            return real_filter(*args, **kwargs)
+
+        with mock.patch.object(ModChange.objects, "filter", side_effect=filter_changes) as changes:
+            self.assertEqual(self._titles("iron s"), ["Iron Sword", "Iron Secret"])
+        changes.assert_called()
+
+    def test_only_renames_force_a_rebuild(self):
+        self.assertEqual(self._titles("iron"), ["Iron Sword", "Heavy Iron-Armor"])
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=["last_login"])
+        self.tag.save()
+        with mock.patch.object(autocomplete, "_rebuild") as rebuild:
+            self._titles("iron")
+        rebuild.assert_not_called()
+
+        self.user.username = "steelsmith"
+        self.user.save()
+        response = self.client.get(reverse("autocomplete"), {"q": "steel"})
+        self.assertEqual(response.json()["users"], [{"id": self.user.id, "username": "steelsmith"}])
+
+    def test_prefix_index(self):
+        index = PrefixIndex([(1, "Alpha Beta", 5, "a"), (2, "Alpine", 9, "b"), (3, "Beta", 1, "c")])
+        self.assertEqual(index.search("al", 10), ["b", "a"])
+        self.assertEqual(index.search("beta", 10), ["a", "c"])
+        index.set(3, "Alps", 20, "c")
+        index.remove(2)
+        self.assertEqual(index.search("al", 10), ["c", "a"])
+        self.assertEqual(index.search("beta", 10), ["a"])
+        self.assertEqual(len(index), 2)
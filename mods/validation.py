@@ -0,0 +1,131 @@
+import hashlib
+import multiprocessing
+import posixpath
+import tempfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+
+CHUNK_SIZE = 1024 * 1024
+# Small entries can compress absurdly well without being a threat, the ratio is only enforced above this size
+COMPRESSION_RATIO_MIN_SIZE = 1024 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def _hash(file, sink=None):
+    sha256 = hashlib.sha256()
+    crc32 = 0
+    size = 0
+    while chunk := file.read(CHUNK_SIZE):
+        sha256.update(chunk)
+        crc32 = zlib.crc32(chunk, crc32)
+        size += len(chunk)
+        if sink is not None:
+            sink.write(chunk)
+    return size, sha256.hexdigest(), crc32
+
+
+def _check_zip(file, max_entries, max_uncompressed_size, max_ratio):
+    """Checks the archive's structure, limits and the CRC of every entry. Returns (entry count, uncompressed size)."""
+    with zipfile.ZipFile(file) as archive:
+        entries = archive.infolist()
+        if len(entries) > max_entries:
+            raise ArchiveError(f"Archive has more than {max_entries} entries")
+        uncompressed_size = sum(info.file_size for info in entries)
+        if uncompressed_size > max_uncompressed_size:
+            raise ArchiveError(f"Archive expands to more than {max_uncompressed_size} bytes")
+
+        for info in entries:
+            name = info.filename.replace("\\", "/")
+            if name.startswith("/") or ".." in posixpath.normpath(name).split("/"):
+                raise ArchiveError(f"{info.filename} would be extracted outside the mod's folder")
+            if info.flag_bits & 0x1:
+                raise ArchiveError(f"{info.filename} is encrypted")
+            if info.file_size > COMPRESSION_RATIO_MIN_SIZE and info.file_size > info.compress_size * max_ratio:
+                raise ArchiveError(f"{info.filename} is compressed more than {max_ratio} to 1")
+            # Decompression stops at the declared size and the CRC is checked once the entry is read to the end
+            with archive.open(info) as entry:
+                while entry.read(CHUNK_SIZE):
+                    pass
+    return len(entries), uncompressed_size
+
+
+def validate_archive(path, name, limits):
+    """
+    Hashes and checks a stored archive. Local files are read where they are, anything else is streamed from storage
+    once into a temporary file. Runs in a pool process, so it only takes and returns plain values.
+    """
+    if path is not None:
+        file = open(path, "rb")
+        size, sha256, crc32 = _hash(file)
+    else:
+        from django.core.files.storage import default_storage
+
+        file = tempfile.TemporaryFile()
+        with default_storage.open(name, "rb") as remote:
+            size, sha256, crc32 = _hash(remote, file)
+
+    result = {"size": size, "sha256": sha256, "crc32": crc32, "entry_count": 0, "uncompressed_size": 0, "error": ""}
+    with file:
+        file.seek(0)
+        try:
+            result["entry_count"], result["uncompressed_size"] = _check_zip(file, *limits)
+        except ArchiveError as exc:
+            result["error"] = str(exc)
+        # RuntimeError is what zipfile raises for encrypted entries
+        except (zipfile.BadZipFile, EOFError, NotImplementedError, RuntimeError, zlib.error) as exc:
+            result["error"] = f"Archive is corrupt or unsupported: {exc}"
+    return result
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned rather than forked, since the job worker that owns the pool is multi-threaded
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.ARCHIVE_VALIDATION_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        return _pool
+
+
+def validate_stored_file(field_file):
+    """Validates a mod's stored file on the validation process pool, waiting for the result."""
+    try:
+        path = field_file.storage.path(field_file.name)
+    except NotImplementedError:
+        path = None
+    limits = (
+        settings.ARCHIVE_MAX_ENTRIES,
+        settings.ARCHIVE_MAX_UNCOMPRESSED_SIZE,
+        settings.ARCHIVE_MAX_COMPRESSION_RATIO,
+    )
+    return run_on_pool(validate_archive, path, field_file.name, limits)
+
+
+def run_on_pool(function, *args):
+    """Runs a function on the process pool and waits for its result, or runs it here when the pool is disabled."""
+    if not settings.ARCHIVE_VALIDATION_PROCESSES:
+        return function(*args)
+
+    global _pool
+    try:
+        return _executor().submit(function, *args).result()
+    except BrokenProcessPool:
+        # A pool process died, e.g. killed for running out of memory. Start a fresh pool for the job's retry.
+        with _pool_lock:
+            _pool = None
+        raise
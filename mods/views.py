@@ -1,33 +1,112 @@
+from os.path import basename
+from uuid import UUID
+
+from django.db import transaction
+from django.db.models import F
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from rest_framework import generics, status, serializers
 from rest_framework.generics import UpdateAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
-from .models import Mod, Race, Gender, Tag
-from .serializers import ModSerializer, RaceSerializer, GenderSerializer, TagSerializer, UserRegistrationSerializer
-from .permissions import IsModeratorOrAdmin, IsModeratorOrAdminOrOwner
-
-
-class ModListAPIView(generics.ListAPIView):
+from .autocomplete import autocomplete
+from .cache import cache_mod_details, get_cached_mod_details, invalidate_mod_details
+from .catalog import iter_catalog_export
+from .changes import get_changes_since, get_latest_cursor
+from .conflicts import find_conflicts
+from .models import Download, Mod, ModArchive, ModFileDelta, ModManifest, Race, Gender, Tag
+from .serializers import (
+    AutocompleteQuerySerializer,
+    ModApprovalSerializer,
+    ModBulkFetchSerializer,
+    ModChangeFeedQuerySerializer,
+    ModSerializer,
+    ModUpdateCheckSerializer,
+    RaceSerializer,
+    GenderSerializer,
+    TagSerializer,
+    UserRegistrationSerializer,
+)
+from .db import retry_on_database_locked
+from .fast_serializers import parse_fieldset, serialize_mods
+from .metrics import render_prometheus
+from .modpack import Modpack, ModpackEntry, entry_name, parse_range
+from .permissions import IsAdmin, IsModeratorOrAdmin, IsModeratorOrAdminOrOwner, OwnerScopedObjectMixin
+from .profiling import list_profiles, profile_path
+from .response_cache import CachedResponseMixin
+from .routers import ReplicaReadMixin, read_from_primary
+
+
+@retry_on_database_locked
+def _record_downloads(user, rows):
+    mod_ids = [row["id"] for row in rows]
+    with transaction.atomic():
+        Download.objects.bulk_create([Download(mod_id=mod_id, user_id=user.pk) for mod_id in mod_ids])
+        Mod.objects.filter(id__in=mod_ids).update(downloads=F("downloads") + 1)
+    # bulk_create skips the signals that keep cached details fresh
+    invalidate_mod_details([row["uuid"] for row in rows], activity=True)
+
+
+class FastModListMixin:
+    """
+    Lists mods through the values()-based fast path, which produces the same output as ModSerializer, narrowed by
+    `?fields=` and with ids expanded by `?expand=`.
+    """
+
+    def list(self, request, *args, **kwargs):
+        fields, expand = parse_fieldset(request.query_params)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize_mods(page, request, fields, expand))
+        return Response(serialize_mods(queryset, request, fields, expand))
+
+
+class ModListAPIView(CachedResponseMixin, FastModListMixin, ReplicaReadMixin, generics.ListAPIView):
     queryset = Mod.objects.filter(approved=True)
     serializer_class = ModSerializer
     lookup_field = "uuid"
 
 
-class ModDetailAPIView(generics.RetrieveAPIView):
+class ModDetailAPIView(ReplicaReadMixin, generics.RetrieveAPIView):
     queryset = Mod.objects.filter(approved=True)
     serializer_class = ModSerializer
     lookup_field = "uuid"
 
+    def retrieve(self, request, *args, **kwargs):
+        fields, expand = parse_fieldset(request.query_params)
+        mod_uuid = kwargs[self.lookup_field]
+        # Only full details are cached, a sparse fieldset is cut from them but expansions need their own lookups
+        data = None if expand else get_cached_mod_details([mod_uuid]).get(mod_uuid)
+        if data is None:
+            cacheable = fields is None and not expand
+            mods = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: mod_uuid})
+            if cacheable:
+                with read_from_primary():
+                    data = next(iter(serialize_mods(mods, request)), None)
+            else:
+                data = next(iter(serialize_mods(mods, request, fields, expand)), None)
+            if data is None:
+                raise Http404
+            if cacheable:
+                cache_mod_details({mod_uuid: data})
+        elif fields is not None:
+            data = {field: data[field] for field in fields}
+        return Response(data)
+
 
 class ModCreateAPIView(generics.CreateAPIView):
     queryset = Mod.objects.all()
     serializer_class = ModSerializer
     permission_classes = [IsAuthenticated]
 
+    @retry_on_database_locked
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
 
-class ModUpdateAPIView(generics.UpdateAPIView):
+
+class ModUpdateAPIView(OwnerScopedObjectMixin, generics.UpdateAPIView):
     queryset = Mod.objects.all()
     serializer_class = ModSerializer
     lookup_field = "uuid"
@@ -49,20 +128,30 @@ class ModUpdateAPIView(generics.UpdateAPIView):
 
         return Response(serializer.data)
 
+    @retry_on_database_locked
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+
 
-class ModDeleteAPIView(generics.DestroyAPIView):
+class ModDeleteAPIView(OwnerScopedObjectMixin, generics.DestroyAPIView):
     queryset = Mod.objects.all()
     serializer_class = ModSerializer
     lookup_field = "uuid"
     permission_classes = [IsAuthenticated, IsModeratorOrAdminOrOwner]
+    # The post-delete signal needs the uuid, related rows are collected by id
+    only_fields = ["id", "uuid", "user"]
 
+    @retry_on_database_locked
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
 
-class TagListAPIView(generics.ListAPIView):
+
+class TagListAPIView(ReplicaReadMixin, generics.ListAPIView):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class ModSearchByCategoryAPIView(generics.ListAPIView):
+class ModSearchByCategoryAPIView(CachedResponseMixin, FastModListMixin, ReplicaReadMixin, generics.ListAPIView):
     serializer_class = ModSerializer
 
     def get_queryset(self):
@@ -70,7 +159,7 @@ class ModSearchByCategoryAPIView(generics.ListAPIView):
         return Mod.objects.filter(category__id=category_id, approved=True)
 
 
-class ModSearchByTagAPIView(generics.ListAPIView):
+class ModSearchByTagAPIView(CachedResponseMixin, FastModListMixin, ReplicaReadMixin, generics.ListAPIView):
     serializer_class = ModSerializer
 
     def get_queryset(self):
@@ -81,7 +170,7 @@ class ModSearchByTagAPIView(generics.ListAPIView):
         return queryset
 
 
-class ModSearchByTitleAPIView(generics.ListAPIView):
+class ModSearchByTitleAPIView(CachedResponseMixin, FastModListMixin, ReplicaReadMixin, generics.ListAPIView):
     serializer_class = ModSerializer
 
     def get_queryset(self):
@@ -89,7 +178,7 @@ class ModSearchByTitleAPIView(generics.ListAPIView):
         return Mod.objects.filter(title__icontains=title, approved=True)
 
 
-class ModSearchByUserAPIView(generics.ListAPIView):
+class ModSearchByUserAPIView(CachedResponseMixin, FastModListMixin, ReplicaReadMixin, generics.ListAPIView):
     serializer_class = ModSerializer
 
     def get_queryset(self):
@@ -97,7 +186,7 @@ class ModSearchByUserAPIView(generics.ListAPIView):
         return Mod.objects.filter(user__id=user_id, approved=True)
 
 
-class ModSearchByRaceAPIView(generics.ListAPIView):
+class ModSearchByRaceAPIView(CachedResponseMixin, FastModListMixin, ReplicaReadMixin, generics.ListAPIView):
     serializer_class = ModSerializer
 
     def get_queryset(self):
@@ -108,7 +197,7 @@ class ModSearchByRaceAPIView(generics.ListAPIView):
         return queryset
 
 
-class ModSearchByGenderAPIView(generics.ListAPIView):
+class ModSearchByGenderAPIView(CachedResponseMixin, FastModListMixin, ReplicaReadMixin, generics.ListAPIView):
     serializer_class = ModSerializer
 
     def get_queryset(self):
@@ -119,12 +208,12 @@ class ModSearchByGenderAPIView(generics.ListAPIView):
         return queryset
 
 
-class RaceListAPIView(generics.ListAPIView):
+class RaceListAPIView(ReplicaReadMixin, generics.ListAPIView):
     queryset = Race.objects.all()
     serializer_class = RaceSerializer
 
 
-class GenderListAPIView(generics.ListAPIView):
+class GenderListAPIView(ReplicaReadMixin, generics.ListAPIView):
     queryset = Gender.objects.all()
     serializer_class = GenderSerializer
 
@@ -139,8 +228,8 @@ class UserRegistrationAPIView(APIView):
 
 
 class ModApprovalAPIView(UpdateAPIView):
-    queryset = Mod.objects.all()
-    serializer_class = ModSerializer
+    queryset = Mod.objects.only("id", "uuid", "approved")
+    serializer_class = ModApprovalSerializer
     permission_classes = [IsModeratorOrAdmin]
     lookup_field = "uuid"
 
@@ -156,4 +245,274 @@ class ModApprovalAPIView(UpdateAPIView):
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
 
-        return Response(serializer.data)
+        # Only the approval is written, but the response is still the full mod
+        return Response(serialize_mods(Mod.objects.filter(pk=instance.pk), request)[0])
+
+    @retry_on_database_locked
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+
+
+class ModCatalogExportAPIView(APIView):
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(iter_catalog_export(), content_type="application/gzip")
+        response["Content-Disposition"] = 'attachment; filename="catalog.ndjson.gz"'
+        # Clients resume from this cursor through the change feed once the export is loaded
+        response["X-Catalog-Cursor"] = get_latest_cursor()
+        return response
+
+
+class AutocompleteAPIView(ReplicaReadMixin, APIView):
+    def get(self, request, *args, **kwargs):
+        query = AutocompleteQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(autocomplete.search(query.validated_data["q"], query.validated_data["limit"]))
+
+
+class ModChangeFeedAPIView(ReplicaReadMixin, APIView):
+    def get(self, request, *args, **kwargs):
+        query = ModChangeFeedQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(get_changes_since(query.validated_data["since"], query.validated_data["limit"]))
+
+
+class ModUpdateCheckAPIView(ReplicaReadMixin, APIView):
+    def post(self, request, *args, **kwargs):
+        serializer = ModUpdateCheckSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        entries = serializer.validated_data["mods"]
+
+        current = {
+            mod_uuid: (version, updated_date)
+            for mod_uuid, version, updated_date in Mod.objects.filter(
+                uuid__in={entry["uuid"] for entry in entries}, approved=True
+            ).values_list("uuid", "version", "updated_date")
+        }
+
+        # Only report entries the client has to act on
+        results = []
+        for entry in entries:
+            if entry["uuid"] not in current:
+                results.append({"uuid": entry["uuid"], "status": "missing"})
+                continue
+
+            version, updated_date = current[entry["uuid"]]
+            outdated = ("version" in entry and entry["version"] != version) or (
+                "updated_date" in entry and updated_date is not None and updated_date > entry["updated_date"]
+            )
+            if outdated:
+                results.append(
+                    {"uuid": entry["uuid"], "status": "outdated", "version": version, "updated_date": updated_date}
+                )
+
+        return Response({"results": results})
+
+
+class ModBulkDetailAPIView(ReplicaReadMixin, APIView):
+    def post(self, request, *args, **kwargs):
+        serializer = ModBulkFetchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        uuids = list(dict.fromkeys(serializer.validated_data["uuids"]))
+
+        # Cached details skip both the queries and the serialization
+        details = get_cached_mod_details(uuids)
+        misses = [mod_uuid for mod_uuid in uuids if mod_uuid not in details]
+        unapproved = set()
+        if misses:
+            with read_from_primary():
+                mods = serialize_mods(Mod.objects.filter(uuid__in=misses, approved=True), request)
+            fetched = {UUID(mod["uuid"]): mod for mod in mods}
+            cache_mod_details(fetched)
+            details.update(fetched)
+
+            remaining = [mod_uuid for mod_uuid in misses if mod_uuid not in fetched]
+            if remaining:
+                unapproved.update(Mod.objects.filter(uuid__in=remaining).values_list("uuid", flat=True))
+
+        return Response(
+            {
+                "results": [details[mod_uuid] for mod_uuid in uuids if mod_uuid in details],
+                "missing": [mod_uuid for mod_uuid in uuids if mod_uuid not in details and mod_uuid not in unapproved],
+                "unapproved": [mod_uuid for mod_uuid in uuids if mod_uuid in unapproved],
+            }
+        )
+
+
+class ModConflictAPIView(ReplicaReadMixin, APIView):
+    def post(self, request, *args, **kwargs):
+        serializer = ModBulkFetchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        uuids = list(dict.fromkeys(serializer.validated_data["uuids"]))
+
+        mods = dict(Mod.objects.filter(uuid__in=uuids, approved=True).values_list("id", "uuid"))
+        found = set(mods.values())
+        indexed = set(
+            ModManifest.objects.filter(mod_id__in=mods, mod__file=F("file"), error="").values_list("mod_id", flat=True)
+        )
+        return Response(
+            {
+                "conflicts": [
+                    {"mods": [mods[mod_id] for mod_id in mod_ids], "paths": paths}
+                    for mod_ids, paths in find_conflicts(list(mods))
+                ],
+                # Not indexed yet, or not a readable archive
+                "unindexed": [mod_uuid for mod_id, mod_uuid in mods.items() if mod_id not in indexed],
+                "missing": [mod_uuid for mod_uuid in uuids if mod_uuid not in found],
+            }
+        )
+
+
+class ModpackDownloadAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        serializer = ModBulkFetchSerializer(
+            data={"uuids": [value for value in request.query_params.get("uuids", "").split(",") if value]}
+        )
+        serializer.is_valid(raise_exception=True)
+        uuids = list(dict.fromkeys(serializer.validated_data["uuids"]))
+
+        # Only validated archives have a known size and CRC, which the zip is laid out from
+        rows = {
+            row["uuid"]: row
+            for row in Mod.objects.filter(uuid__in=uuids, approved=True).values(
+                "id",
+                "uuid",
+                "title",
+                "file",
+                "updated_date",
+                "archive__file",
+                "archive__status",
+                "archive__size",
+                "archive__crc32",
+            )
+        }
+        unvalidated = [
+            mod_uuid
+            for mod_uuid in uuids
+            if mod_uuid in rows
+            and not (
+                rows[mod_uuid]["archive__status"] == ModArchive.STATUS_VALID
+                and rows[mod_uuid]["archive__file"] == rows[mod_uuid]["file"]
+            )
+        ]
+        missing = [mod_uuid for mod_uuid in uuids if mod_uuid not in rows]
+        if missing or unvalidated:
+            return Response({"missing": missing, "unvalidated": unvalidated}, status=status.HTTP_400_BAD_REQUEST)
+
+        storage = Mod._meta.get_field("file").storage
+        modpack = Modpack(
+            [
+                ModpackEntry(
+                    name=entry_name(row["title"], row["uuid"], row["file"]),
+                    storage=storage,
+                    file_name=row["file"],
+                    size=row["archive__size"],
+                    crc32=row["archive__crc32"],
+                    modified=row["updated_date"],
+                )
+                for row in (rows[mod_uuid] for mod_uuid in uuids)
+            ]
+        )
+
+        byte_range = None
+        # A resumed download whose modpack changed since has to start over
+        if request.headers.get("If-Range", modpack.etag) == modpack.etag:
+            try:
+                byte_range = parse_range(request.headers.get("Range"), modpack.size)
+            except ValueError:
+                response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+                response["Content-Range"] = f"bytes */{modpack.size}"
+                return response
+        start, stop = byte_range or (0, modpack.size)
+
+        if request.method == "HEAD":
+            response = HttpResponse(content_type="application/zip")
+        else:
+            response = StreamingHttpResponse(modpack.iter_range(start, stop), content_type="application/zip")
+            # Resumed downloads were already counted by the request that started them
+            if start == 0:
+                _record_downloads(request.user, [rows[mod_uuid] for mod_uuid in uuids])
+        if byte_range is not None:
+            response.status_code = status.HTTP_206_PARTIAL_CONTENT
+            response["Content-Range"] = f"bytes {start}-{stop - 1}/{modpack.size}"
+        response["Content-Length"] = stop - start
+        response["Accept-Ranges"] = "bytes"
+        response["ETag"] = modpack.etag
+        response["Content-Disposition"] = 'attachment; filename="modpack.zip"'
+        return response
+
+
+class ModFileDownloadAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, uuid, *args, **kwargs):
+        # Like modpacks, only files that passed validation are served
+        row = (
+            Mod.objects.filter(
+                uuid=uuid, approved=True, archive__status=ModArchive.STATUS_VALID, archive__file=F("file")
+            )
+            .values("id", "uuid", "file", "version")
+            .first()
+        )
+        if row is None:
+            raise Http404
+
+        # Clients that report the version they have get the delta from it when one was worth building
+        delta = None
+        from_version = request.query_params.get("from_version")
+        if from_version:
+            delta = (
+                ModFileDelta.objects.filter(
+                    target__mod_id=row["id"],
+                    target__file=row["file"],
+                    source__version=from_version,
+                    status=ModFileDelta.STATUS_READY,
+                )
+                .select_related("source", "target")
+                .order_by("-source_id")
+                .first()
+            )
+
+        storage = Mod._meta.get_field("file").storage
+        _record_downloads(request.user, [row])
+        if delta is None:
+            response = FileResponse(storage.open(row["file"], "rb"), as_attachment=True, filename=basename(row["file"]))
+        else:
+            response = FileResponse(
+                storage.open(delta.file, "rb"),
+                as_attachment=True,
+                filename=basename(delta.file),
+                content_type="application/octet-stream",
+            )
+            response["X-Delta-From-Version"] = delta.source.version
+            response["X-Delta-Source-Sha256"] = delta.source.sha256
+            response["X-Delta-Target-Sha256"] = delta.target.sha256
+        response["X-Mod-Version"] = row["version"]
+        return response
+
+
+class MetricsAPIView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class ProfileListAPIView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request):
+        return Response(list_profiles())
+
+
+class ProfileDownloadAPIView(APIView):
+    permission_classes = [IsAdmin]
+
+    def get(self, request, name):
+        path = profile_path(name)
+        if path is None:
+            raise Http404
+        return FileResponse(
+            open(path, "rb"), as_attachment=True, filename=name, content_type="application/octet-stream"
+        )